@@ -0,0 +1,432 @@
+"""Benchmark formatting and joining the example datasets in `tests`.
+
+Runs the `format` command for every dataset in the manifest (`datasets.csv`) of each
+example and then joins the datasets of each example with the `join` command. The wall
+time, peak memory, and rows of each stage are recorded with `--profile-output` (see
+`configure_dms_viz.profiling`).
+
+No structures are downloaded. Local structure files in the manifests are used as they
+are, and PDB IDs are looked up in `--structure-dir` as files named after the ID with any
+of the extensions in `pdb_utils.STRUCTURE_EXTENSIONS` (i.e. `6UDJ.cif.gz`). Datasets with
+a PDB ID that isn't in the directory are formatted without loading the structure.
+
+With `--scale`, the first dataset of each example is also formatted after making it
+larger by a factor: once with copies of every site (with new reference and sequential
+sites, mapped to the same protein sites) and once with copies of every condition.
+
+Each benchmark is run `--repeat` times and the fastest run is kept. The results can be
+written with `--output` and compared with earlier results with `--baseline`, in which
+case benchmarks and stages that are slower or use more memory than the baseline by more
+than `--tolerance` are reported and the command fails.
+
+Usage:
+
+    python benchmarks/bench_datasets.py --structure-dir structures --output baseline.json
+    python benchmarks/bench_datasets.py --structure-dir structures --baseline baseline.json
+    python benchmarks/bench_datasets.py --dataset IAV-PB1-DMS --scale 10 --scale 100
+"""
+
+import os
+import json
+import platform
+import tempfile
+import contextlib
+import click
+import pandas as pd
+from configure_dms_viz import pdb_utils
+from configure_dms_viz.profiling import Timings
+from configure_dms_viz.configure_dms_viz import format, join_command
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TESTS_DIR = os.path.join(ROOT, "tests")
+
+# The manifest columns with paths relative to the root of the repository
+PATH_COLUMNS = ["input", "sitemap", "join_data", "structure", "description"]
+
+# The colors of the format command, which are repeated for scaled up conditions
+DEFAULT_COLORS = ["#0072B2", "#CC79A7", "#4C3549", "#009E73"]
+
+# Stages that are faster than this in seconds aren't compared with the baseline
+MIN_STAGE_SECONDS = 0.05
+
+
+def find_manifests(names):
+    """Find the manifests of the example datasets, optionally only the named ones."""
+    manifests = {}
+    for name in sorted(os.listdir(TESTS_DIR)):
+        path = os.path.join(TESTS_DIR, name, "datasets.csv")
+        if os.path.isfile(path) and (not names or name in names):
+            manifests[name] = path
+    missing_names = set(names) - set(manifests)
+    if missing_names:
+        raise click.BadParameter(
+            f"There aren't manifests for {sorted(missing_names)}.",
+            param_hint="--dataset",
+        )
+    return manifests
+
+
+def read_rows(manifest):
+    """Read the datasets of a manifest with paths relative to the repository root."""
+    manifest_df = pd.read_csv(manifest, dtype=str, keep_default_na=False)
+    rows = manifest_df.to_dict(orient="records")
+    for row in rows:
+        for column in PATH_COLUMNS:
+            if not row.get(column):
+                continue
+            paths = [path.strip() for path in row[column].split(",")]
+            if all(os.path.exists(os.path.join(ROOT, path)) for path in paths):
+                row[column] = ", ".join(os.path.join(ROOT, path) for path in paths)
+    return rows
+
+
+def find_structure(structure, structure_dir):
+    """Get the path to a local structure, or None if a PDB ID isn't in the directory."""
+    if os.path.isfile(structure):
+        return structure
+    if structure_dir is None:
+        return None
+    for pdb_id in [structure, structure.upper(), structure.lower()]:
+        for extension in pdb_utils.STRUCTURE_EXTENSIONS:
+            path = os.path.join(structure_dir, pdb_id + extension)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def read_str_csv(path):
+    """Read a csv file with every value as it's written in the file."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def get_site_column(df):
+    """Get the name of the reference site column of input or join data."""
+    return "reference_site" if "reference_site" in df.columns else "site"
+
+
+def scale_sites(row, factor, directory):
+    """
+    Make a dataset with copies of every site.
+
+    Each copy gets new reference sites (i.e. '331-1') and sequential sites that follow
+    the last site of the previous copy, and is mapped to the same protein sites. The
+    join data is copied the same way.
+    """
+    input_df = read_str_csv(row["input"])
+    site_col = get_site_column(input_df)
+
+    if row.get("sitemap"):
+        sitemap_df = read_str_csv(row["sitemap"])
+    else:
+        sites = input_df[site_col].unique()
+        sitemap_df = pd.DataFrame(
+            {
+                "reference_site": sites,
+                "sequential_site": [str(i) for i in range(1, len(sites) + 1)],
+            }
+        )
+    if "protein_site" not in sitemap_df.columns:
+        sitemap_df["protein_site"] = sitemap_df["reference_site"]
+    sequential_sites = pd.to_numeric(sitemap_df["sequential_site"])
+    span = sequential_sites.max()
+
+    def copy_sites(df, column, i):
+        df = df.copy()
+        df[column] = df[column] + f"-{i}" if i else df[column]
+        return df
+
+    scaled_row = dict(row, name=f"{row['name']} (sites x{factor})")
+    scaled_row["input"] = os.path.join(directory, "input.csv")
+    pd.concat([copy_sites(input_df, site_col, i) for i in range(factor)]).to_csv(
+        scaled_row["input"], index=False
+    )
+    sitemap_copies = []
+    for i in range(factor):
+        copy_df = copy_sites(sitemap_df, "reference_site", i)
+        copy_df["sequential_site"] = sequential_sites + i * span
+        sitemap_copies.append(copy_df)
+    scaled_row["sitemap"] = os.path.join(directory, "sitemap.csv")
+    pd.concat(sitemap_copies).to_csv(scaled_row["sitemap"], index=False)
+
+    if row.get("join_data"):
+        join_paths = []
+        for j, path in enumerate(row["join_data"].split(",")):
+            join_df = read_str_csv(path.strip())
+            join_site_col = get_site_column(join_df)
+            join_paths.append(os.path.join(directory, f"join_{j}.csv"))
+            pd.concat(
+                [copy_sites(join_df, join_site_col, i) for i in range(factor)]
+            ).to_csv(join_paths[-1], index=False)
+        scaled_row["join_data"] = ", ".join(join_paths)
+
+    return scaled_row
+
+
+def scale_conditions(row, factor, directory):
+    """
+    Make a dataset with copies of every condition.
+
+    Datasets without conditions get a condition column, so the scaled dataset has as
+    many conditions as the factor. The colors are repeated for the new conditions.
+    """
+    input_df = read_str_csv(row["input"])
+    condition_col = row.get("condition") or "condition"
+    if not row.get("condition"):
+        input_df[condition_col] = "condition"
+
+    copies = []
+    for i in range(factor):
+        copy_df = input_df.copy()
+        if i:
+            copy_df[condition_col] = copy_df[condition_col] + f" {i}"
+        copies.append(copy_df)
+    scaled_df = pd.concat(copies)
+
+    scaled_row = dict(row, name=f"{row['name']} (conditions x{factor})")
+    scaled_row["input"] = os.path.join(directory, "input.csv")
+    scaled_row["condition"] = condition_col
+    scaled_df.to_csv(scaled_row["input"], index=False)
+
+    colors = row.get("colors") or ",".join(DEFAULT_COLORS)
+    colors = [color.strip() for color in colors.split(",")]
+    num_conditions = scaled_df[condition_col].nunique()
+    scaled_row["colors"] = ",".join(
+        colors[i % len(colors)] for i in range(num_conditions)
+    )
+
+    return scaled_row
+
+
+def run_format(row, structure_dir, output_dir):
+    """Format a dataset and get its benchmark record and the path to its output."""
+    structure = find_structure(row["structure"], structure_dir)
+    args = []
+    for key, value in row.items():
+        if value != "" and not (key == "structure" and structure is not None):
+            args += [f"--{key.replace('_', '-')}", value]
+    if structure is None:
+        # PDB IDs that aren't local are embedded without being downloaded
+        args += ["--check-pdb", "False"]
+    else:
+        args += ["--structure", structure]
+
+    name = row["name"].replace(" ", "_").replace("/", "_")
+    output = os.path.join(output_dir, f"{name}.json")
+    profile = os.path.join(output_dir, f"{name}.profile.json")
+    args += ["--output", output, "--profile-output", profile, "--force"]
+
+    # Load the structure in every run so that the datasets are measured on their own
+    pdb_utils._load_structure.cache_clear()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        format.main(args=args, standalone_mode=False)
+
+    with open(profile) as f:
+        report = json.load(f)
+    record = {
+        "structure": structure,
+        "seconds": report["total_seconds"],
+        "peak_memory_mb": report["peak_memory_mb"],
+        "stages": report["stages"],
+    }
+    return record, output
+
+
+def run_join(outputs, output_dir):
+    """Join the outputs of a manifest and get the benchmark record and the joined output."""
+    output = os.path.join(output_dir, "joined.json")
+    timings = Timings()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with timings.activate(), timings.stage("join", rows=len(outputs)):
+            join_command.main(
+                args=["--input", ", ".join(outputs), "--output", output],
+                standalone_mode=False,
+            )
+    report = timings.to_dict()
+    record = {
+        "structure": None,
+        "seconds": report["total_seconds"],
+        "peak_memory_mb": report["peak_memory_mb"],
+        "stages": report["stages"],
+    }
+    return record, output
+
+
+def fastest(run, args, repeat):
+    """Run a benchmark several times with the given arguments and get the fastest run."""
+    results = [run(*args) for _ in range(repeat)]
+    return min(results, key=lambda result: result[0]["seconds"])
+
+
+def ratio(value, baseline_value):
+    """The ratio of a value to its baseline, or None if it can't be compared."""
+    if value is None or not baseline_value:
+        return None
+    return value / baseline_value
+
+
+def format_ratio(value):
+    """Format a ratio as a percent change."""
+    return "" if value is None else f"{(value - 1) * 100:+.0f}%"
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Print the change in time and peak memory of each benchmark since the baseline.
+
+    Returns
+    -------
+    list of str
+        The benchmarks and stages that are slower or use more memory than the baseline
+        by more than the tolerance.
+    """
+    click.echo(
+        f"\n{'benchmark':<56}{'seconds':>10}{'change':>8}{'peak MB':>10}{'change':>8}"
+    )
+    regressions = []
+    for name, record in results["benchmarks"].items():
+        baseline_record = baseline["benchmarks"].get(name)
+        if baseline_record is None:
+            click.echo(f"{name:<56}{'not in the baseline':>36}")
+            continue
+        time_ratio = ratio(record["seconds"], baseline_record["seconds"])
+        memory_ratio = ratio(
+            record["peak_memory_mb"], baseline_record["peak_memory_mb"]
+        )
+        click.echo(
+            f"{name:<56}{record['seconds']:>10.3f}{format_ratio(time_ratio):>8}"
+            f"{record['peak_memory_mb'] or 0:>10.1f}{format_ratio(memory_ratio):>8}"
+        )
+        if time_ratio is not None and time_ratio > tolerance:
+            regressions.append(f"{name}: {format_ratio(time_ratio)} time")
+        if memory_ratio is not None and memory_ratio > tolerance:
+            regressions.append(f"{name}: {format_ratio(memory_ratio)} peak memory")
+
+        # Compare the stages that ran in both, matching repeated stages in order
+        baseline_stages = {}
+        for stage in baseline_record["stages"]:
+            baseline_stages.setdefault((stage["stage"], stage["depth"]), []).append(
+                stage
+            )
+        for stage in record["stages"]:
+            matches = baseline_stages.get((stage["stage"], stage["depth"]))
+            if not matches:
+                continue
+            baseline_stage = matches.pop(0)
+            if max(stage["seconds"], baseline_stage["seconds"]) < MIN_STAGE_SECONDS:
+                continue
+            stage_ratio = ratio(stage["seconds"], baseline_stage["seconds"])
+            if stage_ratio is not None and stage_ratio > tolerance:
+                regressions.append(
+                    f"{name}, {stage['stage']}: {format_ratio(stage_ratio)} time"
+                )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--dataset",
+    "datasets",
+    multiple=True,
+    help="Only benchmark these examples (i.e. 'IAV-PB1-DMS'). Can be given more than once.",
+)
+@click.option(
+    "--structure-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="A directory of local structure files named after their PDB IDs (i.e. '6UDJ.cif.gz').",
+)
+@click.option(
+    "--scale",
+    "scales",
+    type=click.IntRange(min=2),
+    multiple=True,
+    help="Also format the first dataset of each example with this many times the sites and, separately, the conditions. Can be given more than once.",
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    help="The number of times to run each benchmark, the fastest run is kept.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the results to this JSON file, i.e. to use as a baseline later.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Compare the results to the results in this JSON file.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=1.25,
+    help="Report benchmarks and stages that take longer or use more memory than this many times the baseline.",
+)
+def main(datasets, structure_dir, scales, repeat, output, baseline, tolerance):
+    manifests = find_manifests(datasets)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": {},
+    }
+
+    click.echo(f"{'benchmark':<56}{'seconds':>10}{'peak MB':>10}  structure")
+
+    def add_result(name, record):
+        results["benchmarks"][name] = record
+        structure = (
+            "-"
+            if record["structure"] is None
+            else os.path.basename(record["structure"])
+        )
+        click.echo(
+            f"{name:<56}{record['seconds']:>10.3f}{record['peak_memory_mb'] or 0:>10.1f}  {structure}"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for manifest_name, manifest in manifests.items():
+            output_dir = os.path.join(tmp_dir, manifest_name)
+            os.makedirs(output_dir)
+            rows = read_rows(manifest)
+
+            outputs = []
+            for row in rows:
+                record, dataset_output = fastest(
+                    run_format, (row, structure_dir, output_dir), repeat
+                )
+                add_result(f"{manifest_name}/{row['name']}", record)
+                outputs.append(dataset_output)
+            record, _ = fastest(run_join, (outputs, output_dir), repeat)
+            add_result(f"{manifest_name} (join)", record)
+
+            for factor in scales:
+                for scale in [scale_sites, scale_conditions]:
+                    scale_dir = os.path.join(output_dir, f"{scale.__name__}_{factor}")
+                    os.makedirs(scale_dir)
+                    scaled_row = scale(rows[0], factor, scale_dir)
+                    record, _ = fastest(
+                        run_format, (scaled_row, structure_dir, scale_dir), repeat
+                    )
+                    add_result(f"{manifest_name}/{scaled_row['name']}", record)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"\nThe results were written to '{output}'.")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        if regressions:
+            raise click.ClickException(
+                "These benchmarks regressed since the baseline:\n  "
+                + "\n  ".join(regressions)
+            )
+
+
+if __name__ == "__main__":
+    main()
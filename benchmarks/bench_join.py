@@ -0,0 +1,111 @@
+"""Benchmark the peak memory of joining many dataset JSON files.
+
+Compares loading every file into one dictionary before writing (how `join` used to work)
+with the streaming join in `configure_dms_viz.io_utils`. Each join runs in a fresh
+process so that its peak resident set size (RSS) can be measured on its own.
+
+Usage:
+
+    python benchmarks/bench_join.py --copies 27
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import click
+
+# An example dataset to copy under different names
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "tests",
+    "IAV-PB1-DMS",
+    "output",
+    "IAV-PB1-DMS.json",
+)
+
+LEGACY_JOIN = """
+import sys, json
+combined_data = {}
+for file_path in sys.argv[2:]:
+    with open(file_path, "r") as f:
+        combined_data.update(json.load(f))
+with open(sys.argv[1], "w") as f:
+    json.dump(combined_data, f, sort_keys=True)
+"""
+
+STREAMING_JOIN = """
+import sys
+from configure_dms_viz.io_utils import join_json_files
+join_json_files(sys.argv[2:], sys.argv[1])
+"""
+
+MEASURE = """
+import resource, sys
+sys.argv = sys.argv[1:]
+exec(compile(sys.argv[0], "<join>", "exec"))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def make_inputs(directory, copies):
+    """Copy the datasets in the template file under unique names."""
+    with open(TEMPLATE, "r") as f:
+        template = json.load(f)
+    template.pop("markdown_description", None)
+    input_files = []
+    for i in range(copies):
+        path = os.path.join(directory, f"dataset_{i}.json")
+        with open(path, "w") as f:
+            json.dump(
+                {f"{name}_{i}": value for name, value in template.items()},
+                f,
+                sort_keys=True,
+            )
+        input_files.append(path)
+    return input_files
+
+
+def run_join(code, output, input_files):
+    """Run a join in a new process and return its wall time and peak RSS in megabytes."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE, code, output, *input_files],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = int(result.stdout.split()[-1])
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return elapsed, max_rss / scale
+
+
+@click.command()
+@click.option(
+    "--copies", type=int, default=27, help="The number of input files to join."
+)
+def main(copies):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_files = make_inputs(tmp_dir, copies)
+        input_size = sum(os.path.getsize(path) for path in input_files) / 1024**2
+        click.echo(f"Joining {copies} files ({input_size:.1f} MB total)")
+
+        outputs = {}
+        for label, code in [("before", LEGACY_JOIN), ("after", STREAMING_JOIN)]:
+            outputs[label] = os.path.join(tmp_dir, f"{label}.json")
+            elapsed, max_rss = run_join(code, outputs[label], input_files)
+            click.echo(f"{label:>8}: {elapsed:6.2f} s, peak RSS {max_rss:8.1f} MB")
+
+        with open(outputs["before"], "rb") as before, open(
+            outputs["after"], "rb"
+        ) as after:
+            assert before.read() == after.read(), "The joined files are not identical."
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark how joining additional data scales with the number of join files.
+
+Compares merging each join dataframe with the mutation data one after another (how
+`join_additional_data` used to work if it hadn't stopped after the first file) with
+aligning every join dataframe by mutation and merging them at once. Each join
+dataframe is a copy of the example functional effects with its columns renamed.
+
+Usage:
+
+    python benchmarks/bench_join_data.py --max-files 16
+"""
+
+import os
+import time
+import contextlib
+import click
+import pandas as pd
+from configure_dms_viz.configure_dms_viz import (
+    format_mutation_data,
+    join_additional_data,
+)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "tests", "HIV-Envelope-BF520-DMS"
+)
+INPUT = os.path.join(DATA_DIR, "input", "1-18_avg.csv")
+JOIN_DATA = os.path.join(DATA_DIR, "join-data", "functional_effects.csv")
+
+JOIN_KEYS = ["reference_site", "wildtype", "mutant"]
+
+
+def sequential_join(mut_metric_df, join_data):
+    """Merge each join dataframe with the mutation data one after another."""
+    for df in join_data:
+        if df[JOIN_KEYS].duplicated().any():
+            raise ValueError("Duplicate measurements per mutation.")
+        df = df.drop(
+            [
+                col
+                for col in df.columns
+                if col in set(mut_metric_df.columns) - set(JOIN_KEYS)
+            ],
+            axis=1,
+        )
+        mut_metric_df = mut_metric_df.merge(df, on=JOIN_KEYS, how="left")
+    return mut_metric_df
+
+
+def make_join_data(num_files):
+    """Copy the example join data with the value columns renamed for each copy."""
+    join_df = pd.read_csv(JOIN_DATA)
+    return [
+        join_df.rename(
+            columns={
+                col: f"{col}_{i}" for col in join_df.columns if col not in JOIN_KEYS
+            }
+        )
+        for i in range(num_files)
+    ]
+
+
+def best_time(func, args, repeat):
+    """The fastest time to run a function with the given arguments."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+@click.command()
+@click.option(
+    "--max-files", type=int, default=16, help="The largest number of join files."
+)
+@click.option(
+    "--repeat", type=int, default=3, help="The number of times to time each join."
+)
+def main(max_files, repeat):
+    mut_metric_df = format_mutation_data(
+        pd.read_csv(INPUT), "escape_mean", "epitope", "RKHDEQNSTYWFAILMVGPC-*"
+    )
+    click.echo(f"Joining to {len(mut_metric_df)} rows from '{INPUT}'")
+    click.echo(f"{'files':>6}{'sequential (s)':>16}{'at once (s)':>14}{'speedup':>10}")
+
+    num_files = 1
+    while num_files <= max_files:
+        join_data = make_join_data(num_files)
+        before, before_time = best_time(
+            sequential_join, (mut_metric_df, join_data), repeat
+        )
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            after, after_time = best_time(
+                join_additional_data, (mut_metric_df, join_data), repeat
+            )
+        # Both joins should give the same data
+        pd.testing.assert_frame_equal(after, before[after.columns], check_dtype=False)
+        click.echo(
+            f"{num_files:>6}{before_time:>16.3f}{after_time:>14.3f}{before_time / after_time:>9.1f}x"
+        )
+        num_files *= 2
+
+
+if __name__ == "__main__":
+    main()
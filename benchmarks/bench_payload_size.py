@@ -0,0 +1,96 @@
+"""Benchmark the size and parse time of the JSON written for the example datasets.
+
+Formats every dataset in the `tests/*/datasets.csv` manifests with the default
+records layout and with `--columnar` and reports the total file size and the time it
+takes to parse the files, which stands in for how long the browser takes to load them.
+The structures aren't checked, so no structures are downloaded.
+
+Usage:
+
+    python benchmarks/bench_payload_size.py
+"""
+
+import os
+import glob
+import json
+import time
+import tempfile
+import contextlib
+import click
+from configure_dms_viz.configure_dms_viz import format, read_manifest
+
+TESTS_DIR = os.path.join(os.path.dirname(__file__), "..", "tests")
+
+LAYOUTS = {"records": [], "columnar": ["--columnar"]}
+
+
+def format_manifest(manifest, output_dir, layout_args):
+    """Format every dataset in a manifest without checking the structures."""
+    grouped_args = read_manifest(manifest, output_dir)
+    outputs = []
+    for datasets_args in grouped_args.values():
+        for args in datasets_args:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                format.main(
+                    args=args + ["--check-pdb", "False"] + layout_args,
+                    standalone_mode=False,
+                )
+            outputs.append(args[args.index("--output") + 1])
+    return outputs
+
+
+def parse_time(paths, repeat=3):
+    """The fastest time to parse all of the files."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            with open(path, "r") as f:
+                json.load(f)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@click.command()
+@click.option(
+    "--manifest",
+    "manifests",
+    type=click.Path(exists=True),
+    multiple=True,
+    help="The manifests to format, by default all of the example datasets.",
+)
+def main(manifests):
+    if not manifests:
+        manifests = sorted(glob.glob(os.path.join(TESTS_DIR, "*", "datasets.csv")))
+
+    # Paths in the manifests are relative to the root of the repository
+    os.chdir(os.path.join(TESTS_DIR, ".."))
+    manifests = [os.path.relpath(os.path.abspath(m)) for m in manifests]
+
+    click.echo(
+        f"{'dataset':<24}{'records (MB)':>14}{'columnar (MB)':>15}{'reduction':>11}{'parse speedup':>15}"
+    )
+    totals = {layout: 0 for layout in LAYOUTS}
+    for manifest in manifests:
+        sizes = {}
+        parse_times = {}
+        for layout, layout_args in LAYOUTS.items():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                outputs = format_manifest(manifest, tmp_dir, layout_args)
+                sizes[layout] = sum(os.path.getsize(path) for path in outputs)
+                parse_times[layout] = parse_time(outputs)
+            totals[layout] += sizes[layout]
+        name = os.path.basename(os.path.dirname(manifest))
+        click.echo(
+            f"{name:<24}{sizes['records'] / 1024**2:>14.2f}{sizes['columnar'] / 1024**2:>15.2f}"
+            f"{1 - sizes['columnar'] / sizes['records']:>11.0%}"
+            f"{parse_times['records'] / parse_times['columnar']:>14.1f}x"
+        )
+    click.echo(
+        f"{'total':<24}{totals['records'] / 1024**2:>14.2f}{totals['columnar'] / 1024**2:>15.2f}"
+        f"{1 - totals['columnar'] / totals['records']:>11.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark writing the JSON for a large dataset.
+
+Compares converting the mutation data to a list of records and dumping the whole
+dictionary (how `format` used to write its output) with streaming the dataframe
+straight to the file with `configure_dms_viz.io_utils.write_json`. Only writing
+the file is measured and every path must write an identical file.
+
+Usage:
+
+    python benchmarks/bench_serialize.py --input tests/SARS2-Mutation-Fitness/input/ORF1ab_fitness.csv
+"""
+
+import os
+import json
+import time
+import filecmp
+import functools
+import tempfile
+import tracemalloc
+import click
+import pandas as pd
+from configure_dms_viz.configure_dms_viz import make_experiment_dictionary
+from configure_dms_viz.io_utils import write_json, get_json_loads, JSON_BACKENDS
+
+DEFAULT_INPUT = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "tests",
+    "SARS2-Mutation-Fitness",
+    "input",
+    "ORF1ab_fitness.csv",
+)
+
+
+def measure(func, trace=False):
+    """Run a function and return its result, wall time, and peak traced memory in megabytes.
+
+    Tracing memory allocations slows the function down, so the memory is only measured if
+    trace is True.
+    """
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024**2
+
+
+@click.command()
+@click.option(
+    "--input", "input_csv", type=click.Path(exists=True), default=DEFAULT_INPUT
+)
+@click.option("--metric", type=str, default="fitness")
+@click.option(
+    "--repeat", type=int, default=3, help="The number of times to time each path."
+)
+def main(input_csv, metric, repeat):
+    mut_metric_df = pd.read_csv(input_csv)
+    kwargs = dict(
+        mut_metric_df=mut_metric_df,
+        metric_col=metric,
+        sitemap_df=None,
+        structure="1ABC",
+        tooltip_cols=(
+            {"expected_count": "Expected Count"}
+            if "expected_count" in mut_metric_df.columns
+            else None
+        ),
+        alphabet="RKHDEQNSTYWFAILMVGPC*",
+        check_pdb=False,
+    )
+    # Only the serialization is timed, so the dictionary is made once up front
+    experiment_dict = make_experiment_dictionary(**kwargs, as_dataframe=True)
+    mut_metric_df = experiment_dict["mut_metric_df"]
+    click.echo(f"\nWriting {len(mut_metric_df)} rows from '{input_csv}'")
+
+    def before(f):
+        records = json.loads(mut_metric_df.to_json(orient="records"))
+        json.dump(
+            {"dataset": {**experiment_dict, "mut_metric_df": records}},
+            f,
+            sort_keys=True,
+        )
+
+    def after(f, backend):
+        write_json({"dataset": experiment_dict}, f, backend)
+
+    paths = [("before", before)]
+    for backend in JSON_BACKENDS:
+        try:
+            get_json_loads(backend)
+        except ValueError:
+            continue
+        paths.append((f"after ({backend})", functools.partial(after, backend=backend)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        outputs = {}
+        for label, func in paths:
+            outputs[label] = os.path.join(tmp_dir, f"{len(outputs)}.json")
+
+            def write(func=func, path=outputs[label]):
+                with open(path, "w") as f:
+                    func(f)
+
+            elapsed = min(measure(write)[1] for _ in range(repeat))
+            _, _, peak = measure(write, trace=True)
+            click.echo(f"{label:>16}: {elapsed:6.3f} s, peak memory {peak:7.1f} MB")
+
+        # Check that every path writes an identical file
+        for label, path in outputs.items():
+            assert filecmp.cmp(
+                path, outputs["before"], shallow=False
+            ), f"The output of '{label}' is not identical."
+
+
+if __name__ == "__main__":
+    main()
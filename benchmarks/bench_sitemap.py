@@ -0,0 +1,102 @@
+"""Benchmark how formatting the sitemap scales with the number of sites.
+
+Compares the previous `format_sitemap_data`, which copied the protein sites and filled
+the chains with a Python function per row, compared the sites as Python sets, and
+converted the float columns one at a time, with the current vectorized version. The
+sitemaps are synthetic, with float sequential sites and no protein sites or chains so
+that every step runs, and a mutation dataframe with one row per site.
+
+Usage:
+
+    python benchmarks/bench_sitemap.py --max-sites 1000000
+"""
+
+import os
+import time
+import contextlib
+import click
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from configure_dms_viz.configure_dms_viz import format_sitemap_data
+
+
+def apply_format_sitemap_data(sitemap_df, mut_metric_df, included_chains):
+    """Format the sitemap the way `format_sitemap_data` used to, without the messages."""
+    # The old version changed the sitemap that was passed in
+    sitemap_df = sitemap_df.copy()
+    missing_reference_sites = set(mut_metric_df.reference_site.tolist()) - set(
+        sitemap_df.reference_site.tolist()
+    )
+    if missing_reference_sites:
+        raise ValueError("Missing reference sites.")
+    if not sitemap_df[sitemap_df["reference_site"].duplicated()].empty:
+        raise ValueError("Duplicated reference sites.")
+    if not is_numeric_dtype(sitemap_df["sequential_site"]):
+        sitemap_df["sequential_site"] = pd.to_numeric(sitemap_df["sequential_site"])
+    if "protein_site" not in sitemap_df.columns:
+        sitemap_df["protein_site"] = sitemap_df["reference_site"].apply(lambda y: y)
+    if "chains" not in sitemap_df.columns:
+        sitemap_df["chains"] = sitemap_df["protein_site"].apply(
+            lambda y: included_chains
+        )
+    sitemap_df = sitemap_df[
+        ["reference_site", "protein_site", "sequential_site", "chains"]
+    ]
+    for col in sitemap_df.columns:
+        if sitemap_df[col].dtype == "float64":
+            sitemap_df[col] = sitemap_df[col].astype(int)
+    return sitemap_df
+
+
+def make_sitemap(num_sites):
+    """Make a sitemap and a mutation dataframe with one row per site."""
+    sitemap_df = pd.DataFrame(
+        {
+            "reference_site": range(1, num_sites + 1),
+            "sequential_site": [float(site) for site in range(1, num_sites + 1)],
+        }
+    )
+    mut_metric_df = pd.DataFrame({"reference_site": sitemap_df["reference_site"]})
+    return sitemap_df, mut_metric_df
+
+
+def best_time(func, args, repeat):
+    """The fastest time to run a function with the given arguments."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+@click.command()
+@click.option(
+    "--max-sites", type=int, default=1000000, help="The largest number of sites."
+)
+@click.option(
+    "--repeat", type=int, default=3, help="The number of times to time each version."
+)
+def main(max_sites, repeat):
+    click.echo(f"{'sites':>9}{'apply (s)':>12}{'vectorized (s)':>16}{'speedup':>10}")
+
+    num_sites = 1000
+    while num_sites <= max_sites:
+        sitemap_df, mut_metric_df = make_sitemap(num_sites)
+        before, before_time = best_time(
+            apply_format_sitemap_data, (sitemap_df, mut_metric_df, "A B"), repeat
+        )
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            after, after_time = best_time(
+                format_sitemap_data, (sitemap_df, mut_metric_df, "A B"), repeat
+            )
+        # Both versions should give the same sitemap
+        pd.testing.assert_frame_equal(after, before, check_dtype=False)
+        click.echo(
+            f"{num_sites:>9}{before_time:>12.4f}{after_time:>16.4f}{before_time / after_time:>9.1f}x"
+        )
+        num_sites *= 10
+
+
+if __name__ == "__main__":
+    main()
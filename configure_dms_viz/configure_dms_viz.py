@@ -1,9 +1,35 @@
 import os
 import json
 import click
-import pandas as pd
-from pandas.api.types import is_numeric_dtype
-from .pdb_utils import get_structure, check_chains, check_wildtype_residues
+import contextlib
+import tempfile
+import concurrent.futures
+from .io_utils import (
+    join_json_files,
+    write_json,
+    encode_columnar,
+    encode_compact_sitemap,
+    open_output,
+    JSON_BACKENDS,
+    COMPRESSIONS,
+    CSV_ENGINES,
+    read_table,
+    read_table_chunks,
+    TABLE_CHUNK_SIZE,
+    get_fingerprint,
+    is_up_to_date,
+    write_fingerprint,
+    remove_fingerprint,
+)
+from .profiling import Timings, stage
+from .structure_cache import (
+    configure_cache,
+    prefetch_structures,
+    CACHE_DIR_ENV,
+    CACHE_SIZE_ENV,
+    OFFLINE_ENV,
+    DEFAULT_CACHE_SIZE,
+)
 
 
 # Check that the mutation data is in the correct format
@@ -35,15 +61,84 @@ def format_mutation_data(mut_metric_df, metric_col, condition_col, alphabet):
     """
 
     # Ensure that the site column is called 'reference_site' and rename if necessary
-    if "reference_site" not in set(mut_metric_df.columns):
-        if "site" in set(mut_metric_df.columns):
-            mut_metric_df = mut_metric_df.rename(columns={"site": "reference_site"})
-        else:
-            raise ValueError(
-                "The mutation dataframe is missing either the site or reference_site column designating reference sites."
-            )
+    site_col = check_mutation_columns(mut_metric_df.columns, metric_col, condition_col)
+    if site_col != "reference_site":
+        mut_metric_df = mut_metric_df.rename(columns={site_col: "reference_site"})
+
+    # Check that all mutant and wildtype residue names are in the provided alphabet
+    check_alphabet(
+        set(mut_metric_df["mutant"].unique()).union(mut_metric_df["wildtype"].unique()),
+        alphabet,
+    )
+
+    # Check that there is only one measurement per mutation if there isn't a condition column
+    if condition_col is None:
+        if mut_metric_df[["reference_site", "wildtype", "mutant"]].duplicated().any():
+            raise_duplicate_mutations()
+
+    # Check if there are any NaN values in the metric column
+    if mut_metric_df[metric_col].isna().any():
+        # Echo a warning to the user
+        warn_nan_metric()
+        # Drop the rows with NaN values in the metric column
+        mut_metric_df = mut_metric_df.dropna(subset=[metric_col])
+
+    # Find the sites where all mutants are the same as the first wildtype at that site.
+    # The values are compared as objects because categorical wildtype and mutant
+    # columns can have different categories.
+    first_wildtype = (
+        mut_metric_df.groupby("reference_site")
+        .head(1)
+        .set_index("reference_site")["wildtype"]
+        .astype(object)
+    )
+    is_wildtype = mut_metric_df["mutant"].astype(object) == (
+        mut_metric_df["reference_site"].astype(object).map(first_wildtype)
+    )
+    site_has_only_wildtype = (
+        is_wildtype.groupby(mut_metric_df["reference_site"])
+        .transform("all")
+        .fillna(False)
+        .astype(bool)
+    )
+
+    # Check if there are any such sites
+    if site_has_only_wildtype.any():
+        # Echo a warning to the user
+        warn_wildtype_only_sites()
+        # Drop the rows where there are no mutations
+        mut_metric_df = mut_metric_df[~site_has_only_wildtype]
+
+    return mut_metric_df
+
+
+def check_mutation_columns(columns, metric_col, condition_col):
+    """Check that the mutation data has the required columns.
+
+    Parameters
+    ----------
+    columns: list
+        The names of the columns of the mutation data.
+    metric_col: str
+        The name of the column the contains the metric for visualization.
+    condition_col: str or None
+        The name of the column the contains the condition if there are multiple measurements per mutation
+
+    Returns
+    -------
+    str
+        The name of the column with the reference sites, 'reference_site' or 'site'.
+    """
+    columns = set(columns)
+    if "reference_site" in columns:
+        site_col = "reference_site"
+    elif "site" in columns:
+        site_col = "site"
+    else:
+        raise ValueError(
+            "The mutation dataframe is missing either the site or reference_site column designating reference sites."
+        )
 
-    # Check that the rest of the necessary columns are present in the mut_metric dataframe
     required_columns = {
         "reference_site",
         "wildtype",
@@ -52,59 +147,136 @@ def format_mutation_data(mut_metric_df, metric_col, condition_col, alphabet):
     }
     if condition_col is not None:
         required_columns.add(condition_col)
-    missing_mutation_columns = required_columns - set(mut_metric_df.columns)
+    missing_mutation_columns = required_columns - (columns | {"reference_site"})
     if missing_mutation_columns:
         raise ValueError(
             f"The following columns do not exist in the mutation dataframe: {list(missing_mutation_columns)}"
         )
+    return site_col
 
-    # Check that all mutant and wildtype residue names are in the provided alphabet
-    mut_metric_alphabet = set(
-        mut_metric_df.mutant.to_list() + mut_metric_df.wildtype.to_list()
-    )
-    missing_amino_acids = mut_metric_alphabet - {aa for aa in alphabet}
+
+def check_alphabet(residues, alphabet):
+    """Check that all of the wildtype and mutant residue names are in the alphabet."""
+    missing_amino_acids = set(residues) - {aa for aa in alphabet}
     if missing_amino_acids:
         raise ValueError(
             f"Some of the wildtype or mutant amino acid names are not in the provided alphabet, i.e., {missing_amino_acids}"
         )
 
-    # Check that there is only one measurement per mutation if there isn't a condition column
-    if condition_col is None:
-        if mut_metric_df[["reference_site", "wildtype", "mutant"]].duplicated().any():
-            raise ValueError(
-                "Duplicates measurements per mutation were found in the mutation dataframe, please specify a condition column."
-            )
 
-    # Check if there are any NaN values in the metric column
-    if mut_metric_df[metric_col].isna().any():
-        # Echo a warning to the user
-        click.secho(
-            message="\nWarning: NaN values were found in the metric column. These rows will be filtered out.",
-            fg="red",
-        )
-        # Drop the rows with NaN values in the metric column
-        mut_metric_df = mut_metric_df.dropna(subset=[metric_col])
+def raise_duplicate_mutations():
+    """Raise the error for more than one measurement per mutation without a condition."""
+    raise ValueError(
+        "Duplicates measurements per mutation were found in the mutation dataframe, please specify a condition column."
+    )
+
 
-    # Group by reference_site and filter groups where all mutants are the same as wildtype
-    sites_with_only_wildtype = mut_metric_df.groupby("reference_site").filter(
-        lambda x: (x["mutant"] == x["wildtype"].iloc[0]).all()
+def warn_nan_metric():
+    """Warn that the rows with NaN values in the metric column will be filtered out."""
+    click.secho(
+        message="\nWarning: NaN values were found in the metric column. These rows will be filtered out.",
+        fg="red",
     )
 
-    # Check if there are any such sites
-    if not sites_with_only_wildtype.empty:
-        # Echo a warning to the user
-        click.secho(
-            message="\nWarning: There are sites where there are no mutations, in other words, only the wildtype residue is present in the mutation column for that site. These rows will be filtered out.",
-            fg="red",
-        )
-        # Drop the rows where there are no mutations
-        mut_metric_df = mut_metric_df[
-            ~mut_metric_df["reference_site"].isin(
-                sites_with_only_wildtype["reference_site"]
-            )
-        ]
 
-    return mut_metric_df
+def warn_wildtype_only_sites():
+    """Warn that the sites with only the wildtype residue will be filtered out."""
+    click.secho(
+        message="\nWarning: There are sites where there are no mutations, in other words, only the wildtype residue is present in the mutation column for that site. These rows will be filtered out.",
+        fg="red",
+    )
+
+
+def validate_mutation_data(
+    input, metric_col, condition_col, alphabet, chunksize=TABLE_CHUNK_SIZE
+):
+    """Check that the mutation data in a file is in the correct format without loading all of it.
+
+    The file is read a chunk of rows at a time and checked the same way as
+    `format_mutation_data`, with the same errors and warnings. Only the residues in the
+    data, the keys of the mutations (if there isn't a condition column), and the first
+    wildtype residue of each site are kept in memory.
+
+    Parameters
+    ----------
+    input: str
+        The path to a csv, Parquet, or Feather file of mutation data.
+    metric_col: str
+        The name of the column the contains the metric for visualization.
+    condition_col: str or None
+        The name of the column the contains the condition if there are multiple measurements per mutation
+    alphabet: list
+        A list of the amino acid names corresponding to the mutagenized residues.
+    chunksize: int
+        The number of rows to check at once.
+
+    Returns
+    -------
+    dict
+        The number of 'rows', rows with a NaN metric ('nan_rows'), 'sites', and sites
+        with only the wildtype residue ('wildtype_only_sites') in the data.
+    """
+    columns = ["reference_site", "site", "wildtype", "mutant", metric_col]
+    if condition_col is not None:
+        columns.append(condition_col)
+
+    site_col = None
+    residues = set()
+    mutation_keys = set()
+    has_duplicates = False
+    num_rows = 0
+    num_nan_rows = 0
+    # The first wildtype residue of each site and the sites with a mutation
+    site_wildtypes = {}
+    mutated_sites = set()
+
+    for chunk in read_table_chunks(input, columns, chunksize):
+        if site_col is None:
+            site_col = check_mutation_columns(chunk.columns, metric_col, condition_col)
+        num_rows += len(chunk)
+
+        residues.update(chunk["mutant"].unique())
+        residues.update(chunk["wildtype"].unique())
+
+        # Keep the keys of every mutation until a duplicate is found
+        if condition_col is None and not has_duplicates:
+            keys = chunk[[site_col, "wildtype", "mutant"]].itertuples(
+                index=False, name=None
+            )
+            for key in keys:
+                if key in mutation_keys:
+                    has_duplicates = True
+                    mutation_keys.clear()
+                    break
+                mutation_keys.add(key)
+
+        # The remaining checks ignore the rows that would be filtered out
+        is_nan = chunk[metric_col].isna()
+        num_nan_rows += int(is_nan.sum())
+        chunk = chunk[~is_nan]
+
+        sites = chunk.groupby(site_col, sort=False)["wildtype"].first().dropna()
+        for site, wildtype in sites.items():
+            site_wildtypes.setdefault(site, wildtype)
+        is_mutated = chunk["mutant"] != chunk[site_col].map(site_wildtypes)
+        mutated_sites.update(chunk.loc[is_mutated, site_col].dropna().unique())
+
+    # Report the problems in the same order as `format_mutation_data`
+    check_alphabet(residues, alphabet)
+    if has_duplicates:
+        raise_duplicate_mutations()
+    if num_nan_rows:
+        warn_nan_metric()
+    wildtype_only_sites = site_wildtypes.keys() - mutated_sites
+    if wildtype_only_sites:
+        warn_wildtype_only_sites()
+
+    return {
+        "rows": num_rows,
+        "nan_rows": num_nan_rows,
+        "sites": len(site_wildtypes),
+        "wildtype_only_sites": len(wildtype_only_sites),
+    }
 
 
 # Check that the sitemap data is in the correct format
@@ -133,6 +305,8 @@ def format_sitemap_data(sitemap_df, mut_metric_df, included_chains):
     -------
     pandas.DataFrame
     """
+    import pandas as pd
+    from pandas.api.types import is_numeric_dtype
 
     # Check that required columns are present in the sitemap data
     missing_sitemap_columns = {"sequential_site", "reference_site"} - set(
@@ -144,64 +318,69 @@ def format_sitemap_data(sitemap_df, mut_metric_df, included_chains):
         )
 
     # Check that the reference sites are the same between the sitemap and mut_metric dataframe
-    missing_reference_sites = set(mut_metric_df.reference_site.tolist()) - set(
-        sitemap_df.reference_site.tolist()
-    )
-    if missing_reference_sites:
+    missing_reference_sites = pd.Index(
+        mut_metric_df["reference_site"].unique()
+    ).difference(pd.Index(sitemap_df["reference_site"].unique()))
+    if not missing_reference_sites.empty:
         raise ValueError(
-            f"There are reference sites in the mutation dataframe missing from your sitemap e.g. {list(missing_reference_sites)[0:10]}..."
+            f"There are reference sites in the mutation dataframe missing from your sitemap e.g. {missing_reference_sites[0:10].tolist()}..."
         )
 
     # Check that the reference sites are unique for each value of sequential site
-    duplicated_reference_sites = sitemap_df[sitemap_df["reference_site"].duplicated()]
-    if not duplicated_reference_sites.empty:
+    is_duplicated = sitemap_df["reference_site"].duplicated()
+    if is_duplicated.any():
         raise ValueError(
-            f"Duplicated reference sites found: {duplicated_reference_sites['reference_site'].tolist()}"
+            f"Duplicated reference sites found: {sitemap_df.loc[is_duplicated, 'reference_site'].tolist()}"
         )
 
     # Check if the sequential sites are a numeric type as they need to be for ordering the x-axis
-    if not is_numeric_dtype(sitemap_df["sequential_site"]):
+    sequential_sites = sitemap_df["sequential_site"]
+    if not is_numeric_dtype(sequential_sites):
         # Try to coerce the sequential sites into a numeric type
         try:
-            sitemap_df["sequential_site"] = pd.to_numeric(sitemap_df["sequential_site"])
+            sequential_sites = pd.to_numeric(sequential_sites)
         except ValueError as err:
             raise ValueError(
                 "The sequential_site column of the sitemap is not numeric and cannot be coerced into a numeric type."
             ) from err
 
     # If the protein site isn't specified, assume that it's the same as the reference site
-    if "protein_site" not in sitemap_df.columns:
+    if "protein_site" in sitemap_df.columns:
+        protein_sites = sitemap_df["protein_site"]
+    else:
         click.secho(
             message="\n'protein_site' column is not present in the sitemap. Assuming that the reference sites correspond to protein sites.\n",
             fg="yellow",
         )
-        sitemap_df["protein_site"] = sitemap_df["reference_site"].apply(lambda y: y)
+        protein_sites = sitemap_df["reference_site"]
         # Check how many of the protein sites are thrown out
-        num_empty_protein_sites = (sitemap_df["protein_site"] == "").sum()
+        num_empty_protein_sites = (protein_sites == "").sum()
         if num_empty_protein_sites > 0.10 * len(sitemap_df):
             click.secho(
                 message=f"Warning: more than 10% ({num_empty_protein_sites}) of reference sites can't be converted into protein sites. Check if the supplied reference sites are in the correct format. Otherwise, you might need to supply protein sites in another column.",
                 fg="red",
             )
 
-    # If the sitemap doesn't already have a column for chains, add it
-    if "chains" not in sitemap_df.columns:
-        # Add the included chains to the sitemap dataframe if there are any
-        sitemap_df["chains"] = sitemap_df["protein_site"].apply(
-            lambda y: included_chains
-        )
-
-    # Drop the columns that aren't needed for the visualization
-    sitemap_df = sitemap_df[
-        ["reference_site", "protein_site", "sequential_site", "chains"]
-    ]
+    # If the sitemap doesn't already have a column for chains, fill it with the included chains
+    chains = sitemap_df["chains"] if "chains" in sitemap_df.columns else included_chains
 
-    # If a column is of type float, convert it to an integer
-    for col in sitemap_df.columns:
-        if sitemap_df[col].dtype == "float64":
-            sitemap_df[col] = sitemap_df[col].astype(int)
-
-    return sitemap_df
+    # Keep only the columns needed for the visualization and convert floats to integers
+    columns = {
+        "reference_site": sitemap_df["reference_site"],
+        "protein_site": protein_sites,
+        "sequential_site": sequential_sites,
+        "chains": chains,
+    }
+    return pd.DataFrame(
+        {
+            col: (
+                values.astype(int)
+                if isinstance(values, pd.Series) and values.dtype == "float64"
+                else values
+            )
+            for col, values in columns.items()
+        }
+    )
 
 
 # Join the additional dataframes to the main dataframe
@@ -216,7 +395,8 @@ def join_additional_data(mut_metric_df, join_data):
 
     *Note that there currently this data should apply to all site and should
     be identical between conditions. Otherwise, there will be an
-    error about duplicate data.*
+    error about duplicate data.* If a column is in more than one dataframe,
+    the first one is kept, starting with the main dataframe.
 
     Parameters
     ----------
@@ -231,51 +411,81 @@ def join_additional_data(mut_metric_df, join_data):
         The updated mut_metric_df with the joined dataframes.
 
     """
+    import pandas as pd
+
+    join_keys = ["reference_site", "wildtype", "mutant"]
+
+    # Keep track of the columns already in the mutation data or an earlier join dataframe
+    joined_columns = set(mut_metric_df.columns) - set(join_keys)
+    key_kinds = {key: _get_key_kind(mut_metric_df[key]) for key in join_keys}
+    join_frames = []
     for df in join_data:
         # Check that the necessary columns are present, first the reference_sites
         if "reference_site" not in set(df.columns):
             if "site" in set(df.columns):
-                df.rename({"site": "reference_site"})
+                df = df.rename(columns={"site": "reference_site"})
             else:
                 raise ValueError(
                     "One of the join dataframes is missing either the site or reference_site column designating reference sites."
                 )
         # Now check for the other necessary columns
-        missing_join_columns = {"reference_site", "wildtype", "mutant"} - set(
-            df.columns
-        )
+        missing_join_columns = set(join_keys) - set(df.columns)
         if missing_join_columns:
             raise ValueError(
                 f"The following columns do not exist in the join dataframe: {missing_join_columns}"
             )
 
+        # Mutations can only be matched if the keys are the same kind of values, otherwise
+        # every joined column would silently be empty
+        for key in join_keys:
+            kind = _get_key_kind(df[key])
+            if "empty" not in {kind, key_kinds[key]} and kind != key_kinds[key]:
+                raise ValueError(
+                    f"The '{key}' column of a join dataframe has {kind} values ({df[key].dtype}), but the mutation dataframe has {key_kinds[key]} values ({mut_metric_df[key].dtype}), merge cannot be performed"
+                )
+
         # Before merging, make sure that there aren't more than one measurement per merge condition
-        if df[["reference_site", "wildtype", "mutant"]].duplicated().any():
+        join_index = pd.MultiIndex.from_frame(df[join_keys])
+        if join_index.has_duplicates:
             raise ValueError(
                 "Duplicates measurements per mutation were found in join dataframe, merge cannot be performed"
             )
 
-        # Before merging, remove any columns present in both dataframes
-        duplicate_columns = [
-            col
-            for col in df.columns
-            if col
-            in (set(mut_metric_df.columns) - {"reference_site", "wildtype", "mutant"})
-        ]
+        # Before merging, remove any columns that have already been joined
+        duplicate_columns = [col for col in df.columns if col in joined_columns]
         if duplicate_columns:
             df = df.drop(duplicate_columns, axis=1)
             click.secho(
                 message=f"\nWarning: duplicate column names exist between mutation dataframe and join dataframe. Dropping {duplicate_columns} from join data.\n",
                 fg="red",
             )
+        joined_columns.update(set(df.columns) - set(join_keys))
 
-        # Merge this dataframe with the main dataframe
-        mut_metric_df = mut_metric_df.merge(
-            df, on=["reference_site", "wildtype", "mutant"], how="left"
-        )
+        # Index the remaining columns by mutation
+        join_frames.append(df.drop(columns=join_keys).set_axis(join_index))
 
+    if not join_frames:
         return mut_metric_df
 
+    # Align each join dataframe to the mutations in the main dataframe and add the columns at once
+    mutations = pd.MultiIndex.from_frame(mut_metric_df[join_keys])
+    aligned_frames = [
+        df.reindex(mutations).reset_index(drop=True) for df in join_frames
+    ]
+    return pd.concat([mut_metric_df.reset_index(drop=True)] + aligned_frames, axis=1)
+
+
+def _get_key_kind(column):
+    """Get whether the values of a join key column are 'numeric', 'string', or another kind."""
+    from pandas.api.types import infer_dtype
+
+    if hasattr(column, "cat"):
+        column = column.cat.categories.to_series()
+    kind = infer_dtype(column, skipna=True)
+    if kind in {"integer", "floating", "mixed-integer-float", "decimal"}:
+        return "numeric"
+    return kind
+
 
 # Check the filter columns are in the main dataframe and formatted correctly
 def check_filter_columns(mut_metric_df, filter_cols):
@@ -293,6 +503,8 @@ def check_filter_columns(mut_metric_df, filter_cols):
     list of str
         The names of the filter columns to add to the dataframe.
     """
+    import pandas as pd
+
     # Get the current names of the columns
     filter_column_names = [col for col in filter_cols.keys()]
 
@@ -373,6 +585,11 @@ def make_experiment_dictionary(
     title=None,
     floor=None,
     summary_stat=None,
+    as_dataframe=False,
+    columnar=False,
+    slim_atoms=None,
+    compact_sitemap=False,
+    timings=None,
 ):
     """Take site-level and mutation-level measurements and format into
     a dictionary that can be used to create a JSON file for the visualization.
@@ -383,8 +600,12 @@ def make_experiment_dictionary(
         A dataframe containing site- and mutation-level data for visualization.
     metric_col: str
         The name of the column the contains the metric for visualization.
-    structure: str
-        An RCSB PDB ID (i.e. 6UDJ) or the path to a file with a *.pdb extension.
+    structure: str or pdb_utils.PreparedStructure
+        An RCSB PDB ID (i.e. 6UDJ), the path to a local structure file, or a structure that
+        was prepared to format many datasets against it. Local files can be PDB (*.pdb),
+        mmCIF (*.cif), or BinaryCIF (*.bcif) files, optionally gzipped (i.e. *.cif.gz).
+        They're embedded as the text of a PDB file, or of an mmCIF file when they don't
+        fit the PDB format (i.e. chains with long IDs), which is recorded in 'pdb_format'.
     sitemap_df: pandas.DataFrame or None
         A dataframe mapping sequential sites to reference sites to protein sites.
     metric_name: str or None
@@ -425,12 +646,104 @@ def make_experiment_dictionary(
         If True, the floor of the metric will be set to 0 by default.
     summary_stat: str or None
         The default summary statistic to display on the plot.
+    as_dataframe: bool
+        If True, 'mut_metric_df' is kept as a pandas.DataFrame instead of a list of records
+        so that it can be written straight to a file with `io_utils.write_json`.
+    columnar: bool
+        If True, 'mut_metric_df' is a dictionary with an array for each column instead of a
+        list of records. The wildtype and mutant columns are encoded as indices into the
+        alphabet and the condition column as indices into the conditions. The layout is
+        described by 'mut_metric_df_schema' (see `io_utils.encode_columnar`).
+    slim_atoms: str or None
+        If set, a reduced structure with only the polymer and included chains that aren't
+        excluded is embedded in 'pdb', even for PDB IDs. Waters and ligands are dropped and
+        'all', 'heavy', or 'backbone' sets which atoms are kept (see `pdb_utils.slim_structure`).
+    compact_sitemap: bool
+        If True, 'sitemap' is a dictionary with an array for each column in order of the
+        sequential sites instead of an object per reference site. The chains are encoded
+        as indices into 'sitemap_chains' and the layout is described by 'sitemap_schema'
+        (see `io_utils.encode_compact_sitemap`).
+    timings: profiling.Timings or None
+        If set, the wall time, peak memory, and row counts of each stage, such as formatting
+        the data and fetching, parsing, and checking the structure, are recorded in it.
 
     Returns
     -------
     dict
         A dictionary containing a single dataset for visualization to convert into a JSON file.
     """
+    # Record the stages of formatting the dataset in the timings
+    activation = contextlib.nullcontext() if timings is None else timings.activate()
+    with activation:
+        return _make_experiment_dictionary(
+            mut_metric_df=mut_metric_df,
+            metric_col=metric_col,
+            sitemap_df=sitemap_df,
+            structure=structure,
+            join_data=join_data,
+            filter_cols=filter_cols,
+            filter_limits=filter_limits,
+            heatmap_limits=heatmap_limits,
+            tooltip_cols=tooltip_cols,
+            metric_name=metric_name,
+            condition_col=condition_col,
+            condition_name=condition_name,
+            included_chains=included_chains,
+            excluded_chains=excluded_chains,
+            alphabet=alphabet,
+            colors=colors,
+            negative_colors=negative_colors,
+            check_pdb=check_pdb,
+            exclude_amino_acids=exclude_amino_acids,
+            description=description,
+            title=title,
+            floor=floor,
+            summary_stat=summary_stat,
+            as_dataframe=as_dataframe,
+            columnar=columnar,
+            slim_atoms=slim_atoms,
+            compact_sitemap=compact_sitemap,
+        )
+
+
+def _make_experiment_dictionary(
+    mut_metric_df,
+    metric_col,
+    sitemap_df,
+    structure,
+    join_data,
+    filter_cols,
+    filter_limits,
+    heatmap_limits,
+    tooltip_cols,
+    metric_name,
+    condition_col,
+    condition_name,
+    included_chains,
+    excluded_chains,
+    alphabet,
+    colors,
+    negative_colors,
+    check_pdb,
+    exclude_amino_acids,
+    description,
+    title,
+    floor,
+    summary_stat,
+    as_dataframe,
+    columnar,
+    slim_atoms,
+    compact_sitemap,
+):
+    """Format a dataset, see `make_experiment_dictionary`."""
+    import pandas as pd
+    from .pdb_utils import (
+        PreparedStructure,
+        check_chains,
+        check_wildtype_residues,
+        slim_structure,
+        slim_pdb_text,
+    )
 
     # Make sure the chain names are valid and not just whitespace
     if not included_chains.strip():
@@ -445,9 +758,11 @@ def make_experiment_dictionary(
         )
 
     # Check that the necessary columns are present in the mut_metric dataframe and format
-    mut_metric_df = format_mutation_data(
-        mut_metric_df, metric_col, condition_col, alphabet
-    )
+    with stage("format mutation data") as record:
+        mut_metric_df = format_mutation_data(
+            mut_metric_df, metric_col, condition_col, alphabet
+        )
+        record["rows"] = len(mut_metric_df)
 
     # If there is no sitemap dataframe, create a default one
     if sitemap_df is None:
@@ -464,14 +779,18 @@ def make_experiment_dictionary(
         )
 
     # Check that the necessary columns are present in the sitemap dataframe and format
-    sitemap_df = format_sitemap_data(sitemap_df, mut_metric_df, included_chains)
+    with stage("format sitemap data") as record:
+        sitemap_df = format_sitemap_data(sitemap_df, mut_metric_df, included_chains)
+        record["rows"] = len(sitemap_df)
 
     # Keep track of the required columns to cut down on the final total data size
     cols_to_keep = ["reference_site", "wildtype", "mutant", metric_col]
 
     # Join the additional data to the main dataframe if there is any
     if join_data:
-        mut_metric_df = join_additional_data(mut_metric_df, join_data)
+        with stage("join data") as record:
+            mut_metric_df = join_additional_data(mut_metric_df, join_data)
+            record["rows"] = len(mut_metric_df)
 
     # Add the condition column to the required columns if it's not None
     if condition_col:
@@ -604,15 +923,79 @@ def make_experiment_dictionary(
     # Subset the mutation dataframe down to the required columns
     mut_metric_df = mut_metric_df[list(set(cols_to_keep))]
 
-    # Determine whether the structure is a PDB ID or a local file
-    _, ext = os.path.splitext(structure)
-
-    if ext == ".pdb":
-        # PDB is local, load it in as a string
-        with open(structure, "r") as f:
-            pdb = f.read()
+    # Load the structure once for both the structure checks and the JSON, only the text
+    # of uncompressed PDB files can be embedded without parsing them
+    with stage("load structure"):
+        if isinstance(structure, PreparedStructure):
+            prepared = structure
+        elif check_pdb or (
+            not structure.endswith(".pdb") and (slim_atoms or os.path.isfile(structure))
+        ):
+            prepared = PreparedStructure.load(structure)
+        else:
+            prepared = None
+            if structure.endswith(".pdb"):
+                with open(structure, "r") as f:
+                    structure_text = f.read()
+
+    # Determine whether the structure is a PDB ID or the text of a PDB file
+    if prepared is not None:
+        pdb_id = prepared.pdb_id
+        # Structures without their text are written out from the parsed structure
+        is_pdb_text = prepared.fmt == "pdb" and prepared.text is not None
+        structure_text = prepared.text
     else:
-        pdb = structure
+        is_pdb_text = structure.endswith(".pdb")
+        pdb_id = None if is_pdb_text else structure
+
+    pdb_format = "pdb"
+    if slim_atoms and pdb_id is None and is_pdb_text:
+        # Reduce the text of local files so that nothing is lost to parsing
+        with stage("slim structure"):
+            pdb = slim_pdb_text(
+                structure_text, included_chains, excluded_chains, slim_atoms
+            )
+    elif slim_atoms:
+        # Include a reduced copy of the PDB ID as a string
+        try:
+            with stage("slim structure"):
+                pdb = slim_structure(
+                    prepared, included_chains, excluded_chains, slim_atoms
+                )
+        except ValueError as e:
+            if pdb_id is not None:
+                click.secho(
+                    message=f"Warning: {pdb_id} can't be reduced to a PDB file ({e}). The PDB ID will be used instead.",
+                    fg="red",
+                )
+                pdb = pdb_id
+            else:
+                click.secho(
+                    message=f"Warning: the structure can't be reduced to a PDB file ({e}). It will be embedded as an mmCIF file instead.",
+                    fg="yellow",
+                )
+                with stage("slim structure"):
+                    pdb = slim_structure(
+                        prepared, included_chains, excluded_chains, slim_atoms, "cif"
+                    )
+                pdb_format = "cif"
+    elif pdb_id is not None:
+        pdb = pdb_id
+    elif is_pdb_text:
+        # PDB is local, include it as a string
+        pdb = structure_text
+    else:
+        # Parsed mmCIF and BinaryCIF structures are embedded as the more compact PDB
+        # text, unless they don't fit the PDB format (i.e. chains with long IDs)
+        try:
+            pdb = prepared.to_pdb_text()
+        except ValueError as e:
+            click.secho(
+                message=f"Warning: the structure can't be written as a PDB file ({e}). It will be embedded as an mmCIF file instead.",
+                fg="yellow",
+            )
+            pdb = prepared.to_cif_text()
+            pdb_format = "cif"
 
     # Get a list of the conditions and map these to the colors
     if colors is None:
@@ -681,14 +1064,15 @@ def make_experiment_dictionary(
 
     # Check that the chains and wildtype residues are in the structure
     if check_pdb:
-        if included_chains != "polymer":
-            check_chains(get_structure(structure), included_chains.split(" "))
+        with stage("check chains"):
+            check_chains(prepared, included_chains.split(" "))
         # Check that the wildtype residues are in the structure
-        perc_matching, perc_missing, count_matching, count_missing = (
-            check_wildtype_residues(
-                get_structure(structure), mut_metric_df, sitemap_df, excluded_chains
+        with stage("check wildtype residues", len(mut_metric_df)):
+            perc_matching, perc_missing, count_matching, count_missing = (
+                check_wildtype_residues(
+                    prepared, mut_metric_df, sitemap_df, excluded_chains
+                )
             )
-        )
         # Alert the user about the missing and matching residues
         if perc_matching < 0.5:
             color = "red"
@@ -705,10 +1089,32 @@ def make_experiment_dictionary(
             message = f"About {perc_missing*100:.2F}% {count_missing} of the data sites are missing from the structure."
         click.secho(message=message, fg=color)
 
+    # Format the mutation data as records or as one array per column
+    with stage("encode mutation data", len(mut_metric_df)):
+        if columnar:
+            mut_metric_data, mut_metric_schema = encode_columnar(
+                mut_metric_df, [aa for aa in alphabet], condition_col, conditions
+            )
+            if not as_dataframe:
+                mut_metric_data = {
+                    col: json.loads(values.to_json(orient="values"))
+                    for col, values in mut_metric_data.items()
+                }
+        elif as_dataframe:
+            mut_metric_data = mut_metric_df
+        else:
+            mut_metric_data = json.loads(mut_metric_df.to_json(orient="records"))
+
+    # Format the sitemap as an object per site or as one array per column
+    if compact_sitemap:
+        sitemap, sitemap_chains, sitemap_schema = encode_compact_sitemap(sitemap_df)
+    else:
+        sitemap = sitemap_df.set_index("reference_site").to_dict(orient="index")
+
     # Make a dictionary holding the experiment data
     experiment_dict = {
-        "mut_metric_df": json.loads(mut_metric_df.to_json(orient="records")),
-        "sitemap": sitemap_df.set_index("reference_site").to_dict(orient="index"),
+        "mut_metric_df": mut_metric_data,
+        "sitemap": sitemap,
         "metric_col": metric_col,
         "condition_col": condition_col,
         "conditions": conditions,
@@ -728,12 +1134,31 @@ def make_experiment_dictionary(
         "floor": floor,
         "summary_stat": summary_stat,
     }
+    if pdb_format != "pdb":
+        experiment_dict["pdb_format"] = pdb_format
+    if columnar:
+        experiment_dict["mut_metric_df_schema"] = mut_metric_schema
+    if compact_sitemap:
+        experiment_dict["sitemap_chains"] = sitemap_chains
+        experiment_dict["sitemap_schema"] = sitemap_schema
 
     return experiment_dict
 
 
 # ============================== Command Line Interface ============================== #
 
+# Options of the format command that don't change the output
+FINGERPRINT_IGNORED_OPTIONS = {
+    "force",
+    "cache_dir",
+    "cache_size",
+    "offline",
+    "json_backend",
+    "csv_engine",
+    "profile",
+    "profile_output",
+}
+
 
 class ListParamType(click.ParamType):
     name = "list"
@@ -768,7 +1193,7 @@ def cli():
     "--input",
     type=click.Path(exists=True),
     required=True,
-    help="Path to a csv with site- and mutation-level data to visualize on a protein structure.",
+    help="Path to a csv, Parquet (.parquet), or Feather/Arrow IPC (.feather, .arrow) file with site- and mutation-level data to visualize on a protein structure.",
 )
 @click.option(
     "--metric",
@@ -780,14 +1205,14 @@ def cli():
     "--structure",
     type=str,
     required=True,
-    help="An RCSB PDB ID (i.e. 6UDJ) or the path to a file with a *.pdb extension.",
+    help="An RCSB PDB ID (i.e. 6UDJ) or the path to a PDB, mmCIF, or BinaryCIF file (*.pdb, *.cif, or *.bcif, optionally gzipped).",
 )
 @click.option(
     "--sitemap",
     type=click.Path(exists=True),
     required=False,
     default=None,
-    help="Path to a csv with a mapping of sequential sites to reference sites to protein sites.",
+    help="Path to a csv, Parquet, or Feather/Arrow IPC file with a mapping of sequential sites to reference sites to protein sites.",
 )
 @click.option(
     "--name",
@@ -799,7 +1224,7 @@ def cli():
     "--output",
     type=click.Path(),
     required=True,
-    help="Path to save the *.json file containing the data for the visualization tool.",
+    help="Path to save the *.json file containing the data for the visualization tool. Outputs ending in .gz or .zst are compressed.",
 )
 @click.option(
     "--metric-name",
@@ -855,7 +1280,7 @@ def cli():
     type=ListParamType(),
     required=False,
     default=None,
-    help='Optionally, a csv file with additional data to join to the mutation data. Example: "path/to/join_data.csv, path/to/join_data2.csv"',
+    help='Optionally, csv, Parquet, or Feather/Arrow IPC files with additional data to join to the mutation data. Example: "path/to/join_data.csv, path/to/join_data2.parquet"',
 )
 @click.option(
     "--included-chains",
@@ -934,6 +1359,88 @@ def cli():
     default=None,
     help="The default summary statistic to display on the plot.",
 )
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    required=False,
+    default=None,
+    envvar=CACHE_DIR_ENV,
+    help=f"Optionally, a directory to cache structures downloaded from the RCSB PDB in. Can also be set with {CACHE_DIR_ENV}.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    required=False,
+    default=DEFAULT_CACHE_SIZE,
+    envvar=CACHE_SIZE_ENV,
+    help=f"The maximum size of the structure cache in megabytes. The least recently used structures are removed first. Can also be set with {CACHE_SIZE_ENV}.",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    envvar=OFFLINE_ENV,
+    help=f"Never download structures and fail if a PDB ID isn't in the structure cache. Can also be set with {OFFLINE_ENV}.",
+)
+@click.option(
+    "--json-backend",
+    type=click.Choice(JSON_BACKENDS),
+    required=False,
+    default="json",
+    help="The JSON library to use when writing the output. 'orjson' is faster if it's installed and the output is identical.",
+)
+@click.option(
+    "--columnar",
+    is_flag=True,
+    default=False,
+    help="Write the mutation data as one array per column with the wildtype, mutant, and condition columns encoded against the alphabet and conditions. This makes large files smaller and faster to load.",
+)
+@click.option(
+    "--compact-sitemap",
+    is_flag=True,
+    default=False,
+    help="Write the sitemap as one array per column in order of the sequential sites with the chains encoded against a table of the unique chains instead of an object per site.",
+)
+@click.option(
+    "--compress",
+    type=click.Choice(COMPRESSIONS),
+    required=False,
+    default=None,
+    help="Optionally, compress the output. By default, outputs ending in .gz or .zst are compressed with gzip or zstd.",
+)
+@click.option(
+    "--slim-structure",
+    type=click.Choice(["all", "heavy", "backbone"]),
+    required=False,
+    default=None,
+    help="Optionally, embed a reduced structure with only the polymer and included chains that aren't excluded and without waters or ligands. 'heavy' also drops hydrogens and 'backbone' only keeps backbone atoms. PDB IDs are fetched and embedded too.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Format the data even if the output is up to date with the inputs and options.",
+)
+@click.option(
+    "--csv-engine",
+    type=click.Choice(CSV_ENGINES),
+    required=False,
+    default="c",
+    help="The parser to read the csv files with. 'pyarrow' is faster for large files if it's installed.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print the wall time, peak memory, and number of rows of each stage of formatting the data.",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(),
+    required=False,
+    default=None,
+    help="Optionally, write the time, peak memory, and number of rows of each stage to this JSON file.",
+)
 def format(
     input,
     sitemap,
@@ -960,19 +1467,104 @@ def format(
     title,
     floor,
     summary_stat,
+    cache_dir,
+    cache_size,
+    offline,
+    json_backend,
+    columnar,
+    compact_sitemap,
+    compress,
+    slim_structure,
+    force,
+    csv_engine,
+    profile,
+    profile_output,
 ):
     """Command line interface for creating a JSON file for visualizing protein data"""
+
+    # Record the stages until the command finishes and report them even if it fails
+    timings = None
+    if profile or profile_output:
+        timings = Timings()
+        ctx = click.get_current_context()
+        ctx.with_resource(timings.activate())
+
+        def report_timings():
+            if profile:
+                click.secho(message="\nProfile of the format command:", fg="green")
+                click.echo(timings.summary())
+            if profile_output:
+                timings.write(profile_output)
+
+        ctx.call_on_close(report_timings)
+
+    # Skip formatting if the output was made from the same inputs and options
+    options = {
+        key: value
+        for key, value in click.get_current_context().params.items()
+        if key not in FINGERPRINT_IGNORED_OPTIONS
+    }
+    files = {
+        "input": [input],
+        "sitemap": [sitemap] if sitemap else [],
+        "join_data": join_data or [],
+        "structure": [structure] if os.path.isfile(structure) else [],
+    }
+    with stage("fingerprint inputs"):
+        fingerprint = get_fingerprint(options, files)
+    if not force and is_up_to_date(output, fingerprint):
+        click.secho(
+            message=f"\n'{output}' is up to date with '{input}' and the options (cache hit), skipping.",
+            fg="green",
+        )
+        return
+    click.secho(
+        message=f"\n'{output}' is missing or out of date (cache miss).",
+        fg="green",
+    )
+    # Don't leave the old fingerprint if formatting fails part way through the output
+    remove_fingerprint(output)
+
     click.secho(
         message=f"\nFormatting data for visualization using the '{metric}' column from '{input}'...",
         fg="green",
     )
 
+    # Configure where structures are cached and whether they can be downloaded
+    configure_cache(cache_dir=cache_dir, max_size=cache_size, offline=offline)
+
+    # Only read the columns of the mutation and join data that end up in the output
+    data_cols = ["wildtype", "mutant", metric]
+    if condition:
+        data_cols.append(condition)
+    data_cols += list(filter_cols or {}) + list(tooltip_cols or {})
+    categorical_cols = ["wildtype", "mutant", condition]
+
     # Read in the main mutation data
-    mut_metric_df = pd.read_csv(input)
+    with stage("read input") as record:
+        mut_metric_df = read_table(
+            input,
+            ["reference_site", "site"] + data_cols,
+            categorical_cols,
+            csv_engine,
+        )
+        record["rows"] = len(mut_metric_df)
+    # The site column is only used if there isn't a reference_site column
+    if "site" not in data_cols and {"reference_site", "site"} <= set(
+        mut_metric_df.columns
+    ):
+        mut_metric_df = mut_metric_df.drop(columns="site")
 
     # Split the list of join data files and read them in as a list
     if join_data:
-        join_data_dfs = [pd.read_csv(file) for file in join_data]
+        with stage("read join data") as record:
+            join_data_dfs = [
+                read_table(
+                    file, ["reference_site", "site"] + data_cols, engine=csv_engine
+                )
+                for file in join_data
+            ]
+            record["rows"] = sum(len(df) for df in join_data_dfs)
         click.secho(
             message=f"\nJoining data from {len(join_data)} dataframe.", fg="green"
         )
@@ -981,7 +1573,13 @@ def format(
 
     # Read in the sitemap data
     if sitemap is not None:
-        sitemap_df = pd.read_csv(sitemap)
+        with stage("read sitemap") as record:
+            sitemap_df = read_table(
+                sitemap,
+                ["reference_site", "sequential_site", "protein_site", "chains"],
+                engine=csv_engine,
+            )
+            record["rows"] = len(sitemap_df)
         click.secho(message=f"\nUsing sitemap from '{sitemap}'.", fg="green")
     else:
         sitemap_df = None
@@ -1011,11 +1609,18 @@ def format(
         title,
         floor,
         summary_stat,
+        as_dataframe=True,
+        columnar=columnar,
+        slim_atoms=slim_structure,
+        compact_sitemap=compact_sitemap,
+        timings=timings,
     )
 
     # Write the dictionary to a json file
-    with open(output, "w") as f:
-        json.dump({name: experiment_dict}, f, sort_keys=True)
+    with stage("write json"):
+        with open_output(output, "w", compress) as f:
+            write_json({name: experiment_dict}, f, json_backend)
+    write_fingerprint(output, fingerprint)
 
     click.secho(
         message=f"\nSuccess! The visualization JSON was written to '{output}'",
@@ -1043,13 +1648,27 @@ def format(
     help="Path to the markdown file to include as a global description.",
     required=False,
 )
-def join_command(input, output, description):
-    """Join command that combines multiple JSON specification files into one."""
+@click.option(
+    "--compress",
+    type=click.Choice(COMPRESSIONS),
+    required=False,
+    default=None,
+    help="Optionally, compress the output. By default, outputs ending in .gz or .zst are compressed with gzip or zstd. Compressed input files are always read.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Keep an index of the datasets next to the output and only re-serialize the datasets of input files that changed since the last incremental join.",
+)
+def join_command(input, output, description, compress, incremental):
+    """Join command that combines multiple JSON specification files into one.
 
-    # Initialize an empty dictionary to store the combined data
-    combined_data = {}
+    Returns True if the files were joined, so that `batch` can tell when joining fails.
+    """
 
     # Handle markdown description
+    markdown_content = None
     if description:
         # Ensure that the file has a .md extension
         if not description.endswith(".md"):
@@ -1062,38 +1681,311 @@ def join_command(input, output, description):
         try:
             with open(description, "r") as md_file:
                 markdown_content = md_file.read()
-                combined_data["markdown_description"] = markdown_content
         except Exception as e:
             click.secho(
                 f"Failed to read description markdown file. Error: {str(e)}", fg="red"
             )
             return
 
-    for file_path in input:
+    # Join the files one at a time without loading all of them into memory
+    # and raise an error if names of the datasets aren't unique
+    try:
+        join_json_files(input, output, markdown_content, compress, incremental)
+    except (OSError, json.JSONDecodeError) as e:
+        click.secho(f"Failed to join the JSON files. Error: {str(e)}", fg="red")
+        return
+
+    click.secho(
+        message=f"\nSuccess! {len(input)} JSON files were merged and saved to '{output}'",
+        fg="green",
+    )
+    return True
+
+
+@cli.command("validate")
+@click.option(
+    "--input",
+    type=click.Path(exists=True),
+    required=True,
+    help="Path to a csv, Parquet (.parquet), or Feather/Arrow IPC (.feather, .arrow) file with site- and mutation-level data to check.",
+)
+@click.option(
+    "--metric",
+    type=str,
+    required=True,
+    help="The name of the column that contains the metric for visualization.",
+)
+@click.option(
+    "--condition",
+    type=str,
+    required=False,
+    default=None,
+    help="The name of the column that contains the condition to group on if there are multiple measurements per experiment.",
+)
+@click.option(
+    "--alphabet",
+    type=str,
+    required=False,
+    default="RKHDEQNSTYWFAILMVGPC-*",
+    help="A string of amino acids to use as the alphabet for the visualization.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    required=False,
+    default=TABLE_CHUNK_SIZE,
+    show_default=True,
+    help="The number of rows to read and check at once.",
+)
+def validate_command(input, metric, condition, alphabet, chunk_size):
+    """Check the mutation data for format a chunk of rows at a time without loading all of it."""
+    click.secho(
+        message=f"\nValidating the '{metric}' column from '{input}' in chunks of {chunk_size} rows...",
+        fg="green",
+    )
+
+    summary = validate_mutation_data(input, metric, condition, alphabet, chunk_size)
+
+    click.secho(
+        message=f"\nSuccess! '{input}' has {summary['rows']} rows at {summary['sites']} sites that can be formatted.",
+        fg="green",
+    )
+
+
+def read_manifest(manifest, output_dir):
+    """Read a manifest of datasets into the command line arguments for the format command.
+
+    The manifest is a csv with a column for each flag of the format command (with
+    underscores in place of dashes, i.e. 'metric_name') and a row for each dataset.
+    Empty cells are left unset.
+
+    Parameters
+    ----------
+    manifest: str
+        Path to the manifest csv.
+    output_dir: str
+        The directory to write the JSON for each dataset to. The file is named after the dataset.
+
+    Returns
+    -------
+    dict
+        A dictionary of the arguments for each dataset grouped by structure.
+    """
+    import pandas as pd
+
+    manifest_df = pd.read_csv(manifest, dtype=str, keep_default_na=False)
+
+    # Check that each column is a flag of the format command
+    format_options = {param.name for param in format.params} - {"output"}
+    unknown_columns = set(manifest_df.columns) - format_options
+    if unknown_columns:
+        raise ValueError(
+            f"The following columns in the manifest aren't options of the format command: {list(unknown_columns)}"
+        )
+    missing_columns = {"input", "metric", "structure", "name"} - set(
+        manifest_df.columns
+    )
+    if missing_columns:
+        raise ValueError(
+            f"The following columns are required in the manifest: {list(missing_columns)}"
+        )
+
+    # Check that the datasets will be written to different files
+    duplicated_names = manifest_df["name"][manifest_df["name"].duplicated()]
+    if not duplicated_names.empty:
+        raise ValueError(
+            f"Duplicated dataset names found in the manifest: {duplicated_names.tolist()}"
+        )
+
+    # Group the datasets by structure so that each structure is only loaded once
+    grouped_args = {}
+    for row in manifest_df.to_dict(orient="records"):
+        args = []
+        for key, value in row.items():
+            if value != "":
+                args += [f"--{key.replace('_', '-')}", value]
+        args += ["--output", os.path.join(output_dir, f"{row['name']}.json")]
+        grouped_args.setdefault(row["structure"], []).append(args)
+
+    return grouped_args
+
+
+def _format_datasets(datasets_args):
+    """Run the format command for each dataset, see the batch command.
+
+    Parameters
+    ----------
+    datasets_args: list of list
+        The command line arguments of the format command for each dataset.
+
+    Returns
+    -------
+    list of str
+        The paths to the JSON files written for each dataset.
+    """
+    outputs = []
+    for args in datasets_args:
         try:
-            with open(file_path, "r") as f:
-                data = json.load(f)
-                combined_data.update(data)
+            format.main(args=args, standalone_mode=False)
         except Exception as e:
+            name = args[args.index("--name") + 1]
+            raise ValueError(f"Failed to format the dataset '{name}': {e}") from e
+        outputs.append(args[args.index("--output") + 1])
+    return outputs
+
+
+def _chunk_datasets(grouped_args, jobs):
+    """Split the datasets grouped by structure into chunks to spread across processes.
+
+    Groups with more datasets than an even share of the datasets for each job are split
+    into chunks of that size, and smaller groups are kept together.
+
+    Parameters
+    ----------
+    grouped_args: list of list
+        The command line arguments of the format command for each dataset, grouped by
+        structure.
+    jobs: int
+        The number of processes to format datasets with.
+
+    Returns
+    -------
+    list of list
+        The command line arguments of the datasets in each chunk, in the same order.
+    """
+    num_datasets = sum(len(datasets_args) for datasets_args in grouped_args)
+    chunk_size = max(-(-num_datasets // jobs), 1)
+    return [
+        datasets_args[start : start + chunk_size]
+        for datasets_args in grouped_args
+        for start in range(0, len(datasets_args), chunk_size)
+    ]
+
+
+@cli.command("batch")
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True),
+    required=True,
+    help="Path to a csv with a column for each option of the format command and a row for each dataset.",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    required=False,
+    default=1,
+    help="The number of processes to format datasets with.",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    required=False,
+    default=None,
+    help="Optionally, a directory to save a *.json file for each dataset to. The files are named after the datasets.",
+)
+@click.option(
+    "--output",
+    type=click.Path(),
+    required=False,
+    default=None,
+    help="Optionally, a path to save a single *.json file that joins all of the datasets.",
+)
+@click.option(
+    "--description",
+    type=click.Path(exists=True, readable=True, file_okay=True),
+    required=False,
+    default=None,
+    help="Path to the markdown file to include as a global description in the joined file.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    required=False,
+    default=None,
+    envvar=CACHE_DIR_ENV,
+    help=f"Optionally, a directory to cache structures downloaded from the RCSB PDB in. Otherwise, structures are only cached until the datasets are formatted. Can also be set with {CACHE_DIR_ENV}.",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    envvar=OFFLINE_ENV,
+    help=f"Never download structures and fail if a PDB ID isn't in the structure cache. Can also be set with {OFFLINE_ENV}.",
+)
+@click.pass_context
+def batch_command(
+    ctx, manifest, jobs, output_dir, output, description, cache_dir, offline
+):
+    """Format every dataset in a manifest in one process pool and optionally join them."""
+    if output_dir is None and output is None:
+        raise click.UsageError("Either --output-dir or --output must be provided.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Without an output directory, the datasets are only kept until they're joined
+        if output_dir is None:
+            output_dir = tmp_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        grouped_args = read_manifest(manifest, output_dir)
+        num_datasets = sum(len(datasets) for datasets in grouped_args.values())
+        click.secho(
+            message=f"\nFormatting {num_datasets} datasets with {len(grouped_args)} structures from '{manifest}' using {jobs} job(s)...",
+            fg="green",
+        )
+
+        # Download the structures for every dataset at once before formatting. Without a
+        # cache directory, the structures are only cached until the datasets are formatted
+        if cache_dir is None:
+            cache_dir = os.path.join(tmp_dir, "structures")
+        configure_cache(cache_dir=cache_dir, offline=offline)
+        pdb_ids = [
+            structure
+            for structure in grouped_args
+            if not os.path.isfile(structure)
+            and len(structure) == 4
+            and structure.isalnum()
+        ]
+        for pdb_id, error in prefetch_structures(pdb_ids).items():
             click.secho(
-                f"Failed to process file {file_path}. Error: {str(e)}", fg="red"
+                message=f"\nWarning: Failed to fetch the structure {pdb_id}: {error}",
+                fg="red",
             )
-            return
 
-    # Raise an error if names of the datasets aren't unique
-    combined_data_keys = list(combined_data.keys())
-    if len(combined_data_keys) != len(set(combined_data_keys)):
-        raise ValueError("Names of the datasets are not unique.")
+        # Pass the structure cache options on to each dataset
+        cache_args = ["--cache-dir", cache_dir]
+        if offline:
+            cache_args.append("--offline")
+        grouped_args = [
+            [args + cache_args for args in datasets_args]
+            for datasets_args in grouped_args.values()
+        ]
 
-    try:
-        # Write the combined data to the specified output file
-        with open(output, "w") as f:
-            json.dump(combined_data, f, sort_keys=True)
-    except Exception as e:
-        click.secho(f"Failed to write to output file. Error: {str(e)}", fg="red")
-        return
+        # Each process formats a chunk of the datasets that share a structure, so it
+        # only loads the structure once even when every dataset has the same structure
+        chunked_args = _chunk_datasets(grouped_args, jobs)
+        if jobs == 1 or len(chunked_args) == 1:
+            outputs = [
+                _format_datasets(datasets_args) for datasets_args in chunked_args
+            ]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                outputs = list(executor.map(_format_datasets, chunked_args))
+        outputs = [path for paths in outputs for path in paths]
+
+        # Join the datasets into a single file
+        if output is not None:
+            joined = ctx.invoke(
+                join_command,
+                input=outputs,
+                output=output,
+                description=description,
+            )
+            if not joined:
+                raise click.ClickException(
+                    f"The datasets from '{manifest}' were formatted, but they couldn't be joined into '{output}'."
+                )
 
     click.secho(
-        message=f"\nSuccess! {len(input)} JSON files were merged and saved to '{output}'",
+        message=f"\nSuccess! {num_datasets} datasets from '{manifest}' were formatted.",
         fg="green",
     )
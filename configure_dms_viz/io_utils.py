@@ -0,0 +1,953 @@
+"""Read and write the JSON specification files for dms-viz."""
+
+import io
+import os
+import gzip
+import json
+import hashlib
+import contextlib
+import tempfile
+import importlib.metadata
+from json.encoder import encode_basestring_ascii
+
+# The size of the blocks that are copied between files
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# The number of rows of a dataframe that are encoded at once
+RECORDS_CHUNK_SIZE = 5000
+
+# The default number of rows of a table that are read at once when streaming it
+TABLE_CHUNK_SIZE = 100000
+
+# The JSON libraries that can be used to decode values encoded by pandas
+JSON_BACKENDS = ["json", "orjson"]
+
+# The parsers that can be used to read csv files
+CSV_ENGINES = ["c", "pyarrow"]
+
+# The extensions of the table formats other than csv that can be read
+TABLE_EXTENSIONS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+    ".ipc": "feather",
+}
+
+# The version of the columnar layout of the mutation data
+COLUMNAR_SCHEMA_VERSION = 1
+
+# The version of the compact layout of the sitemap
+SITEMAP_SCHEMA_VERSION = 1
+
+# The compression formats for output files and the extensions that select them
+COMPRESSIONS = ["gzip", "zstd"]
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+# The first bytes of a file in each compression format
+COMPRESSION_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+# The extension of the sidecar file that records the fingerprint of an output file
+FINGERPRINT_EXTENSION = ".fingerprint"
+
+# The extension of the sidecar file that indexes the datasets in a joined file
+JOIN_INDEX_EXTENSION = ".index"
+
+
+def _import_zstandard():
+    """Import the optional zstandard package."""
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ValueError(
+            "zstd compression requires the zstandard package, install it with `pip install zstandard`."
+        ) from err
+    return zstandard
+
+
+def get_compression(path, compress=None):
+    """Get the compression format for an output file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the output file.
+    compress: str or None
+        The compression format, 'gzip' or 'zstd'. If None, the format is chosen by the
+        extension of the file ('.gz' or '.zst') and the file isn't compressed otherwise.
+
+    Returns
+    -------
+    str or None
+        The compression format or None if the file isn't compressed.
+    """
+    if compress is None:
+        return COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1])
+    if compress not in COMPRESSIONS:
+        raise ValueError(
+            f"The compression must be one of {COMPRESSIONS}, not '{compress}'."
+        )
+    return compress
+
+
+def open_output(path, mode="w", compress=None):
+    """Open an output file, compressing it as it's written.
+
+    Parameters
+    ----------
+    path: str
+        The path to the output file.
+    mode: str
+        'w' to write text or 'wb' to write bytes.
+    compress: str or None
+        The compression format, see `get_compression`.
+
+    Returns
+    -------
+    file
+        A file object that compresses what's written to it.
+    """
+    compression = get_compression(path, compress)
+    if compression == "gzip":
+        # Leave the modification time out of the header so that the output is reproducible
+        f = gzip.GzipFile(path, "wb", mtime=0)
+    elif compression == "zstd":
+        zstandard = _import_zstandard()
+        f = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    else:
+        return open(path, mode)
+    return f if mode == "wb" else io.TextIOWrapper(f, encoding="utf-8")
+
+
+def open_input(path, mode="r"):
+    """Open an input file, decompressing it if it's compressed with gzip or zstd.
+
+    Parameters
+    ----------
+    path: str
+        The path to the input file.
+    mode: str
+        'r' to read text or 'rb' to read bytes.
+
+    Returns
+    -------
+    file
+        A file object that reads the decompressed content.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    compression = next(
+        (
+            compression
+            for prefix, compression in COMPRESSION_MAGIC.items()
+            if magic.startswith(prefix)
+        ),
+        None,
+    )
+    if compression == "gzip":
+        f = gzip.GzipFile(path, "rb")
+    elif compression == "zstd":
+        zstandard = _import_zstandard()
+        f = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    else:
+        return open(path, mode)
+    return f if mode == "rb" else io.TextIOWrapper(f, encoding="utf-8")
+
+
+def get_json_loads(backend="json"):
+    """Get the function used to decode JSON for a JSON backend.
+
+    Parameters
+    ----------
+    backend: str
+        Either 'json' for the standard library or 'orjson' if it's installed.
+
+    Returns
+    -------
+    callable
+        A function that decodes a JSON string.
+    """
+    if backend == "json":
+        return json.loads
+    if backend == "orjson":
+        try:
+            import orjson
+        except ImportError as err:
+            raise ValueError(
+                "The 'orjson' JSON backend requires the orjson package, install it with `pip install orjson`."
+            ) from err
+        return orjson.loads
+    raise ValueError(
+        f"The JSON backend must be one of {JSON_BACKENDS}, not '{backend}'."
+    )
+
+
+def _import_pyarrow():
+    """Import the optional pyarrow package."""
+    try:
+        import pyarrow
+    except ImportError as err:
+        raise ValueError(
+            "Reading Parquet and Arrow files or using the 'pyarrow' csv engine requires the pyarrow package, install it with `pip install pyarrow`."
+        ) from err
+    return pyarrow
+
+
+def get_table_format(path):
+    """Get the format of a table from the extension of its file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the table.
+
+    Returns
+    -------
+    str
+        'parquet', 'feather' (Feather and Arrow IPC files), or 'csv' for any other extension.
+    """
+    return TABLE_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+def read_table(path, columns=None, categorical=None, engine="c"):
+    """Read a csv, Parquet, Feather, or Arrow IPC file, reading only the needed columns.
+
+    The format is chosen by the extension of the file (see `get_table_format`). Only the
+    requested columns that are present in the file are read. For csv files the header is
+    read first, and Parquet and Arrow files are memory mapped and only the requested
+    columns are loaded. Requested columns that are missing are left for the caller to
+    report.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+    columns: list or None
+        The names of the columns to read. If None, every column is read.
+    categorical: list or None
+        The names of string columns to convert to categoricals. They share one set of
+        categories so that they can be compared with each other (i.e. wildtype and mutant).
+    engine: str
+        The pandas csv parser, either 'c' or 'pyarrow' if it's installed. Only used for
+        csv files.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The columns of the file that were requested.
+    """
+    import pandas as pd
+
+    if engine not in CSV_ENGINES:
+        raise ValueError(
+            f"The csv engine must be one of {CSV_ENGINES}, not '{engine}'."
+        )
+
+    table_format = get_table_format(path)
+    if table_format == "csv":
+        if engine == "pyarrow":
+            _import_pyarrow()
+        usecols = None
+        if columns is not None:
+            header = pd.read_csv(path, nrows=0).columns
+            columns = set(columns)
+            usecols = [col for col in header if col in columns]
+        df = pd.read_csv(path, usecols=usecols, engine=engine)
+    else:
+        pyarrow = _import_pyarrow()
+        if table_format == "parquet":
+            import pyarrow.parquet as reader
+
+            names = reader.read_schema(path, memory_map=True).names
+        else:
+            import pyarrow.feather as reader
+
+            with pyarrow.ipc.open_file(pyarrow.memory_map(path)) as f:
+                names = f.schema.names
+        if columns is not None:
+            columns = set(columns)
+            names = [col for col in names if col in columns]
+        df = reader.read_table(path, columns=names, memory_map=True).to_pandas()
+
+    # Only convert string columns so that the values don't change type
+    categorical_cols = [
+        col
+        for col in categorical or []
+        if col in df.columns and _is_string_column(df[col])
+    ]
+    if categorical_cols:
+        categories = sorted(
+            set().union(*(df[col].dropna().unique() for col in categorical_cols))
+        )
+        for col in categorical_cols:
+            df[col] = df[col].astype(pd.CategoricalDtype(categories))
+
+    return df
+
+
+def read_table_chunks(path, columns=None, chunksize=TABLE_CHUNK_SIZE):
+    """Read a csv, Parquet, Feather, or Arrow IPC file a chunk of rows at a time.
+
+    Like `read_table`, only the requested columns that are present in the file are read,
+    but only one chunk of rows is in memory at once.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+    columns: list or None
+        The names of the columns to read. If None, every column is read.
+    chunksize: int
+        The most rows in each chunk.
+
+    Yields
+    ------
+    pandas.DataFrame
+        The requested columns of the next chunk of rows. At least one (possibly empty)
+        chunk is yielded so that the columns of the file can always be checked.
+    """
+    import pandas as pd
+
+    table_format = get_table_format(path)
+    if table_format == "csv":
+        names = pd.read_csv(path, nrows=0).columns
+    else:
+        pyarrow = _import_pyarrow()
+        if table_format == "parquet":
+            import pyarrow.parquet
+
+            f = pyarrow.parquet.ParquetFile(path, memory_map=True)
+            schema = f.schema_arrow
+        else:
+            f = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+            schema = f.schema
+        names = schema.names
+    if columns is not None:
+        columns = set(columns)
+        names = [col for col in names if col in columns]
+
+    if table_format == "csv":
+        with pd.read_csv(path, usecols=names, chunksize=chunksize) as chunks:
+            yield from _nonempty_chunks(chunks, lambda: pd.DataFrame(columns=names))
+    elif table_format == "parquet":
+        batches = f.iter_batches(batch_size=chunksize, columns=names)
+        yield from _nonempty_chunks(
+            (batch.to_pandas() for batch in batches),
+            lambda: schema.empty_table().select(names).to_pandas(),
+        )
+    else:
+        # Record batches are as large as they were written, so split them into chunks
+        batches = (
+            batch.select(names).slice(offset, chunksize)
+            for batch in map(f.get_batch, range(f.num_record_batches))
+            for offset in range(0, batch.num_rows, chunksize)
+        )
+        yield from _nonempty_chunks(
+            (batch.to_pandas() for batch in batches),
+            lambda: schema.empty_table().select(names).to_pandas(),
+        )
+
+
+def _nonempty_chunks(chunks, make_empty):
+    """Yield the chunks of a table, or one empty chunk if there aren't any rows."""
+    empty = True
+    for chunk in chunks:
+        empty = False
+        yield chunk
+    if empty:
+        yield make_empty()
+
+
+def _is_string_column(values):
+    """Check whether a column holds strings, including categoricals of strings."""
+    import pandas as pd
+    from pandas.api.types import is_string_dtype
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return is_string_dtype(values.cat.categories)
+    return is_string_dtype(values)
+
+
+def write_json(obj, f, backend="json"):
+    """Write an object to a file as JSON with sorted keys.
+
+    The output is identical to `json.dump(obj, f, sort_keys=True)` except that any
+    pandas.DataFrame in the object is written as a list of records, the same as
+    `json.loads(df.to_json(orient="records"))` would be, without converting every
+    row into a dictionary first. Any pandas.Series is written as a list of values
+    the same way.
+
+    Parameters
+    ----------
+    obj: dict, pandas.DataFrame, pandas.Series, or any JSON serializable object
+        The object to write.
+    f: file
+        A file opened for writing text.
+    backend: str
+        The JSON library used to decode the values encoded by pandas, 'json' or 'orjson'.
+    """
+    import pandas as pd
+
+    if isinstance(obj, pd.DataFrame):
+        write_records(obj, f, backend)
+    elif isinstance(obj, pd.Series):
+        write_values(obj, f, backend)
+    elif isinstance(obj, dict) and all(isinstance(key, str) for key in obj):
+        f.write("{")
+        for i, key in enumerate(sorted(obj)):
+            if i:
+                f.write(", ")
+            f.write(encode_basestring_ascii(key) + ": ")
+            write_json(obj[key], f, backend)
+        f.write("}")
+    else:
+        json.dump(obj, f, sort_keys=True)
+
+
+def write_records(df, f, backend="json"):
+    """Write a dataframe to a file as a JSON list of records with sorted keys.
+
+    The values are encoded by pandas, so they're rounded the same way as in
+    `df.to_json(orient="records")`, and then each column is encoded at once and the
+    rows are written straight to the file a chunk of rows at a time.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        The dataframe to write.
+    f: file
+        A file opened for writing text.
+    backend: str
+        The JSON library used to decode the values encoded by pandas, 'json' or 'orjson'.
+    """
+    loads = get_json_loads(backend)
+    columns = sorted(df.columns)
+    row_template = (
+        "{"
+        + ", ".join(
+            encode_basestring_ascii(col).replace("%", "%%") + ": %s" for col in columns
+        )
+        + "}"
+    )
+    f.write("[")
+    for start in range(0, len(df), RECORDS_CHUNK_SIZE):
+        chunk = df.iloc[start : start + RECORDS_CHUNK_SIZE]
+        encoded_columns = [
+            _encode_values(loads(chunk[col].to_json(orient="values")))
+            for col in columns
+        ]
+        if start:
+            f.write(", ")
+        # The columns are from the same chunk, so they have the same length
+        rows = zip(*encoded_columns)  # noqa: B905
+        f.write(", ".join([row_template % row for row in rows]))
+    f.write("]")
+
+
+def write_values(series, f, backend="json"):
+    """Write a series to a file as a JSON list of values.
+
+    Parameters
+    ----------
+    series: pandas.Series
+        The series to write.
+    f: file
+        A file opened for writing text.
+    backend: str
+        The JSON library used to decode the values encoded by pandas, 'json' or 'orjson'.
+    """
+    loads = get_json_loads(backend)
+    f.write("[")
+    for start in range(0, len(series), RECORDS_CHUNK_SIZE):
+        chunk = series.iloc[start : start + RECORDS_CHUNK_SIZE]
+        if start:
+            f.write(", ")
+        f.write(", ".join(_encode_values(loads(chunk.to_json(orient="values")))))
+    f.write("]")
+
+
+def encode_columnar(mut_metric_df, alphabet, condition_col=None, conditions=None):
+    """Encode the mutation data as one array per column.
+
+    The wildtype and mutant columns are encoded as the index of each amino acid in the
+    alphabet and the condition column is encoded as the index of each condition in the
+    list of conditions.
+
+    Parameters
+    ----------
+    mut_metric_df: pandas.DataFrame
+        The mutation data with 'reference_site', 'wildtype', and 'mutant' columns.
+    alphabet: list
+        The amino acids that the wildtype and mutant columns are encoded against.
+    condition_col: str or None
+        The name of the condition column if there is one.
+    conditions: list or None
+        The conditions that the condition column is encoded against.
+
+    Returns
+    -------
+    columns: dict of pandas.Series
+        The encoded values of each column.
+    schema: dict
+        A description of the layout with the schema version and the list that each
+        encoded column is encoded against.
+    """
+    # Use the first position of each amino acid in case the alphabet repeats one
+    alphabet_codes = {aa: i for i, aa in reversed(list(enumerate(alphabet)))}
+    encoded_columns = {"wildtype": ("alphabet", alphabet_codes)}
+    encoded_columns["mutant"] = encoded_columns["wildtype"]
+    if condition_col:
+        encoded_columns[condition_col] = (
+            "conditions",
+            {condition: i for i, condition in enumerate(conditions)},
+        )
+
+    columns = {}
+    for col in mut_metric_df.columns:
+        if col in encoded_columns:
+            codes = mut_metric_df[col].map(encoded_columns[col][1])
+            columns[col] = codes.astype(int).reset_index(drop=True)
+        else:
+            columns[col] = mut_metric_df[col].reset_index(drop=True)
+
+    schema = {
+        "layout": "columnar",
+        "version": COLUMNAR_SCHEMA_VERSION,
+        "encoded_columns": {col: encoded_columns[col][0] for col in encoded_columns},
+    }
+    return columns, schema
+
+
+def decode_columnar(experiment_dict):
+    """Decode columnar mutation data back into a list of records.
+
+    Parameters
+    ----------
+    experiment_dict: dict
+        A dataset loaded from a JSON file with columnar mutation data.
+
+    Returns
+    -------
+    list of dict
+        The mutation data as a list of records, the same as the default layout.
+
+    Raises
+    ------
+    ValueError
+        If the version of the layout isn't supported or the columns have different
+        lengths.
+    """
+    schema = experiment_dict["mut_metric_df_schema"]
+    if schema["version"] > COLUMNAR_SCHEMA_VERSION:
+        raise ValueError(
+            f"Version {schema['version']} of the columnar layout isn't supported."
+        )
+    columns = dict(experiment_dict["mut_metric_df"])
+    _check_column_lengths(columns, "columnar mutation data")
+    for col, values_list in schema["encoded_columns"].items():
+        values = experiment_dict[values_list]
+        columns[col] = [values[code] for code in columns[col]]
+    names = list(columns)
+    # The column lengths were checked above
+    rows = zip(*columns.values())  # noqa: B905
+    return [dict(zip(names, row)) for row in rows]  # noqa: B905
+
+
+def _check_column_lengths(columns, name):
+    """Check that the columns of a columnar layout have the same length."""
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"The columns of the {name} have different lengths.")
+
+
+def encode_compact_sitemap(sitemap_df):
+    """Encode the sitemap as parallel arrays ordered by the sequential sites.
+
+    Instead of an object per reference site, there is an array for each column of the
+    sitemap. The chains column is encoded as the index of each unique value of chains
+    in a table of the chains.
+
+    Parameters
+    ----------
+    sitemap_df: pandas.DataFrame
+        The formatted sitemap with 'reference_site', 'protein_site', 'sequential_site',
+        and 'chains' columns.
+
+    Returns
+    -------
+    sitemap: dict of list
+        The values of each column in order of the sequential sites.
+    chains: list
+        The unique values of the chains column in order of their first site.
+    schema: dict
+        A description of the layout with the schema version and the list that each
+        encoded column is encoded against.
+    """
+    import pandas as pd
+
+    sitemap_df = sitemap_df.sort_values("sequential_site", kind="stable")
+    chain_codes, chains = pd.factorize(sitemap_df["chains"], use_na_sentinel=False)
+    sitemap = {
+        col: sitemap_df[col].tolist()
+        for col in ["reference_site", "protein_site", "sequential_site"]
+    }
+    sitemap["chains"] = chain_codes.tolist()
+
+    schema = {
+        "layout": "compact",
+        "version": SITEMAP_SCHEMA_VERSION,
+        "encoded_columns": {"chains": "sitemap_chains"},
+    }
+    return sitemap, chains.tolist(), schema
+
+
+def decode_compact_sitemap(experiment_dict):
+    """Decode a compact sitemap back into an object per reference site.
+
+    Parameters
+    ----------
+    experiment_dict: dict
+        A dataset loaded from a JSON file with a compact sitemap.
+
+    Returns
+    -------
+    dict
+        The sitemap keyed by reference site, the same as the default layout once it's
+        loaded from JSON (so the reference sites are strings).
+
+    Raises
+    ------
+    ValueError
+        If the version of the layout isn't supported or the columns have different
+        lengths.
+    """
+    schema = experiment_dict["sitemap_schema"]
+    if schema["version"] > SITEMAP_SCHEMA_VERSION:
+        raise ValueError(
+            f"Version {schema['version']} of the compact sitemap isn't supported."
+        )
+    columns = dict(experiment_dict["sitemap"])
+    _check_column_lengths(columns, "compact sitemap")
+    for col, values_list in schema["encoded_columns"].items():
+        values = experiment_dict[values_list]
+        columns[col] = [values[code] for code in columns[col]]
+    reference_sites = columns.pop("reference_site")
+    names = list(columns)
+    # The column lengths were checked above
+    rows = zip(reference_sites, zip(*columns.values()))  # noqa: B905
+    sitemap = {}
+    for site, row in rows:
+        # Object keys in JSON are strings
+        key = site if isinstance(site, str) else json.dumps(site)
+        sitemap[key] = dict(zip(names, row))  # noqa: B905
+    return sitemap
+
+
+def _encode_values(values):
+    """Encode a list of values the same way as the json module."""
+    types = {type(value) for value in values}
+    if types <= {float}:
+        return list(map(float.__repr__, values))
+    if types <= {float, type(None)}:
+        return ["null" if value is None else float.__repr__(value) for value in values]
+    if types <= {int}:
+        return list(map(int.__repr__, values))
+    if types <= {str}:
+        return list(map(encode_basestring_ascii, values))
+    return [json.dumps(value, sort_keys=True) for value in values]
+
+
+def hash_file(path):
+    """Hash the content of a file with SHA-256.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+
+    Returns
+    -------
+    str
+        The hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_fingerprint(options, files):
+    """Fingerprint the options and input files that an output file is made from.
+
+    The fingerprint changes if any option, the content of any file, or the version of
+    configure-dms-viz changes.
+
+    Parameters
+    ----------
+    options: dict
+        The options the output is made with. Values that aren't JSON serializable are
+        converted to strings.
+    files: dict
+        A list of the paths to the input files for each option that takes files.
+
+    Returns
+    -------
+    str
+        The hex digest of the fingerprint.
+    """
+    try:
+        version = importlib.metadata.version("configure-dms-viz")
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    content = {
+        "version": version,
+        "options": options,
+        "files": {
+            name: [hash_file(path) for path in paths] for name, paths in files.items()
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def is_up_to_date(output, fingerprint):
+    """Check whether an output file was made with a fingerprint and hasn't changed since.
+
+    Parameters
+    ----------
+    output: str
+        The path to the output file.
+    fingerprint: str
+        The fingerprint of the options and input files (see `get_fingerprint`).
+
+    Returns
+    -------
+    bool
+        True if the output file and its sidecar fingerprint file exist, the fingerprints
+        match, and the output is the same as when the fingerprint was written.
+    """
+    try:
+        with open(output + FINGERPRINT_EXTENSION, "r") as f:
+            recorded = json.load(f)
+        return recorded.get("fingerprint") == fingerprint and recorded.get(
+            "output"
+        ) == hash_file(output)
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def write_fingerprint(output, fingerprint):
+    """Record the fingerprint of an output file in a sidecar file next to it.
+
+    Parameters
+    ----------
+    output: str
+        The path to the output file.
+    fingerprint: str
+        The fingerprint of the options and input files (see `get_fingerprint`).
+    """
+    with open(output + FINGERPRINT_EXTENSION, "w") as f:
+        json.dump({"fingerprint": fingerprint, "output": hash_file(output)}, f)
+
+
+def remove_fingerprint(output):
+    """Remove the sidecar fingerprint file of an output file if there is one.
+
+    Parameters
+    ----------
+    output: str
+        The path to the output file.
+    """
+    try:
+        os.remove(output + FINGERPRINT_EXTENSION)
+    except FileNotFoundError:
+        pass
+
+
+def read_join_index(output):
+    """Read the index of the datasets in a joined JSON file.
+
+    The index is only returned if it was written for the current content of the
+    output file, see `join_json_files`.
+
+    Parameters
+    ----------
+    output: str
+        The path to the joined JSON file.
+
+    Returns
+    -------
+    dict or None
+        The index or None if there isn't an up to date index.
+    """
+    try:
+        with open(output + JOIN_INDEX_EXTENSION, "r") as f:
+            index = json.load(f)
+        if index.get("output") != hash_file(output):
+            return None
+        index["sources"], index["entries"]
+    except (OSError, ValueError, AttributeError, KeyError, TypeError):
+        return None
+    return index
+
+
+def join_json_files(
+    input_files, output, markdown_description=None, compress=None, incremental=False
+):
+    """Join JSON files of datasets into a single JSON file.
+
+    Each input file is parsed one at a time and its datasets are serialized to a
+    temporary spool file, so only one input file is in memory at once. The joined
+    file is written with sorted keys and is identical to dumping the combined
+    datasets with `json.dump(..., sort_keys=True)`. Compressed input files are
+    decompressed and the output can be compressed as it's written.
+
+    In incremental mode, an index of each dataset's source file hash and byte range
+    in the output is kept in a sidecar file next to the output. On the next join, the
+    datasets of input files that haven't changed are copied from the previous output
+    without being parsed and only the datasets of changed files are serialized again.
+
+    Parameters
+    ----------
+    input_files: list of str
+        Paths to the JSON files to join.
+    output: str
+        Path to save the joined JSON file to.
+    markdown_description: str or None
+        Optionally, markdown to include as a global description.
+    compress: str or None
+        The compression format of the output, see `get_compression`.
+    incremental: bool
+        If True, reuse the datasets of unchanged input files from the previous output
+        and write an index of the datasets next to the output.
+
+    Returns
+    -------
+    list of str
+        The names of the datasets in the joined file.
+
+    Raises
+    ------
+    ValueError
+        If the same dataset name is in more than one file.
+    """
+    index = read_join_index(output) if incremental else None
+    # Don't leave an index that doesn't match the output if joining fails part way through
+    remove_join_index(output)
+
+    with tempfile.TemporaryFile() as spool:
+        # The source file hash, the file that the dataset is in (the spool or the
+        # previous output), and the offset and length of each dataset
+        entries = {}
+        # The names of the datasets in each source file
+        sources = {}
+
+        def add_entry(name, source, location, offset, length):
+            # Only the dataset names need to be unique, a later description replaces an earlier one
+            if name in entries and name != "markdown_description":
+                raise ValueError(
+                    f"Names of the datasets are not unique. '{name}' is in more than one file."
+                )
+            entries[name] = (source, location, offset, length)
+
+        def spool_entry(name, value, source=None):
+            offset = spool.tell()
+            spool.write(json.dumps(value, sort_keys=True).encode())
+            add_entry(name, source, "spool", offset, spool.tell() - offset)
+
+        if markdown_description is not None:
+            spool_entry("markdown_description", markdown_description)
+
+        for file_path in input_files:
+            source = hash_file(file_path) if incremental else None
+            names = index["sources"].get(source) if index is not None else None
+            # Reuse the datasets of an unchanged file unless one of them was replaced
+            # by a later description in the previous output
+            if names is not None and all(
+                index["entries"].get(name, [None])[0] == source for name in names
+            ):
+                for name in names:
+                    _, offset, length = index["entries"][name]
+                    add_entry(name, source, "output", offset, length)
+            else:
+                with open_input(file_path) as f:
+                    data = json.load(f)
+                for name in data:
+                    spool_entry(name, data[name], source)
+                names = list(data)
+                del data
+            if incremental:
+                sources[source] = names
+
+        # Copy the datasets in order of their names. The datasets of the previous
+        # output are copied from it, so the new output is written to a temporary file
+        reuse = any(entry[1] == "output" for entry in entries.values())
+        tmp_path = f"{output}.{os.getpid()}.tmp" if reuse else output
+        new_entries = {}
+        try:
+            with contextlib.ExitStack() as stack:
+                previous = (
+                    stack.enter_context(open_input(output, "rb")) if reuse else None
+                )
+                f = stack.enter_context(
+                    open_output(tmp_path, "wb", get_compression(output, compress))
+                )
+                # The position in the decompressed output
+                position = 0
+                for i, name in enumerate(sorted(entries)):
+                    key = (b", " if i else b"{") + json.dumps(name).encode() + b": "
+                    f.write(key)
+                    position += len(key)
+                    source, location, offset, length = entries[name]
+                    # The datasets of the previous output are sorted by name, so it's only read forwards
+                    src = spool if location == "spool" else previous
+                    src.seek(offset)
+                    _copy_bytes(src, f, length)
+                    new_entries[name] = [source, position, length]
+                    position += length
+                f.write(b"}" if entries else b"{}")
+            if reuse:
+                os.replace(tmp_path, output)
+        except BaseException:
+            if reuse and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    if incremental:
+        with open(output + JOIN_INDEX_EXTENSION, "w") as f:
+            json.dump(
+                {
+                    "output": hash_file(output),
+                    "sources": sources,
+                    "entries": new_entries,
+                },
+                f,
+            )
+
+    return sorted(entries)
+
+
+def remove_join_index(output):
+    """Remove the sidecar index file of a joined JSON file if there is one.
+
+    Parameters
+    ----------
+    output: str
+        The path to the joined JSON file.
+    """
+    try:
+        os.remove(output + JOIN_INDEX_EXTENSION)
+    except FileNotFoundError:
+        pass
+
+
+def _copy_bytes(src, dst, length):
+    """Copy length bytes from the current position of one file to another."""
+    while length > 0:
+        block = src.read(min(COPY_BUFFER_SIZE, length))
+        if not block:
+            raise EOFError("Unexpected end of file while copying.")
+        dst.write(block)
+        length -= len(block)
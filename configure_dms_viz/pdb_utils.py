@@ -1,10 +1,67 @@
 import os
-import requests
+import gzip
 import warnings
+import functools
 import Bio.PDB
 import pandas as pd
 from Bio.SeqUtils import seq1
 from io import StringIO
+from .structure_cache import fetch_structure_text
+from .profiling import stage
+
+# The names of the residues that make a chain a polymer chain
+POLYMER_RESIDUES = frozenset(Bio.PDB.Polypeptide.protein_letters_3to1)
+
+# The atoms that can be kept when a structure is slimmed
+SLIM_ATOMS = ["all", "heavy", "backbone"]
+
+# The names of the protein and nucleic acid backbone atoms
+BACKBONE_ATOMS = frozenset(
+    ["N", "CA", "C", "O", "P", "OP1", "OP2", "O5'", "C5'", "C4'", "C3'", "O3'"]
+)
+
+# The backbone atoms of protein and nucleic acid residues. Hetero residues in polymer
+# chains with one of these sets of atoms are modified residues (i.e. selenomethionine)
+# rather than ligands
+RESIDUE_BACKBONES = [frozenset(["N", "CA", "C"]), frozenset(["P", "O5'", "C5'"])]
+
+# The extensions of the local structure files that can be read and their formats
+STRUCTURE_EXTENSIONS = {
+    ".pdb": "pdb",
+    ".pdb.gz": "pdb",
+    ".cif": "cif",
+    ".cif.gz": "cif",
+    ".bcif": "bcif",
+    ".bcif.gz": "bcif",
+}
+
+
+def get_structure_format(path):
+    """
+    Get the format of a local structure file from its extension.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    str or None
+        'pdb', 'cif', or 'bcif' (BinaryCIF), or None if the extension isn't one of
+        `STRUCTURE_EXTENSIONS`.
+    """
+    extension = _get_structure_extension(path)
+    return None if extension is None else STRUCTURE_EXTENSIONS[extension]
+
+
+def _get_structure_extension(path):
+    """Get the extension of a structure file from `STRUCTURE_EXTENSIONS`, or None."""
+    lower_path = path.lower()
+    for extension in STRUCTURE_EXTENSIONS:
+        if lower_path.endswith(extension):
+            return extension
+    return None
 
 
 def get_structure(pdb_input):
@@ -12,14 +69,17 @@ def get_structure(pdb_input):
     Fetch a PDB structure from the RCSB PDB web service or load it from a local file.
 
     This function takes a string as input, which should either be a 4-character PDB ID or
-    a path to a local PDB file. The function fetches the structure with the specified PDB ID
-    from the RCSB PDB web service, or reads the structure from the specified local PDB file,
-    and returns a Bio.PDB structure object.
+    a path to a local structure file. The function fetches the structure with the specified
+    PDB ID from the RCSB PDB web service, or reads the structure from the specified local
+    PDB, mmCIF, or BinaryCIF file (optionally gzipped), and returns a Bio.PDB structure
+    object. Downloaded structures are read from and added to
+    the on-disk structure cache if one is configured (see `structure_cache.configure_cache`).
 
     Parameters
     ----------
     pdb_input : str
-        A string that is either a 4-character PDB ID or a path to a local .pdb file.
+        A string that is either a 4-character PDB ID or a path to a local .pdb, .pdb.gz,
+        .cif, .cif.gz, .bcif, or .bcif.gz file.
 
     Returns
     -------
@@ -29,78 +89,494 @@ def get_structure(pdb_input):
     Raises
     ------
     ValueError
-        If the pdb_input is neither a valid PDB ID nor a local PDB file path.
-        If there was an error reading the local PDB file or parsing the PDB content.
+        If the pdb_input is neither a valid PDB ID nor a local structure file path.
+        If there was an error reading the local structure file or parsing the PDB content.
         If there was an error downloading the PDB file from the RCSB PDB web service.
+        If the structure isn't cached and downloads are disabled in offline mode.
+
+    """
+    structure, _ = load_structure(pdb_input)
+    return structure
+
+
+def load_structure(pdb_input):
+    """
+    Load a PDB structure and its raw text, reusing structures loaded earlier in this session.
+
+    The structure is fetched or read and parsed once. The parsed structure and the text it
+    was parsed from are kept in memory, so later calls with the same PDB ID, or the same
+    unmodified local file, don't download or parse it again.
+
+    Parameters
+    ----------
+    pdb_input : str
+        A string that is either a 4-character PDB ID or a path to a local structure file
+        (see `get_structure`).
 
+    Returns
+    -------
+    structure : Bio.PDB.Structure.Structure
+        A Bio.PDB structure object.
+    text : str or None
+        The raw text of the structure (mmCIF for PDB IDs and the decompressed text for
+        local PDB files). It's None for local mmCIF and BinaryCIF files, which are parsed
+        as they're read instead of being kept in memory.
+
+    Raises
+    ------
+    ValueError
+        If the structure couldn't be read, downloaded, or parsed (see `get_structure`).
     """
 
+    # Local files are keyed by their modification time so that edits are picked up
+    if os.path.isfile(pdb_input):
+        stat = os.stat(pdb_input)
+        file_stamp = (os.path.abspath(pdb_input), stat.st_mtime_ns, stat.st_size)
+    else:
+        file_stamp = None
+
+    return _load_structure(pdb_input, file_stamp)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_structure(pdb_input, file_stamp):
+    """Read and parse a structure, see `load_structure`."""
+
     # Check if the input is a local file path
-    if os.path.isfile(pdb_input) and pdb_input.endswith(".pdb"):
+    if file_stamp is not None and get_structure_format(pdb_input) is not None:
         try:
-            # Ignore warnings about discontinuous chains
-            with warnings.catch_warnings():
-                warnings.simplefilter(
-                    "ignore", category=Bio.PDB.PDBExceptions.PDBConstructionWarning
-                )
-                structure = Bio.PDB.PDBParser().get_structure(pdb_input[:-4], pdb_input)
+            structure, text = _read_structure_file(pdb_input)
         except Exception as e:
-            raise ValueError(f"Error reading PDB file {pdb_input}: {e}") from e
+            raise ValueError(f"Error reading structure file {pdb_input}: {e}") from e
     elif len(pdb_input) == 4 and pdb_input.isalnum():  # Check for a valid PDB ID format
-        # Try to fetch the structure from RCSB PDB
-        response = requests.get(f"https://files.rcsb.org/download/{pdb_input}.cif")
-        if response.status_code == 200:
-            try:
-                pdb_file_content = StringIO(response.text)
-                # Ignore warnings about discontinuous chains
-                with warnings.catch_warnings():
-                    warnings.simplefilter(
-                        "ignore", category=Bio.PDB.PDBExceptions.PDBConstructionWarning
-                    )
-                    structure = Bio.PDB.MMCIFParser().get_structure(
-                        pdb_input, pdb_file_content
-                    )
-            except Exception as e:
-                raise ValueError(
-                    f"Error parsing PDB content for {pdb_input}: {e}"
-                ) from e
-        else:
-            raise ValueError(
-                f"Failed to download {pdb_input} from the RCSB database. Status code: {response.status_code}"
-            )
+        # Try to get the structure from the cache or fetch it from RCSB PDB
+        with stage("fetch structure"):
+            text = fetch_structure_text(pdb_input)
+        try:
+            structure = _parse_structure(text, "cif", pdb_input)
+        except Exception as e:
+            raise ValueError(f"Error parsing PDB content for {pdb_input}: {e}") from e
     else:
         raise ValueError(
-            f"Invalid input: {pdb_input}. Please provide a valid PDB ID or a local PDB file path."
+            f"Invalid input: {pdb_input}. Please provide a valid PDB ID or the path to a"
+            f" local structure file ({', '.join(STRUCTURE_EXTENSIONS)})."
         )
 
+    return structure, text
+
+
+def _read_structure_file(path):
+    """
+    Read and parse a local structure file, see `load_structure`.
+
+    Gzipped files are decompressed as they're read. PDB files are read into memory
+    because their text can be embedded as is, mmCIF and BinaryCIF files are parsed
+    straight from the (decompressing) file handle.
+    """
+    fmt = get_structure_format(path)
+    name = os.path.basename(path)[: -len(_get_structure_extension(path))]
+    opener = gzip.open if path.lower().endswith(".gz") else open
+    if fmt == "pdb":
+        with stage("read structure"), opener(path, "rt") as f:
+            text = f.read()
+        return _parse_structure(text, "pdb", name), text
+    if fmt == "bcif":
+        with opener(path, "rb") as f:
+            return _parse_binary_cif(f, name), None
+    with opener(path, "rt") as f:
+        return _parse_structure(f, "cif", name), None
+
+
+def _import_binary_cif():
+    """Import msgpack and Biopython's BinaryCIF decoders, which need msgpack."""
+    try:
+        import msgpack
+        from Bio.PDB import binary_cif
+    except ImportError as err:
+        raise ValueError(
+            "Reading BinaryCIF (.bcif) files requires the msgpack package, install it with `pip install msgpack`."
+        ) from err
+    return msgpack, binary_cif
+
+
+def _parse_binary_cif(handle, name):
+    """
+    Parse a BinaryCIF file into a structure with the author chain IDs.
+
+    This builds the structure like Biopython's BinaryCIFParser, which names the chains
+    by their label_asym_id. The chains of the data, the included and excluded chains,
+    and the chains of PDB and mmCIF files are the author chain IDs (auth_asym_id), so
+    those are used instead. Label chains with the same author chain, i.e. a protein
+    and its ligands, are combined into one chain.
+    """
+    msgpack, binary_cif = _import_binary_cif()
+    with stage("parse structure"):
+        data = msgpack.unpack(handle, use_list=True)
+        columns = {
+            f"{category['name']}.{column['name']}": column
+            for data_block in data["dataBlocks"]
+            for category in data_block["categories"]
+            for column in category["columns"]
+        }
+        chain_column = columns.get(
+            "_atom_site.auth_asym_id", columns["_atom_site.label_asym_id"]
+        )
+
+        parser = binary_cif.BinaryCIFParser()
+        model_numbers = binary_cif._decode(columns["_atom_site.pdbx_PDB_model_num"])
+        chain_ids = binary_cif._decode(chain_column)
+        residue_ids = parser._get_residue_ids(columns)
+        component_ids = binary_cif._decode(columns["_atom_site.label_comp_id"])
+        atoms = parser._get_atoms(columns)
+
+        builder = Bio.PDB.StructureBuilder.StructureBuilder()
+        builder.init_structure(name)
+        model_count = 0
+        current = (None, None, None, None)
+        # Ignore warnings about discontinuous chains
+        with warnings.catch_warnings():
+            warnings.simplefilter(
+                "ignore", category=Bio.PDB.PDBExceptions.PDBConstructionWarning
+            )
+            for index, atom in enumerate(atoms):
+                model_number = model_numbers[index]
+                chain_id = chain_ids[index]
+                residue_id = residue_ids[index]
+                component_id = component_ids[index]
+                if model_number != current[0]:
+                    builder.init_model(model_count, model_number)
+                    model_count += 1
+                    current = (model_number, None, None, None)
+                if chain_id != current[1]:
+                    builder.init_chain(chain_id)
+                    current = (model_number, chain_id, None, None)
+                if (residue_id, component_id) != current[2:]:
+                    builder.init_residue(component_id, *residue_id)
+                    current = (model_number, chain_id, residue_id, component_id)
+                builder.init_atom(**atom)
+        return builder.get_structure()
+
+
+def _parse_structure(source, fmt, name):
+    """
+    Parse the text of a PDB ('pdb') or mmCIF ('cif') file into a structure.
+
+    The source is the text or an open text handle, which is read line by line.
+    """
+    parser = Bio.PDB.PDBParser() if fmt == "pdb" else Bio.PDB.MMCIFParser()
+    if isinstance(source, str):
+        source = StringIO(source)
+    # Ignore warnings about discontinuous chains
+    with warnings.catch_warnings(), stage("parse structure"):
+        warnings.simplefilter(
+            "ignore", category=Bio.PDB.PDBExceptions.PDBConstructionWarning
+        )
+        return parser.get_structure(name, source)
+
+
+class PreparedStructure:
+    """
+    A parsed structure that's prepared once to format many datasets against it.
+
+    The parsed structure, its raw text, its polymer chains, and the index of its
+    residues are kept together. Pass it as the structure of
+    `configure_dms_viz.make_experiment_dictionary` or to the checks in this module
+    instead of a PDB ID or path so that the structure is only loaded and indexed once.
+
+    Parameters
+    ----------
+    structure : Bio.PDB.Structure.Structure
+        The parsed structure.
+    text : str or None
+        The raw text the structure was parsed from, or None if it wasn't kept (i.e. for
+        local mmCIF and BinaryCIF files, see `load_structure`).
+    fmt : str
+        The format the structure was parsed from, 'pdb', 'cif', or 'bcif'.
+    pdb_id : str or None
+        The PDB ID of the structure if it's from the RCSB PDB. The ID is embedded in
+        the visualization instead of the text.
+
+    Attributes
+    ----------
+    polymer_chains : list
+        The IDs of the polymer chains (see `get_polymer_chains`).
+    residue_index : pandas.DataFrame
+        The wildtype residue at each chain and protein site (see `get_residue_index`).
+    """
+
+    def __init__(self, structure, text, fmt="pdb", pdb_id=None):
+        if fmt not in {"pdb", "cif", "bcif"}:
+            raise ValueError(
+                f"The format must be 'pdb', 'cif', or 'bcif', not '{fmt}'."
+            )
+        self.structure = structure
+        self.text = text
+        self.fmt = fmt
+        self.pdb_id = pdb_id
+        self.polymer_chains = get_polymer_chains(structure)
+        self.residue_index = get_residue_index(structure)
+
+    @classmethod
+    def load(cls, pdb_input):
+        """
+        Prepare a structure from a PDB ID or the path to a local structure file.
+
+        Structures loaded earlier in this session are reused (see `load_structure`).
+
+        Parameters
+        ----------
+        pdb_input : str
+            A string that is either a 4-character PDB ID or a path to a local structure
+            file (see `get_structure`).
+
+        Returns
+        -------
+        PreparedStructure
+            The prepared structure.
+        """
+        structure, text = load_structure(pdb_input)
+        if os.path.isfile(pdb_input):
+            return cls(structure, text, get_structure_format(pdb_input))
+        return cls(structure, text, "cif", pdb_id=pdb_input)
+
+    @classmethod
+    def from_pdb_id(cls, pdb_id):
+        """
+        Prepare a structure from the RCSB PDB or the structure cache by its PDB ID.
+
+        Parameters
+        ----------
+        pdb_id : str
+            A 4-character PDB ID.
+
+        Returns
+        -------
+        PreparedStructure
+            The prepared structure.
+        """
+        if os.path.isfile(pdb_id) or not (len(pdb_id) == 4 and pdb_id.isalnum()):
+            raise ValueError(f"Invalid input: {pdb_id}. Please provide a valid PDB ID.")
+        return cls.load(pdb_id)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Prepare a structure from a local PDB, mmCIF, or BinaryCIF file (see `get_structure`).
+
+        Parameters
+        ----------
+        path : str
+            The path to the file.
+
+        Returns
+        -------
+        PreparedStructure
+            The prepared structure.
+        """
+        if not os.path.isfile(path):
+            raise ValueError(f"The structure file {path} doesn't exist.")
+        return cls.load(path)
+
+    @classmethod
+    def from_text(cls, text, fmt="pdb", name="structure"):
+        """
+        Prepare a structure from the text of a PDB or mmCIF file.
+
+        Parameters
+        ----------
+        text : str
+            The text of the file.
+        fmt : str
+            The format of the text, 'pdb' or 'cif'.
+        name : str
+            The name of the structure.
+
+        Returns
+        -------
+        PreparedStructure
+            The prepared structure.
+        """
+        if fmt not in {"pdb", "cif"}:
+            raise ValueError(f"The format must be 'pdb' or 'cif', not '{fmt}'.")
+        try:
+            structure = _parse_structure(text, fmt, name)
+        except Exception as e:
+            raise ValueError(f"Error parsing the structure {name}: {e}") from e
+        return cls(structure, text, fmt)
+
+    def __repr__(self):
+        source = self.pdb_id or f"{self.fmt} text"
+        return f"PreparedStructure({source}, chains={self.polymer_chains})"
+
+    def to_pdb_text(self):
+        """
+        Get the structure as the text of a PDB file.
+
+        Returns
+        -------
+        str
+            The raw text for PDB files, otherwise the whole structure written as a PDB file.
+
+        Raises
+        ------
+        ValueError
+            If the structure can't be written as a PDB file.
+        """
+        if self.fmt == "pdb" and self.text is not None:
+            return self.text
+        io = Bio.PDB.PDBIO()
+        io.set_structure(self.structure)
+        f = StringIO()
+        try:
+            io.save(f)
+        except Bio.PDB.PDBExceptions.PDBIOException as e:
+            raise ValueError(f"Error writing the structure as a PDB file: {e}") from e
+        return f.getvalue()
+
+    def to_cif_text(self):
+        """
+        Get the structure as the text of an mmCIF file.
+
+        Unlike PDB files, mmCIF files fit structures with any number of atoms and
+        chains with long IDs.
+
+        Returns
+        -------
+        str
+            The raw text for mmCIF text, otherwise the whole structure written as an
+            mmCIF file.
+        """
+        if self.fmt == "cif" and self.text is not None:
+            return self.text
+        io = Bio.PDB.MMCIFIO()
+        io.set_structure(self.structure)
+        f = StringIO()
+        io.save(f)
+        return f.getvalue()
+
+
+def _as_structure(structure):
+    """Get the Bio.PDB structure of a structure or a `PreparedStructure`."""
+    if isinstance(structure, PreparedStructure):
+        return structure.structure
     return structure
 
 
+def get_polymer_chains(structure):
+    """
+    Get the IDs of the polymer chains in a structure.
+
+    A chain is a polymer chain if any of its residues in the first model is a standard
+    residue. The chains are found once and cached on the structure.
+
+    Parameters
+    ----------
+    structure : Bio.PDB.Structure.Structure or PreparedStructure
+        A Bio.PDB structure object.
+
+    Returns
+    -------
+    list
+        The IDs of the polymer chains in the order they're in the structure.
+    """
+    structure = _as_structure(structure)
+    polymer_chains = structure.xtra.get("polymer_chains")
+    if polymer_chains is None:
+        polymer_chains = [
+            chain.id
+            for chain in structure[0]
+            if any(residue.get_resname() in POLYMER_RESIDUES for residue in chain)
+        ]
+        structure.xtra["polymer_chains"] = polymer_chains
+    return list(polymer_chains)
+
+
 def check_chains(structure, chains):
     """
     Check that the user supplied data chains are in the structure.
 
     Parameters
     ----------
-    structure : Bio.PDB.Structure.Structure
+    structure : Bio.PDB.Structure.Structure or PreparedStructure
         A Bio.PDB structure object.
 
     chains : list
-        A list of chain IDs.
+        A list of chain IDs. 'polymer' stands for the polymer chains in the structure.
 
     Raises
     ------
     ValueError
         If the chains are not in the structure.
     """
+    structure = _as_structure(structure)
+    # The polymer chains are in the structure by definition
+    chains = set(chains) - {"polymer"}
     # Check that the chains are in the structure
-    missing_chains = set(chains) - {chain.id for chain in structure[0]}
+    missing_chains = chains - {chain.id for chain in structure[0]}
     if missing_chains:
         raise ValueError(
             f"Data chain(s): {missing_chains} are not present in the PDB structure."
         )
 
 
+def get_residue_index(structure, chains=None):
+    """
+    Get a lookup table of the one-letter wildtype residue at each site in a structure.
+
+    The index covers the standard (non-hetero) residues in the first model of the
+    structure and is keyed by chain and protein site. The protein site includes the
+    insertion code if there is one (i.e. '100A'). The index is built once and cached
+    on the structure, so checking many datasets against the same structure doesn't
+    walk the model again.
+
+    Parameters
+    ----------
+    structure : Bio.PDB.Structure.Structure or PreparedStructure
+        A Bio.PDB structure object.
+    chains : list or None
+        Optionally, a list of chain IDs to restrict the index to.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe with 'chain', 'protein_site', and 'residue' columns.
+
+    Raises
+    ------
+    KeyError
+        If any of the chains are not present in the structure.
+    """
+    structure = _as_structure(structure)
+
+    # Build the index for every chain in the model the first time it's requested
+    residue_index = structure.xtra.get("residue_index")
+    if residue_index is None:
+        residue_index = pd.DataFrame(
+            [
+                (
+                    chain.id,
+                    (str(residue.id[1]) + residue.id[2]).strip(),
+                    seq1(residue.resname),
+                )
+                for chain in structure[0]
+                for residue in chain
+                if residue.id[0] == " "
+            ],
+            columns=["chain", "protein_site", "residue"],
+        )
+        structure.xtra["residue_index"] = residue_index
+
+    if chains is None:
+        return residue_index
+
+    # Subset the index to the requested chains
+    missing_chains = set(chains) - {chain.id for chain in structure[0]}
+    if missing_chains:
+        raise KeyError(f"Chain(s): {missing_chains} are not present in the structure.")
+
+    return residue_index[residue_index["chain"].isin(chains)]
+
+
 def check_wildtype_residues(structure, mut_metric_df, sitemap_df, excluded_chains):
     """
     Checks the percentage of wildtype residues in the DataFrame that match those in a provided PDB structure.
@@ -112,7 +588,7 @@ def check_wildtype_residues(structure, mut_metric_df, sitemap_df, excluded_chain
 
     Parameters
     ----------
-    structure : Bio.PDB.Structure
+    structure : Bio.PDB.Structure or PreparedStructure
         The structure obtained from a PDB file parsed by Bio.PDB.
     mut_metric_df : pandas.DataFrame
         DataFrame containing mutation metric data. Expected to have 'reference_site' and 'wildtype' columns.
@@ -135,6 +611,7 @@ def check_wildtype_residues(structure, mut_metric_df, sitemap_df, excluded_chain
     KeyError
         If a specified protein site or chain is not found in the structure.
     """
+    structure = _as_structure(structure)
 
     # Join the protein sites and chains with the wiltype residues in the mut_metric_df by the reference sites
     wildtype_df = (
@@ -146,56 +623,56 @@ def check_wildtype_residues(structure, mut_metric_df, sitemap_df, excluded_chain
     )
 
     # If there was no list of chains given, infer the 'polymer' chains
-    standard_residues = [res for res in Bio.PDB.Polypeptide.protein_letters_3to1.keys()]
     if "polymer" in wildtype_df.chains.to_list():
-        polymer_chains = []
-        for chain in structure[0]:
-            chain_is_polymer = False
-            for residue in chain:
-                # Check if the residue is a standard protein/nucleic acid residue
-                if residue.get_resname() in standard_residues:
-                    chain_is_polymer = True
-                    break
-            if chain_is_polymer:
-                polymer_chains.append(chain.id)
+        polymer_chains = get_polymer_chains(structure)
         if excluded_chains:
             polymer_chains = list(set(polymer_chains) - set(excluded_chains.split(" ")))
 
-    # Iterate through each row and check if the wildtype residue matches the pdb residue
-    total_sites = 0
-    matching_residues = 0
-    missing_sites = 0
-    for _, site, chains, wildtype in wildtype_df.itertuples():
-        if chains == "polymer":
-            chains = polymer_chains
-        else:
-            chains = chains.split(" ")
-        total_sites += 1
-        matches_wildtype_at_site = []
-        site_not_in_structure = []
-        # Convert the structure object a dictionary to include insertion codes in the residue id
-        structure_dict = {
-            chain: {
-                (str(residue.id[1]) + residue.id[2]).strip(): seq1(residue.resname)
-                for residue in structure[0][chain]
-                if residue.id[0] == " "
-            }
-            for chain in chains
-        }
-        for chain in chains:
-            try:
-                residue = structure_dict[chain][str(site)]
-                if residue == wildtype.upper():
-                    matches_wildtype_at_site.append(True)
-                else:
-                    matches_wildtype_at_site.append(False)
-                site_not_in_structure.append(False)
-            except KeyError:
-                site_not_in_structure.append(True)
-        if matches_wildtype_at_site and all(matches_wildtype_at_site):
-            matching_residues += 1
-        if site_not_in_structure and all(site_not_in_structure):
-            missing_sites += 1
+    # Resolve the chains for each site into a list, there are only a handful of unique values
+    chains_to_list = {
+        chains: polymer_chains if chains == "polymer" else chains.split(" ")
+        for chains in wildtype_df["chains"].unique()
+    }
+
+    # Make one row per site and chain that the wildtype residue should be compared against
+    site_chains = (
+        wildtype_df.assign(
+            chain=wildtype_df["chains"].map(chains_to_list),
+            protein_site=wildtype_df["protein_site"].astype(str),
+            wildtype=wildtype_df["wildtype"].str.upper(),
+        )
+        .explode("chain")
+        .reset_index(names="site_id")
+    )
+
+    # Look up the residue in the structure at each site and chain
+    residue_index = get_residue_index(
+        structure, site_chains["chain"].dropna().unique().tolist()
+    )
+    site_chains = site_chains.merge(
+        residue_index, on=["chain", "protein_site"], how="left"
+    )
+    site_chains["in_structure"] = site_chains["residue"].notna()
+    site_chains["matches_wildtype"] = site_chains["in_structure"] & (
+        site_chains["residue"] == site_chains["wildtype"]
+    )
+
+    # A site matches if every chain it's present in matches and it's missing if it's in no chains
+    sites = site_chains.groupby("site_id").agg(
+        num_chains=("chain", "count"),
+        num_in_structure=("in_structure", "sum"),
+        num_matching=("matches_wildtype", "sum"),
+    )
+    total_sites = len(wildtype_df)
+    matching_residues = int(
+        (
+            (sites["num_in_structure"] > 0)
+            & (sites["num_matching"] == sites["num_in_structure"])
+        ).sum()
+    )
+    missing_sites = int(
+        ((sites["num_chains"] > 0) & (sites["num_in_structure"] == 0)).sum()
+    )
 
     # How many residues match at sites present in the structure?
     assert matching_residues <= total_sites - missing_sites
@@ -217,3 +694,205 @@ def check_wildtype_residues(structure, mut_metric_df, sitemap_df, excluded_chain
         total_matching_string,
         total_missing_string,
     )
+
+
+def _slim_chains(chain_ids, polymer_chains, included_chains, excluded_chains):
+    """The chains to keep when slimming a structure, see `slim_structure`."""
+    chains = set(polymer_chains)
+    if included_chains != "polymer":
+        chains |= set(included_chains.split(" "))
+    chains -= set(excluded_chains.split(" "))
+    return chains & set(chain_ids)
+
+
+def _keep_atom(name, element, atoms):
+    """Whether to keep an atom when slimming a structure, see `slim_structure`."""
+    if atoms == "backbone":
+        return name in BACKBONE_ATOMS
+    if atoms == "heavy":
+        return element not in {"H", "D"}
+    return True
+
+
+def _is_modified_residue(atom_names):
+    """Whether a hetero residue with these atoms is a modified residue of a polymer."""
+    return any(backbone <= atom_names for backbone in RESIDUE_BACKBONES)
+
+
+def _check_slim_atoms(atoms):
+    """Check the atoms to keep when slimming a structure."""
+    if atoms not in SLIM_ATOMS:
+        raise ValueError(
+            f"The atoms to keep must be one of {SLIM_ATOMS}, not '{atoms}'."
+        )
+
+
+class _SlimSelect(Bio.PDB.Select):
+    """Select the standard and modified residues of the chains to keep from the first model."""
+
+    def __init__(self, chains, polymer_chains, atoms):
+        self.chains = chains
+        self.polymer_chains = set(polymer_chains)
+        self.atoms = atoms
+
+    def accept_model(self, model):
+        return model is model.get_parent().child_list[0]
+
+    def accept_chain(self, chain):
+        return chain.id in self.chains
+
+    def accept_residue(self, residue):
+        if residue.id[0] == " ":
+            return True
+        # Other hetero residues in polymer chains are waters and ligands
+        return residue.get_parent().id in self.polymer_chains and _is_modified_residue(
+            {atom.get_id() for atom in residue}
+        )
+
+    def accept_atom(self, atom):
+        return _keep_atom(atom.get_id(), atom.element, self.atoms)
+
+
+def slim_structure(
+    structure,
+    included_chains="polymer",
+    excluded_chains="none",
+    atoms="heavy",
+    fmt="pdb",
+):
+    """
+    Write a reduced copy of a structure with only what's shown in the visualization.
+
+    The polymer chains and any included chains that aren't excluded are kept from the
+    first model. Waters, ligands, and other hetero residues are dropped, except for
+    modified residues in polymer chains (hetero residues with backbone atoms, i.e.
+    selenomethionine). Optionally, hydrogens or all but the backbone atoms are dropped
+    too.
+
+    Parameters
+    ----------
+    structure : Bio.PDB.Structure.Structure or PreparedStructure
+        A Bio.PDB structure object.
+    included_chains : str
+        A space separated list of the chains with data or 'polymer'.
+    excluded_chains : str
+        A space separated list of the chains to exclude or 'none'.
+    atoms : str
+        'all' to keep every atom, 'heavy' to drop hydrogens, or 'backbone' to only keep
+        the backbone atoms.
+    fmt : str
+        The format to write, 'pdb' or 'cif'.
+
+    Returns
+    -------
+    str
+        The text of the reduced structure.
+
+    Raises
+    ------
+    ValueError
+        If the atoms or format aren't valid or the structure can't be written as a PDB
+        file (i.e. the chain IDs are longer than one character).
+    """
+    structure = _as_structure(structure)
+    _check_slim_atoms(atoms)
+    if fmt not in {"pdb", "cif"}:
+        raise ValueError(f"The format must be 'pdb' or 'cif', not '{fmt}'.")
+
+    # Keep the polymer chains and the included chains unless they're excluded
+    polymer_chains = get_polymer_chains(structure)
+    chains = _slim_chains(
+        [chain.id for chain in structure[0]],
+        polymer_chains,
+        included_chains,
+        excluded_chains,
+    )
+
+    io = Bio.PDB.PDBIO() if fmt == "pdb" else Bio.PDB.MMCIFIO()
+    io.set_structure(structure)
+    f = StringIO()
+    try:
+        io.save(f, _SlimSelect(chains, polymer_chains, atoms))
+    except Bio.PDB.PDBExceptions.PDBIOException as e:
+        raise ValueError(f"Error writing the reduced structure: {e}") from e
+    return f.getvalue()
+
+
+def slim_pdb_text(
+    text, included_chains="polymer", excluded_chains="none", atoms="heavy"
+):
+    """
+    Reduce the text of a PDB file to only what's shown in the visualization.
+
+    This keeps the same atoms as `slim_structure`, but works on the lines of the file
+    so that nothing is lost to parsing (i.e. copies of a chain with the same ID and
+    residue numbers). Only the ATOM records, the HETATM records of modified residues in
+    polymer chains, and the TER records of the first model are kept.
+
+    Parameters
+    ----------
+    text : str
+        The text of a PDB file.
+    included_chains : str
+        A space separated list of the chains with data or 'polymer'.
+    excluded_chains : str
+        A space separated list of the chains to exclude or 'none'.
+    atoms : str
+        'all' to keep every atom, 'heavy' to drop hydrogens, or 'backbone' to only keep
+        the backbone atoms.
+
+    Returns
+    -------
+    str
+        The text of the reduced PDB file.
+    """
+    _check_slim_atoms(atoms)
+
+    # Only read the first model
+    lines = []
+    for line in text.splitlines():
+        if line.startswith("ENDMDL"):
+            break
+        if line.startswith(("ATOM  ", "HETATM", "TER")):
+            lines.append(line)
+
+    # Keep the polymer chains and the included chains unless they're excluded
+    chain_ids = {line[21:22] for line in lines}
+    polymer_chains = {
+        line[21:22] for line in lines if line[17:20].strip() in POLYMER_RESIDUES
+    }
+    chains = _slim_chains(chain_ids, polymer_chains, included_chains, excluded_chains)
+
+    # Find the modified residues, keyed by residue name, chain, and number
+    hetero_atom_names = {}
+    for line in lines:
+        if line.startswith("HETATM") and line[21:22] in polymer_chains:
+            hetero_atom_names.setdefault(line[17:27], set()).add(line[12:16].strip())
+    modified_residues = {
+        residue
+        for residue, atom_names in hetero_atom_names.items()
+        if _is_modified_residue(atom_names)
+    }
+
+    slim_lines = []
+    for line in lines:
+        if line.startswith("ATOM  ") or (
+            line.startswith("HETATM") and line[17:27] in modified_residues
+        ):
+            if line[21:22] not in chains:
+                continue
+            # Use the element column if it's there and otherwise the atom name
+            name = line[12:16].strip()
+            element = line[76:78].strip() or name.lstrip("0123456789")[:1]
+            if _keep_atom(name, element, atoms):
+                slim_lines.append(line)
+        # Keep the chain terminations after the atoms that are kept
+        elif (
+            line.startswith("TER")
+            and slim_lines
+            and slim_lines[-1].startswith(("ATOM", "HETATM"))
+        ):
+            if line[21:22].strip() in chains | {""}:
+                slim_lines.append(line)
+    slim_lines.append("END")
+    return "\n".join(slim_lines) + "\n"
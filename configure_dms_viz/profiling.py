@@ -0,0 +1,177 @@
+"""Record the wall time, peak memory, and row counts of the stages of formatting a dataset."""
+
+import json
+import time
+import contextlib
+import contextvars
+import tracemalloc
+
+# The timings that stages are recorded in, see `Timings.activate`
+_active_timings = contextvars.ContextVar("timings", default=None)
+
+
+class Timings:
+    """
+    Record the stages of formatting a dataset.
+
+    Each stage records its wall time in seconds, the peak memory traced by `tracemalloc`
+    while it ran in megabytes, and optionally a number of rows. Stages can be nested, a
+    stage's time and peak memory include the stages inside of it.
+
+    Stages are recorded with `Timings.stage` or, while the timings are active (see
+    `Timings.activate`), with the module level `stage` function, which does nothing when
+    there aren't any active timings.
+
+    Parameters
+    ----------
+    trace_memory : bool
+        If True, trace the peak memory of each stage with `tracemalloc`, which slows
+        down the stages.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._open_stages = []
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Record the stages of the module level `stage` function in these timings."""
+        token = _active_timings.set(self)
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+            _active_timings.reset(token)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Record the time and peak memory of the code run inside of this context.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        rows : int or None
+            The number of rows the stage processed. It can also be set on the record
+            that's returned, i.e. `record["rows"] = len(df)`.
+
+        Yields
+        ------
+        dict
+            The record of the stage.
+        """
+        self._update_peak_memory()
+        record = {
+            "stage": name,
+            "depth": len(self._open_stages),
+            "seconds": None,
+            "peak_memory_mb": None,
+            "rows": rows,
+        }
+        self.stages.append(record)
+        self._open_stages.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self._update_peak_memory()
+            self._open_stages.pop()
+
+    def _update_peak_memory(self):
+        """Add the peak memory since the last update to the open stages and reset it."""
+        if not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        peak_memory_mb = peak / 2**20
+        for record in self._open_stages:
+            record["peak_memory_mb"] = max(
+                record["peak_memory_mb"] or 0, peak_memory_mb
+            )
+        tracemalloc.reset_peak()
+
+    def to_dict(self):
+        """
+        Get a report of the stages that can be serialized to JSON.
+
+        Returns
+        -------
+        dict
+            The 'stages' in the order they started, the 'total_seconds' of the outermost
+            stages, and the overall 'peak_memory_mb'.
+        """
+        peaks = [
+            record["peak_memory_mb"]
+            for record in self.stages
+            if record["peak_memory_mb"] is not None
+        ]
+        return {
+            "stages": [dict(record) for record in self.stages],
+            "total_seconds": sum(
+                record["seconds"] or 0 for record in self.stages if record["depth"] == 0
+            ),
+            "peak_memory_mb": max(peaks) if peaks else None,
+        }
+
+    def summary(self):
+        """
+        Format the stages as a table.
+
+        Returns
+        -------
+        str
+            One line per stage with nested stages indented under the stage they ran in.
+        """
+        lines = [f"{'stage':<32}{'seconds':>10}{'peak MB':>10}{'rows':>10}"]
+        for record in self.stages:
+            name = "  " * record["depth"] + record["stage"]
+            seconds = "" if record["seconds"] is None else f"{record['seconds']:.3f}"
+            peak = (
+                ""
+                if record["peak_memory_mb"] is None
+                else f"{record['peak_memory_mb']:.1f}"
+            )
+            rows = "" if record["rows"] is None else str(record["rows"])
+            lines.append(f"{name:<32}{seconds:>10}{peak:>10}{rows:>10}")
+        return "\n".join(lines)
+
+    def write(self, path):
+        """
+        Write the report of the stages (see `Timings.to_dict`) to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the JSON file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def stage(name, rows=None):
+    """
+    Record a stage in the active timings, or do nothing if there aren't any.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+    rows : int or None
+        The number of rows the stage processed.
+
+    Returns
+    -------
+    contextlib.AbstractContextManager
+        A context that yields the record of the stage, or an unused record if there
+        aren't any active timings.
+    """
+    timings = _active_timings.get()
+    if timings is None:
+        return contextlib.nullcontext({})
+    return timings.stage(name, rows)
@@ -0,0 +1,428 @@
+"""Download mmCIF files for PDB IDs and keep them in a local on-disk cache."""
+
+import os
+import re
+import glob
+import hashlib
+import tempfile
+import threading
+import concurrent.futures
+
+# The default location that structures are downloaded from
+RCSB_URL = "https://files.rcsb.org/download"
+
+# Environment variables that configure the cache when it isn't configured in Python
+CACHE_DIR_ENV = "CONFIGURE_DMS_VIZ_CACHE_DIR"
+CACHE_SIZE_ENV = "CONFIGURE_DMS_VIZ_CACHE_SIZE"
+OFFLINE_ENV = "CONFIGURE_DMS_VIZ_OFFLINE"
+PDB_SOURCE_ENV = "CONFIGURE_DMS_VIZ_PDB_SOURCE"
+TIMEOUT_ENV = "CONFIGURE_DMS_VIZ_TIMEOUT"
+RETRIES_ENV = "CONFIGURE_DMS_VIZ_RETRIES"
+
+# The names of cache entries, a PDB ID and a hash of the content. Other files in the
+# cache directory are never read or removed.
+CACHE_ENTRY_PATTERN = re.compile(r"[0-9A-Z]{4}-[0-9a-f]{16}\.cif")
+
+# The default maximum size of the cache in megabytes
+DEFAULT_CACHE_SIZE = 1024
+
+# The default number of seconds to wait to connect and for data before giving up
+DEFAULT_TIMEOUT = 30
+
+# The default number of times to retry a failed download, waiting
+# RETRY_BACKOFF * 2 ** (retry - 1) seconds between retries
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+# The HTTP status codes of downloads that are worth retrying
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# The default number of structures to download at once when prefetching
+DEFAULT_PREFETCH_WORKERS = 8
+
+# Settings for this session, a value of None falls back to the environment
+_settings = {
+    "cache_dir": None,
+    "max_size": None,
+    "offline": None,
+    "source": None,
+    "timeout": None,
+    "retries": None,
+}
+
+# The HTTP session that downloads share, see `get_session`
+_session = {"key": None, "session": None}
+_session_lock = threading.Lock()
+
+
+def configure_cache(
+    cache_dir=None, max_size=None, offline=None, source=None, timeout=None, retries=None
+):
+    """
+    Configure the structure cache and downloads for this session.
+
+    Any setting that is left as None falls back to its environment variable
+    (CONFIGURE_DMS_VIZ_CACHE_DIR, CONFIGURE_DMS_VIZ_CACHE_SIZE, CONFIGURE_DMS_VIZ_OFFLINE,
+    CONFIGURE_DMS_VIZ_PDB_SOURCE, CONFIGURE_DMS_VIZ_TIMEOUT, and
+    CONFIGURE_DMS_VIZ_RETRIES) and then to the default. Calling this function without
+    any arguments resets the session settings.
+
+    Parameters
+    ----------
+    cache_dir : str or None
+        The directory to cache downloaded structures in. Caching is disabled if this isn't set.
+    max_size : int or None
+        The maximum size of the cache in megabytes. The least recently used structures
+        are evicted when the cache grows past this size.
+    offline : bool or None
+        If True, never access the network and fail if a structure isn't in the cache.
+    source : str or None
+        The URL or local directory of *.cif files that structures are fetched from.
+    timeout : float or None
+        The number of seconds to wait to connect and for data before a download fails.
+    retries : int or None
+        The number of times to retry a download that failed to connect, timed out, or
+        returned a server error, with exponential backoff between retries.
+    """
+    _settings.update(
+        cache_dir=cache_dir,
+        max_size=max_size,
+        offline=offline,
+        source=source,
+        timeout=timeout,
+        retries=retries,
+    )
+
+
+def get_cache_settings():
+    """
+    Get the structure cache settings after resolving the environment and defaults.
+
+    Returns
+    -------
+    dict
+        A dictionary with the 'cache_dir', 'max_size', 'offline', 'source', 'timeout',
+        and 'retries' settings.
+    """
+    cache_dir = _settings["cache_dir"] or os.environ.get(CACHE_DIR_ENV) or None
+    max_size = _settings["max_size"]
+    if max_size is None:
+        max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+    offline = _settings["offline"]
+    if offline is None:
+        offline = os.environ.get(OFFLINE_ENV, "").lower() in {"1", "true", "yes"}
+    source = _settings["source"] or os.environ.get(PDB_SOURCE_ENV) or RCSB_URL
+    timeout = _settings["timeout"]
+    if timeout is None:
+        timeout = float(os.environ.get(TIMEOUT_ENV, DEFAULT_TIMEOUT))
+    retries = _settings["retries"]
+    if retries is None:
+        retries = int(os.environ.get(RETRIES_ENV, DEFAULT_RETRIES))
+    return {
+        "cache_dir": cache_dir,
+        "max_size": max_size,
+        "offline": offline,
+        "source": source,
+        "timeout": timeout,
+        "retries": retries,
+    }
+
+
+def _content_hash(text):
+    """Hash the content of a structure file to key it in the cache."""
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _is_cache_entry(path):
+    """Check if a file in the cache directory is named like a cache entry."""
+    return CACHE_ENTRY_PATTERN.fullmatch(os.path.basename(path)) is not None
+
+
+def read_cached_structure(pdb_id, cache_dir):
+    """
+    Read the mmCIF text for a PDB ID from the cache.
+
+    Cache entries are named by the PDB ID and a hash of their content. Entries whose
+    content doesn't match their hash are removed. Reading an entry marks it as recently
+    used.
+
+    Parameters
+    ----------
+    pdb_id : str
+        A 4-character PDB ID.
+    cache_dir : str
+        The cache directory.
+
+    Returns
+    -------
+    str or None
+        The mmCIF text or None if the structure isn't in the cache.
+    """
+    for path in glob.glob(os.path.join(cache_dir, f"{pdb_id.upper()}-*.cif")):
+        if not _is_cache_entry(path):
+            continue
+        # Entries can be evicted by another process or thread at any time
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+            if os.path.basename(path) != f"{pdb_id.upper()}-{_content_hash(text)}.cif":
+                os.remove(path)
+                continue
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        return text
+    return None
+
+
+def write_cached_structure(pdb_id, text, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+    """
+    Write the mmCIF text for a PDB ID to the cache and evict old entries.
+
+    Parameters
+    ----------
+    pdb_id : str
+        A 4-character PDB ID.
+    text : str
+        The mmCIF text of the structure.
+    cache_dir : str
+        The cache directory.
+    max_size : int
+        The maximum size of the cache in megabytes.
+
+    Returns
+    -------
+    str
+        The path to the cache entry.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{pdb_id.upper()}-{_content_hash(text)}.cif")
+    # Write to a temporary file first so that concurrent readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    evict_cached_structures(cache_dir, max_size, keep=path)
+    return path
+
+
+def evict_cached_structures(cache_dir, max_size, keep=None):
+    """
+    Remove the least recently used structures until the cache fits in max_size megabytes.
+
+    Only cache entries are counted and removed, so other *.cif files in the directory
+    (i.e. when it's also a directory of local structures) are left alone.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The cache directory.
+    max_size : int
+        The maximum size of the cache in megabytes.
+    keep : str or None
+        A path to an entry that should never be evicted.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, "*.cif")):
+        if not _is_cache_entry(path):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size * 1024 * 1024:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def get_session(retries=DEFAULT_RETRIES):
+    """
+    Get the HTTP session that structures are downloaded with.
+
+    The session is created once per process and number of retries, so that downloads
+    reuse connections to the server. Failed connections, timeouts, and server errors
+    are retried with exponential backoff.
+
+    Parameters
+    ----------
+    retries : int
+        The number of times to retry a failed download.
+
+    Returns
+    -------
+    requests.Session
+        The shared session.
+    """
+    import requests
+    from urllib3.util.retry import Retry
+
+    # Processes forked from this one can't share its connections
+    key = (os.getpid(), retries)
+    with _session_lock:
+        if _session["key"] != key:
+            retry = Retry(
+                total=retries,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=["GET"],
+                raise_on_status=False,
+            )
+            adapter = requests.adapters.HTTPAdapter(
+                max_retries=retry, pool_maxsize=DEFAULT_PREFETCH_WORKERS
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session.update(key=key, session=session)
+        return _session["session"]
+
+
+def download_structure(
+    pdb_id, source=RCSB_URL, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES
+):
+    """
+    Download the mmCIF text for a PDB ID.
+
+    Parameters
+    ----------
+    pdb_id : str
+        A 4-character PDB ID.
+    source : str
+        The URL to download from or a local directory of *.cif files named by PDB ID.
+    timeout : float
+        The number of seconds to wait to connect and for data before giving up.
+    retries : int
+        The number of times to retry a failed download.
+
+    Returns
+    -------
+    str
+        The mmCIF text of the structure.
+
+    Raises
+    ------
+    ValueError
+        If the structure couldn't be downloaded.
+    """
+    if os.path.isdir(source):
+        for name in (pdb_id, pdb_id.upper(), pdb_id.lower()):
+            path = os.path.join(source, f"{name}.cif")
+            if os.path.isfile(path):
+                with open(path, "r") as f:
+                    return f.read()
+        raise ValueError(f"Failed to find {pdb_id} in the local directory {source}.")
+
+    import requests
+
+    try:
+        response = get_session(retries).get(
+            f"{source.rstrip('/')}/{pdb_id}.cif", timeout=timeout
+        )
+    except requests.RequestException as e:
+        raise ValueError(
+            f"Failed to download {pdb_id} from the RCSB database: {e}"
+        ) from e
+    if response.status_code != 200:
+        raise ValueError(
+            f"Failed to download {pdb_id} from the RCSB database. Status code: {response.status_code}"
+        )
+    return response.text
+
+
+def fetch_structure_text(pdb_id):
+    """
+    Get the mmCIF text for a PDB ID from the cache or download it.
+
+    The cache is checked before any network access. In offline mode, a structure
+    that isn't in the cache is an error.
+
+    Parameters
+    ----------
+    pdb_id : str
+        A 4-character PDB ID.
+
+    Returns
+    -------
+    str
+        The mmCIF text of the structure.
+
+    Raises
+    ------
+    ValueError
+        If the structure isn't cached in offline mode or couldn't be downloaded.
+    """
+    settings = get_cache_settings()
+
+    # Check the cache first
+    if settings["cache_dir"]:
+        text = read_cached_structure(pdb_id, settings["cache_dir"])
+        if text is not None:
+            return text
+
+    if settings["offline"]:
+        raise ValueError(
+            f"{pdb_id} is not in the structure cache ({settings['cache_dir']}) and downloads are disabled in offline mode."
+        )
+
+    # Download the structure and add it to the cache
+    text = download_structure(
+        pdb_id, settings["source"], settings["timeout"], settings["retries"]
+    )
+    if settings["cache_dir"]:
+        write_cached_structure(
+            pdb_id, text, settings["cache_dir"], settings["max_size"]
+        )
+
+    return text
+
+
+def prefetch_structures(pdb_ids, max_workers=DEFAULT_PREFETCH_WORKERS):
+    """
+    Download many structures into the cache at once.
+
+    Structures that are already cached aren't downloaded again. This is a no-op without
+    a cache directory (see `configure_cache`), because the downloads would be thrown away.
+
+    Parameters
+    ----------
+    pdb_ids : list of str
+        The 4-character PDB IDs to download.
+    max_workers : int
+        The most structures to download at once.
+
+    Returns
+    -------
+    dict
+        The error for each PDB ID that couldn't be fetched. It's empty if every structure
+        is in the cache.
+    """
+    settings = get_cache_settings()
+    if not settings["cache_dir"]:
+        return {}
+
+    # Only fetch each structure once regardless of its case
+    unique_ids = {}
+    for pdb_id in pdb_ids:
+        unique_ids.setdefault(pdb_id.upper(), pdb_id)
+
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_structure_text, pdb_id): pdb_id
+            for pdb_id in unique_ids.values()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except ValueError as e:
+                errors[futures[future]] = e
+    return errors
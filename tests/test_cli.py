@@ -1,9 +1,15 @@
 """Test the command line tool with pytest on a set of examples datasets to check the high-level function of the CLI."""
 
 import os
+import sys
+import json
 import pandas as pd
 import subprocess
 import pytest
+from configure_dms_viz.configure_dms_viz import _chunk_datasets
+
+# Modules that shouldn't be imported unless a command needs them
+HEAVY_MODULES = ["pandas", "numpy", "Bio", "requests"]
 
 
 def create_viz_json(input_df, sitemap_df, output_path, **kwargs):
@@ -61,6 +67,36 @@ def combine_jsons(input_files, output_file, description_file):
     subprocess.run(command, shell=True, check=True)
 
 
+def imported_modules(args):
+    """
+    Runs the command line tool in a new interpreter and collects the imported modules.
+
+    Parameters
+    ----------
+    args : list of str
+        The arguments to the command line tool.
+
+    Returns
+    -------
+    list of str
+        The names of the modules in `sys.modules` when the command exits.
+    """
+    # The modules are listed on stderr when the interpreter exits, after the command
+    # has run and called sys.exit()
+    script = (
+        "import sys, atexit; "
+        "atexit.register(lambda: print(*sys.modules, sep='\\n', file=sys.stderr)); "
+        "from configure_dms_viz.configure_dms_viz import cli; cli()"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stderr.splitlines()
+
+
 @pytest.fixture(scope="module")
 def test_datasets():
     return [
@@ -99,5 +135,154 @@ def test_create_viz_json(test_datasets):
             pytest.fail(f"Combining JSON files failed with error: {e}")
 
 
+def test_batch_format(tmp_path):
+    """Test formatting and joining every dataset in a manifest with the batch command."""
+    manifest = pd.DataFrame(
+        {
+            "input": ["tests/dummy-data/dummy.csv"] * 2
+            + ["tests/SARS2-Mutation-Fitness/input/E_fitness.csv"],
+            "sitemap": ["tests/dummy-data/dummymap.csv"] * 2
+            + ["tests/SARS2-Mutation-Fitness/sitemap/E_sitemap.csv"],
+            "name": ["dummy", "dummy-join", "E"],
+            "metric": ["mut_escape", "mut_escape", "fitness"],
+            "condition": ["condition", "condition", None],
+            "structure": ["tests/dummy-data/dummypdb.pdb"] * 2
+            + ["tests/SARS2-Mutation-Fitness/structures/E.pdb"],
+            "included_chains": ["E", "E", "polymer"],
+            "join_data": [None, "tests/dummy-data/dummyjoin.csv", None],
+        }
+    )
+    manifest.to_csv(tmp_path / "datasets.csv", index=False)
+
+    command = f"""
+    configure-dms-viz batch \
+        --manifest "{tmp_path / 'datasets.csv'}" \
+        --jobs 2 \
+        --output-dir "{tmp_path / 'output'}" \
+        --output "{tmp_path / 'joined.json'}" \
+    """
+    try:
+        subprocess.run(command, shell=True, check=True)
+    except subprocess.CalledProcessError as e:
+        pytest.fail(f"Command failed with error: {e}")
+
+    for name in manifest["name"]:
+        assert (tmp_path / "output" / f"{name}.json").exists()
+    with open(tmp_path / "joined.json", "r") as f:
+        assert set(json.load(f).keys()) == set(manifest["name"])
+
+
+def test_batch_join_failure(tmp_path):
+    """Test that the batch command fails when the datasets can't be joined."""
+    manifest = pd.DataFrame(
+        {
+            "input": ["tests/dummy-data/dummy.csv"],
+            "sitemap": ["tests/dummy-data/dummymap.csv"],
+            "name": ["dummy"],
+            "metric": ["mut_escape"],
+            "condition": ["condition"],
+            "structure": ["tests/dummy-data/dummypdb.pdb"],
+            "included_chains": ["E"],
+        }
+    )
+    manifest.to_csv(tmp_path / "datasets.csv", index=False)
+
+    # The description has to be a markdown file
+    command = f"""
+    configure-dms-viz batch \
+        --manifest "{tmp_path / 'datasets.csv'}" \
+        --output "{tmp_path / 'joined.json'}" \
+        --description "{tmp_path / 'datasets.csv'}" \
+    """
+    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "couldn't be joined" in result.stderr
+    assert "datasets from" not in result.stdout
+
+
+def test_chunk_datasets():
+    """Test that datasets sharing a structure are split across the jobs."""
+    grouped_args = [[["--name", str(i)] for i in range(5)], [["--name", "5"]]]
+    assert _chunk_datasets(grouped_args, 1) == grouped_args
+    assert _chunk_datasets(grouped_args, 3) == [
+        [["--name", "0"], ["--name", "1"]],
+        [["--name", "2"], ["--name", "3"]],
+        [["--name", "4"]],
+        [["--name", "5"]],
+    ]
+    assert _chunk_datasets(grouped_args[:1], 8) == [[args] for args in grouped_args[0]]
+
+
+@pytest.mark.parametrize("command", ["help", "join"])
+def test_startup_imports(command, tmp_path):
+    """Test that commands which don't read data start without importing heavy modules."""
+    if command == "help":
+        args = ["--help"]
+    else:
+        for name in ["a", "b"]:
+            with open(tmp_path / f"{name}.json", "w") as f:
+                json.dump({name: {"mut_metric_df": []}}, f)
+        args = [
+            "join",
+            "--input",
+            f"{tmp_path / 'a.json'}, {tmp_path / 'b.json'}",
+            "--output",
+            str(tmp_path / "joined.json"),
+        ]
+
+    modules = imported_modules(args)
+
+    assert "configure_dms_viz.configure_dms_viz" in modules
+    heavy_modules = [
+        module for module in modules if module.split(".")[0] in HEAVY_MODULES
+    ]
+    assert not heavy_modules, f"Imported {heavy_modules[:5]} at startup."
+
+
+def test_format_skips_unchanged(tmp_path):
+    """Test that format skips datasets whose inputs and options haven't changed."""
+    input_csv = tmp_path / "dummy.csv"
+    input_csv.write_text(open("tests/dummy-data/dummy.csv").read())
+    output = tmp_path / "dummy.json"
+    command = [
+        "configure-dms-viz",
+        "format",
+        "--input",
+        str(input_csv),
+        "--sitemap",
+        "tests/dummy-data/dummymap.csv",
+        "--metric",
+        "mut_escape",
+        "--condition",
+        "condition",
+        "--structure",
+        "tests/dummy-data/dummypdb.pdb",
+        "--included-chains",
+        "E",
+        "--name",
+        "dummy",
+        "--output",
+        str(output),
+    ]
+
+    def run(*args):
+        result = subprocess.run(
+            command + list(args), check=True, capture_output=True, text=True
+        )
+        return result.stdout
+
+    assert "cache miss" in run()
+    assert (tmp_path / "dummy.json.fingerprint").exists()
+    assert "cache hit" in run()
+    assert "cache miss" in run("--force")
+    # Changing an option or an input changes the fingerprint
+    assert "cache miss" in run("--title", "Dummy")
+    with open(input_csv, "a") as f:
+        f.write("\n")
+    assert "cache miss" in run("--title", "Dummy")
+    # Options that don't change the output are ignored
+    assert "cache hit" in run("--title", "Dummy", "--json-backend", "json")
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
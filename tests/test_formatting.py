@@ -1,11 +1,13 @@
 """Explicit unit tests for the formatting commands of configure-dms-viz."""
 
+import time
 import pandas as pd
 import pytest
 from configure_dms_viz.configure_dms_viz import (
     format_mutation_data,
     format_sitemap_data,
     join_additional_data,
+    validate_mutation_data,
 )
 
 
@@ -47,6 +49,73 @@ def test_format_mutation_data(dummy_data):
     assert not formatted_data[metric_col].isna().any()
 
 
+def test_format_mutation_data_drops_wildtype_only_sites():
+    """Test that sites with only the wildtype residue are dropped"""
+
+    mut_metric_df = pd.DataFrame(
+        {
+            "site": [1, 2, 2, 3],
+            "wildtype": ["A", "C", "C", "D"],
+            "mutant": ["A", "C", "G", "D"],
+            "metric": [0.0, 0.1, 0.2, 0.3],
+        }
+    )
+
+    formatted_data = format_mutation_data(mut_metric_df, "metric", None, "ACDG")
+
+    # Only site 2 has a mutation that isn't the wildtype residue
+    assert formatted_data["reference_site"].tolist() == [2, 2]
+    assert formatted_data["metric"].tolist() == [0.1, 0.2]
+
+
+def test_format_mutation_data_categorical_residues():
+    """Test that wildtype only sites are found with categorical residue columns"""
+
+    mut_metric_df = pd.DataFrame(
+        {
+            "site": [1, 2, 2, 3],
+            "wildtype": pd.Categorical(["A", "A", "A", "C"]),
+            "mutant": pd.Categorical(["A", "A", "G", "C"]),
+            "metric": [0.0, 0.1, 0.2, 0.3],
+        }
+    )
+
+    formatted_data = format_mutation_data(mut_metric_df, "metric", None, "ACG")
+
+    # The wildtype and mutant columns have different categories
+    assert set(mut_metric_df["wildtype"].cat.categories) != set(
+        mut_metric_df["mutant"].cat.categories
+    )
+    assert formatted_data["reference_site"].tolist() == [2, 2]
+    assert formatted_data["metric"].tolist() == [0.1, 0.2]
+
+
+def test_format_mutation_data_scales_with_sites():
+    """Test that dropping wildtype only sites doesn't take time per site"""
+
+    # Every other site has only a row for the wildtype residue
+    num_sites = 20000
+    mutants = list("ACDEFGHIKL")
+    mut_metric_df = pd.DataFrame(
+        [
+            (site, "A", mutant, 1.0)
+            for site in range(num_sites)
+            for mutant in (["A"] if site % 2 else mutants)
+        ],
+        columns=["site", "wildtype", "mutant", "metric"],
+    )
+
+    start = time.perf_counter()
+    formatted_data = format_mutation_data(
+        mut_metric_df, "metric", None, "".join(mutants)
+    )
+    elapsed = time.perf_counter() - start
+
+    assert formatted_data["reference_site"].nunique() == num_sites // 2
+    # Filtering each site with a Python function took several seconds
+    assert elapsed < 2
+
+
 def test_format_sitemap_data(dummy_data):
     """Test sitemap formatting"""
     sitemap_df, mut_metric_df, _, included_chains = dummy_data
@@ -79,6 +148,37 @@ def test_format_sitemap_data(dummy_data):
         assert all(formatted_df["protein_site"] == formatted_df["reference_site"])
 
 
+def test_format_sitemap_data_fills_missing_columns():
+    """Test that protein sites and chains are filled in and floats are converted."""
+    sitemap_df = pd.DataFrame(
+        {
+            "reference_site": [1, 2, 3],
+            "sequential_site": ["1.0", "2.0", "3.0"],
+            "extra": ["x", "y", "z"],
+        }
+    )
+    mut_metric_df = pd.DataFrame({"reference_site": [1, 3]})
+
+    formatted_df = format_sitemap_data(sitemap_df, mut_metric_df, "A B")
+
+    assert list(formatted_df.columns) == [
+        "reference_site",
+        "protein_site",
+        "sequential_site",
+        "chains",
+    ]
+    assert formatted_df["protein_site"].tolist() == [1, 2, 3]
+    assert formatted_df["sequential_site"].tolist() == [1, 2, 3]
+    assert pd.api.types.is_integer_dtype(formatted_df["sequential_site"])
+    assert formatted_df["chains"].tolist() == ["A B"] * 3
+    # The sitemap that was passed in isn't changed
+    assert list(sitemap_df.columns) == ["reference_site", "sequential_site", "extra"]
+
+    # Sites in the mutation data must be in the sitemap
+    with pytest.raises(ValueError, match=r"missing from your sitemap e\.g\. \[4\]"):
+        format_sitemap_data(sitemap_df, pd.DataFrame({"reference_site": [1, 4]}), "A")
+
+
 def test_join_additional_data(dummy_data):
     """Test joining additional dataframes to the main dataframe"""
     _, mut_metric_df, join_data_df, _ = dummy_data
@@ -114,5 +214,126 @@ def test_join_additional_data(dummy_data):
     ).any(), "Duplicate measurements found after join."
 
 
+def test_join_additional_data_mismatched_key_dtypes():
+    """Test that join data with a different kind of key values raises an error"""
+    mut_metric_df = pd.DataFrame(
+        {
+            "reference_site": [1, 2],
+            "wildtype": pd.Categorical(["A", "C"]),
+            "mutant": pd.Categorical(["D", "G"]),
+            "metric": [0.1, 0.2],
+        }
+    )
+    join_df = pd.DataFrame(
+        {
+            "reference_site": ["1", "2"],
+            "wildtype": ["A", "C"],
+            "mutant": ["D", "G"],
+            "effect": [-1.0, -2.0],
+        }
+    )
+    with pytest.raises(ValueError, match="'reference_site' column of a join dataframe"):
+        join_additional_data(mut_metric_df, [join_df])
+
+    # Categorical and string residues, or integer and float sites, still match
+    join_df["reference_site"] = [1.0, 2.0]
+    joined_df = join_additional_data(mut_metric_df, [join_df])
+    assert joined_df["effect"].tolist() == [-1.0, -2.0]
+
+
+def test_join_additional_data_multiple_frames():
+    """Test that every join dataframe is joined to the main dataframe"""
+    mut_metric_df = pd.DataFrame(
+        {
+            "reference_site": [1, 1, 2, 2],
+            "wildtype": ["A", "A", "C", "C"],
+            "mutant": ["D", "D", "G", "A"],
+            "condition": ["x", "y", "x", "y"],
+            "metric": [0.1, 0.2, 0.3, 0.4],
+        }
+    )
+    join_data = [
+        pd.DataFrame(
+            {
+                "site": [1, 2, 3],
+                "wildtype": ["A", "C", "E"],
+                "mutant": ["D", "G", "A"],
+                "effect": [-1.0, -2.0, -3.0],
+                "metric": [9.0, 9.0, 9.0],
+            }
+        ),
+        pd.DataFrame(
+            {
+                "reference_site": [2, 2],
+                "wildtype": ["C", "C"],
+                "mutant": ["A", "G"],
+                "times_seen": [5, 6],
+                "effect": [0.0, 0.0],
+            }
+        ),
+    ]
+
+    joined_df = join_additional_data(mut_metric_df, join_data)
+
+    # The rows of the main dataframe are kept in order
+    pd.testing.assert_frame_equal(
+        joined_df[mut_metric_df.columns], mut_metric_df, check_dtype=False
+    )
+    # Columns that were already joined are dropped from later dataframes
+    assert set(joined_df.columns) == set(mut_metric_df.columns) | {
+        "effect",
+        "times_seen",
+    }
+    assert joined_df["effect"].tolist()[:3] == [-1.0, -1.0, -2.0]
+    assert pd.isna(joined_df["effect"].iloc[3])
+    assert joined_df["times_seen"].tolist()[2:] == [6, 5]
+
+
+@pytest.mark.parametrize("condition_col", [None, "condition"])
+def test_validate_mutation_data(condition_col, tmp_path, capsys):
+    """Test that validating in chunks gives the same warnings and errors as formatting."""
+    mut_metric_df = pd.DataFrame(
+        {
+            "site": [1, 1, 2, 2, 3, 3, 3, 4],
+            "wildtype": ["A", "A", "C", "C", "D", "D", "D", "E"],
+            # Site 2 only has the wildtype residue across two chunks
+            "mutant": ["G", "L", "C", "C", "D", "K", "P", "G"],
+            "condition": ["x", "y", "x", "y", "x", "x", "y", "x"],
+            "metric": [0.1, 0.2, 0.3, 0.4, 0.5, None, 0.7, 0.8],
+        }
+    )
+    path = tmp_path / "mutations.csv"
+    mut_metric_df.to_csv(path, index=False)
+
+    def messages(func, *args):
+        try:
+            func(*args)
+            error = None
+        except ValueError as e:
+            error = str(e)
+        return capsys.readouterr().out, error
+
+    for alphabet in ["ACDEGKLP", "ACDEGKL"]:
+        expected = messages(
+            format_mutation_data, pd.read_csv(path), "metric", condition_col, alphabet
+        )
+        for chunksize in [1, 3, 100]:
+            assert expected == messages(
+                validate_mutation_data,
+                str(path),
+                "metric",
+                condition_col,
+                alphabet,
+                chunksize,
+            )
+
+    summary = validate_mutation_data(str(path), "metric", "condition", "ACDEGKLP", 3)
+    assert summary == {"rows": 8, "nan_rows": 1, "sites": 4, "wildtype_only_sites": 1}
+
+    # Missing columns are reported before any rows are read
+    with pytest.raises(ValueError, match="do not exist"):
+        validate_mutation_data(str(path), "other_metric", None, "ACDEGKLP")
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
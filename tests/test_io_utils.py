@@ -0,0 +1,320 @@
+"""Explicit unit tests for reading and writing the JSON files of configure-dms-viz."""
+
+import io
+import json
+import pytest
+import pandas as pd
+
+from configure_dms_viz import io_utils
+from configure_dms_viz.io_utils import (
+    join_json_files,
+    write_json,
+    decode_columnar,
+    encode_compact_sitemap,
+    decode_compact_sitemap,
+    open_input,
+    open_output,
+    read_table,
+)
+from configure_dms_viz.configure_dms_viz import make_experiment_dictionary
+
+
+@pytest.fixture
+def dataset_files(tmp_path):
+    datasets = [
+        {"b": {"mut_metric_df": [{"site": 1, "value": 0.5}], "pdb": "6UDJ"}},
+        {"a": {"mut_metric_df": [{"site": 2, "value": None}], "pdb": "1ABC"}},
+        {"c": {"sitemap": {"1": {"chains": "A"}}}, "d": {"title": "Title"}},
+    ]
+    paths = []
+    for i, dataset in enumerate(datasets):
+        path = tmp_path / f"dataset_{i}.json"
+        with open(path, "w") as f:
+            json.dump(dataset, f, sort_keys=True)
+        paths.append(str(path))
+    return datasets, paths
+
+
+def test_join_json_files(dataset_files, tmp_path):
+    """Test that the streaming join writes the same file as joining in memory."""
+    datasets, paths = dataset_files
+    output = tmp_path / "joined.json"
+    names = join_json_files(paths, str(output), "# Description")
+
+    combined_data = {"markdown_description": "# Description"}
+    for dataset in datasets:
+        combined_data.update(dataset)
+    assert names == sorted(combined_data)
+    assert output.read_text() == json.dumps(combined_data, sort_keys=True)
+
+
+def test_join_json_files_with_duplicate_names(dataset_files, tmp_path):
+    """Test that joining files with the same dataset name raises an error."""
+    _, paths = dataset_files
+    with pytest.raises(ValueError) as excinfo:
+        join_json_files(paths + [paths[0]], str(tmp_path / "joined.json"))
+    assert "not unique" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("extension", ["", ".gz"])
+def test_join_json_files_incrementally(extension, dataset_files, tmp_path, monkeypatch):
+    """Test that an incremental join only parses the files that changed."""
+    datasets, paths = dataset_files
+    output = str(tmp_path / f"joined.json{extension}")
+    join_json_files(paths, output, "# Description", incremental=True)
+
+    # Change one of the files
+    datasets[1]["a"]["pdb"] = "2ABC"
+    with open(paths[1], "w") as f:
+        json.dump(datasets[1], f)
+
+    parsed = []
+
+    def recording_open_input(path, mode="r"):
+        parsed.append(path)
+        return open_input(path, mode)
+
+    monkeypatch.setattr(io_utils, "open_input", recording_open_input)
+    names = join_json_files(paths, output, "# Description", incremental=True)
+    # Only the changed file is parsed, the previous output is read to copy the others
+    assert parsed == [paths[1], output]
+
+    monkeypatch.undo()
+    expected = str(tmp_path / f"expected.json{extension}")
+    assert names == join_json_files(paths, expected, "# Description")
+    with open_input(output) as f, open_input(expected) as f_expected:
+        assert f.read() == f_expected.read()
+
+    # Nothing has to be parsed when nothing changed
+    assert io_utils.read_join_index(output) is not None
+    parsed.clear()
+    monkeypatch.setattr(io_utils, "open_input", recording_open_input)
+    join_json_files(paths, output, "# Description", incremental=True)
+    assert parsed == [output]
+    with open_input(output) as f, open_input(expected) as f_expected:
+        assert f.read() == f_expected.read()
+
+    # Duplicate names are found from the index without parsing
+    with pytest.raises(ValueError) as excinfo:
+        join_json_files(paths + [paths[0]], output, incremental=True)
+    assert "not unique" in str(excinfo.value)
+
+    # The index is ignored if the output changed
+    with open(output, "ab") as f:
+        f.write(b" ")
+    assert io_utils.read_join_index(output) is None
+
+
+@pytest.mark.parametrize("compress", ["gzip", "zstd"])
+def test_join_compressed_json_files(compress, dataset_files, tmp_path):
+    """Test that compressed files are joined into a compressed file."""
+    if compress == "zstd":
+        pytest.importorskip("zstandard")
+    datasets, paths = dataset_files
+    extension = {"gzip": ".gz", "zstd": ".zst"}[compress]
+
+    # Compress one of the input files
+    with open(paths[0], "r") as f, open_output(paths[0] + extension) as f_out:
+        f_out.write(f.read())
+    paths[0] += extension
+
+    join_json_files(paths, str(tmp_path / f"joined.json{extension}"))
+    join_json_files(paths, str(tmp_path / "joined.json"))
+    join_json_files(paths, str(tmp_path / "joined.data"), compress=compress)
+    with open(tmp_path / f"joined.json{extension}", "rb") as f:
+        assert f.read(2) != b"{"
+    with open_input(str(tmp_path / f"joined.json{extension}")) as f:
+        assert f.read() == (tmp_path / "joined.json").read_text()
+    with open_input(str(tmp_path / "joined.data")) as f:
+        assert f.read() == (tmp_path / "joined.json").read_text()
+
+
+@pytest.fixture
+def experiment_kwargs():
+    return dict(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        structure="tests/dummy-data/dummypdb.pdb",
+        condition_col="condition",
+        condition_name="Antibody",
+        included_chains="E",
+        check_pdb=False,
+    )
+
+
+@pytest.mark.parametrize("backend", io_utils.JSON_BACKENDS)
+@pytest.mark.parametrize("columnar", [False, True])
+def test_write_json_is_identical(backend, columnar, experiment_kwargs, monkeypatch):
+    """Test that streaming an experiment writes the same JSON as dumping it."""
+    if backend != "json":
+        pytest.importorskip(backend)
+    # Use a small chunk size so that the rows are written in several chunks
+    monkeypatch.setattr(io_utils, "RECORDS_CHUNK_SIZE", 7)
+    expected = json.dumps(
+        {"dummy": make_experiment_dictionary(**experiment_kwargs, columnar=columnar)},
+        sort_keys=True,
+    )
+    f = io.StringIO()
+    write_json(
+        {
+            "dummy": make_experiment_dictionary(
+                **experiment_kwargs, as_dataframe=True, columnar=columnar
+            )
+        },
+        f,
+        backend,
+    )
+    assert f.getvalue() == expected
+
+
+def test_columnar_round_trip(experiment_kwargs):
+    """Test that columnar mutation data decodes to the same records."""
+    records = json.loads(json.dumps(make_experiment_dictionary(**experiment_kwargs)))
+    columnar = json.loads(
+        json.dumps(make_experiment_dictionary(**experiment_kwargs, columnar=True))
+    )
+    assert columnar["mut_metric_df_schema"]["encoded_columns"] == {
+        "wildtype": "alphabet",
+        "mutant": "alphabet",
+        "Antibody": "conditions",
+    }
+    assert all(isinstance(code, int) for code in columnar["mut_metric_df"]["mutant"])
+    assert decode_columnar(columnar) == records["mut_metric_df"]
+    assert len(json.dumps(columnar)) < len(json.dumps(records))
+
+    columnar["mut_metric_df"]["mutant"].pop()
+    with pytest.raises(ValueError, match="different lengths"):
+        decode_columnar(columnar)
+
+
+def test_compact_sitemap_round_trip(experiment_kwargs):
+    """Test that a compact sitemap decodes to the same sitemap."""
+    default = json.loads(json.dumps(make_experiment_dictionary(**experiment_kwargs)))
+    compact = json.loads(
+        json.dumps(
+            make_experiment_dictionary(**experiment_kwargs, compact_sitemap=True)
+        )
+    )
+    assert compact["sitemap_schema"]["encoded_columns"] == {"chains": "sitemap_chains"}
+    assert compact["sitemap_chains"] == ["E"]
+    assert decode_compact_sitemap(compact) == default["sitemap"]
+    assert len(json.dumps(compact["sitemap"])) < len(json.dumps(default["sitemap"]))
+
+
+def test_encode_compact_sitemap():
+    """Test that the sitemap is ordered by sequential site and the chains are interned."""
+    sitemap_df = pd.DataFrame(
+        {
+            "reference_site": ["3", "1", "2a", "4"],
+            "protein_site": [3, 1, "2A", 4],
+            "sequential_site": [3, 1, 2, 4],
+            "chains": ["A B", "A", "A B", "A"],
+        }
+    )
+    sitemap, chains, schema = encode_compact_sitemap(sitemap_df)
+    assert sitemap == {
+        "reference_site": ["1", "2a", "3", "4"],
+        "protein_site": [1, "2A", 3, 4],
+        "sequential_site": [1, 2, 3, 4],
+        "chains": [0, 1, 1, 0],
+    }
+    assert chains == ["A", "A B"]
+
+    decoded = decode_compact_sitemap(
+        {"sitemap": sitemap, "sitemap_chains": chains, "sitemap_schema": schema}
+    )
+    assert decoded == json.loads(
+        json.dumps(sitemap_df.set_index("reference_site").to_dict(orient="index"))
+    )
+
+    sitemap["chains"].pop()
+    with pytest.raises(ValueError, match="different lengths"):
+        decode_compact_sitemap(
+            {"sitemap": sitemap, "sitemap_chains": chains, "sitemap_schema": schema}
+        )
+
+
+def test_write_json_values():
+    """Test that unusual values are written the same way as the json module."""
+    df = pd.DataFrame(
+        {
+            "text": ['quote"', "slash/", "unicode\u00e9", "percent%s", None],
+            "float": [0.1, None, 1e20, 1e-7, 123456789.123456789],
+            "int": [1, 2, 3, 4, 5],
+            "bool": [True, False, True, False, True],
+            "odd key %d": ["a", 1, 2.5, None, True],
+        }
+    )
+    f = io.StringIO()
+    write_json({"records": df, "empty": df.iloc[0:0]}, f)
+    expected = {
+        "records": json.loads(df.to_json(orient="records")),
+        "empty": [],
+    }
+    assert f.getvalue() == json.dumps(expected, sort_keys=True)
+
+
+@pytest.mark.parametrize("engine", io_utils.CSV_ENGINES)
+def test_read_table(engine, tmp_path):
+    """Test that only the requested columns are read and strings become categoricals."""
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    path = tmp_path / "data.csv"
+    pd.DataFrame(
+        {
+            "site": [1, 2, 3],
+            "wildtype": ["A", "C", "D"],
+            "mutant": ["C", "G", "A"],
+            "condition": [1, 2, 1],
+            "metric": [0.5, -1.0, 2.25],
+            "unused": ["x", "y", "z"],
+        }
+    ).to_csv(path, index=False)
+
+    df = read_table(
+        str(path),
+        ["site", "wildtype", "mutant", "condition", "metric", "missing"],
+        ["wildtype", "mutant", "condition"],
+        engine,
+    )
+
+    # The columns are read in file order and missing columns are ignored
+    assert list(df.columns) == ["site", "wildtype", "mutant", "condition", "metric"]
+    # The string columns share their categories and the numeric ones aren't changed
+    assert isinstance(df["wildtype"].dtype, pd.CategoricalDtype)
+    assert list(df["wildtype"].cat.categories) == ["A", "C", "D", "G"]
+    assert df["wildtype"].dtype == df["mutant"].dtype
+    assert (df["wildtype"] != df["mutant"]).all()
+    assert df["condition"].tolist() == [1, 2, 1]
+    assert df["metric"].tolist() == [0.5, -1.0, 2.25]
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather", ".arrow"])
+def test_read_table_formats(extension, tmp_path):
+    """Test that Parquet and Arrow files are read the same as a csv."""
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame(
+        {
+            "site": [1, 2, 3],
+            "wildtype": ["A", "C", "D"],
+            "mutant": ["C", "G", None],
+            "metric": [0.1, None, 1 / 3],
+            "unused": ["x", "y", "z"],
+        }
+    )
+    df.to_csv(tmp_path / "data.csv", index=False)
+    if extension == ".parquet":
+        df.to_parquet(tmp_path / f"data{extension}")
+    else:
+        df.to_feather(tmp_path / f"data{extension}")
+
+    columns = ["site", "wildtype", "mutant", "metric"]
+    categorical = ["wildtype", "mutant"]
+    expected = read_table(str(tmp_path / "data.csv"), columns, categorical)
+    table = read_table(str(tmp_path / f"data{extension}"), columns, categorical)
+    pd.testing.assert_frame_equal(table, expected)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,16 +1,43 @@
 """Explicit unit tests for the PDB utils of configure-dms-viz."""
 
+import os
+import gzip
+import json
+import time
+import threading
+import http.server
+import importlib.util
 import pytest
+import Bio.PDB
 import pandas as pd
+from io import StringIO
 
 from configure_dms_viz.pdb_utils import (
+    PreparedStructure,
     get_structure,
+    get_structure_format,
+    load_structure,
+    get_residue_index,
     check_chains,
     check_wildtype_residues,
+    get_polymer_chains,
+    slim_structure,
+    slim_pdb_text,
+)
+from configure_dms_viz import pdb_utils, structure_cache
+from configure_dms_viz.profiling import Timings
+from configure_dms_viz.structure_cache import (
+    configure_cache,
+    download_structure,
+    fetch_structure_text,
+    prefetch_structures,
+    read_cached_structure,
+    write_cached_structure,
 )
 from configure_dms_viz.configure_dms_viz import (
     format_mutation_data,
     format_sitemap_data,
+    make_experiment_dictionary,
 )
 
 
@@ -42,6 +69,28 @@ def test_check_chains_with_invalid_chains(dummy_data):
     assert "are not present in the PDB structure" in str(excinfo.value)
 
 
+def test_load_structure_is_memoized():
+    """Test that a structure is parsed once and returned with its raw text."""
+    structure, text = load_structure("tests/dummy-data/dummypdb.pdb")
+    with open("tests/dummy-data/dummypdb.pdb", "r") as f:
+        assert text == f.read()
+    assert load_structure("tests/dummy-data/dummypdb.pdb")[0] is structure
+    assert get_structure("tests/dummy-data/dummypdb.pdb") is structure
+
+
+def test_get_residue_index(dummy_data):
+    """Test that the residue index is cached on the structure and subset by chain."""
+    structure, _, _, included_chains = dummy_data
+    residue_index = get_residue_index(structure)
+    assert list(residue_index.columns) == ["chain", "protein_site", "residue"]
+    assert get_residue_index(structure) is residue_index
+    chain_index = get_residue_index(structure, [included_chains])
+    assert set(chain_index["chain"]) == {included_chains}
+    assert not chain_index.duplicated(["chain", "protein_site"]).any()
+    with pytest.raises(KeyError):
+        get_residue_index(structure, ["Z"])
+
+
 def test_check_wildtype_residues_with_all_matches(dummy_data):
     """Test that check_wildtype_residues correctly identifies all matching wildtype residues."""
     structure, sitemap_df, mut_metric_df, included_chains = dummy_data
@@ -84,3 +133,564 @@ def test_check_wildtype_residues_with_no_matches(dummy_data):
     # Expect no matches
     assert result[0] == 0.0
     assert result[1] > 0.0
+
+
+@pytest.fixture
+def structure_mirror(tmp_path):
+    """A local directory of *.cif files standing in for the RCSB PDB."""
+    mirror_dir = tmp_path / "mirror"
+    mirror_dir.mkdir()
+    io = Bio.PDB.MMCIFIO()
+    io.set_structure(get_structure("tests/dummy-data/dummypdb.pdb"))
+    io.save(str(mirror_dir / "1DUM.cif"))
+    cache_dir = tmp_path / "cache"
+    configure_cache(cache_dir=str(cache_dir), source=str(mirror_dir))
+    yield mirror_dir, cache_dir
+    configure_cache()
+
+
+def test_get_structure_is_cached(structure_mirror):
+    """Test that fetched structures are cached and read from the cache in offline mode."""
+    mirror_dir, cache_dir = structure_mirror
+    structure = get_structure("1DUM")
+    assert [chain.id for chain in structure[0]]
+    assert len(list(cache_dir.glob("1DUM-*.cif"))) == 1
+
+    # The cache is read before the source, so the structure is still available offline
+    (mirror_dir / "1DUM.cif").unlink()
+    configure_cache(cache_dir=str(cache_dir), source=str(mirror_dir), offline=True)
+    assert (
+        fetch_structure_text("1DUM") == next(cache_dir.glob("1DUM-*.cif")).read_text()
+    )
+
+    # Structures that aren't cached fail fast in offline mode
+    with pytest.raises(ValueError) as excinfo:
+        get_structure("2DUM")
+    assert "offline mode" in str(excinfo.value)
+
+
+def test_structure_cache_eviction(tmp_path):
+    """Test that the least recently used structures are evicted from the cache."""
+    cache_dir = str(tmp_path)
+    write_cached_structure("1AAA", "A" * 600_000, cache_dir, max_size=1)
+    os.utime(next(tmp_path.glob("1AAA-*.cif")), (0, 0))
+    write_cached_structure("1BBB", "B" * 600_000, cache_dir, max_size=1)
+    assert read_cached_structure("1AAA", cache_dir) is None
+    assert read_cached_structure("1BBB", cache_dir) == "B" * 600_000
+
+
+def test_structure_cache_keeps_other_files(tmp_path):
+    """Test that files that aren't cache entries are never read or evicted."""
+    cache_dir = str(tmp_path)
+    for name in ["1AAA.cif", "1AAA-model.cif", "structure.cif"]:
+        (tmp_path / name).write_text("X" * 600_000)
+        os.utime(tmp_path / name, (0, 0))
+    assert read_cached_structure("1AAA", cache_dir) is None
+    write_cached_structure("1BBB", "B" * 600_000, cache_dir, max_size=1)
+    write_cached_structure("1CCC", "C" * 600_000, cache_dir, max_size=1)
+    assert read_cached_structure("1BBB", cache_dir) is None
+    cached_name = f"1CCC-{structure_cache._content_hash('C' * 600_000)}.cif"
+    assert {path.name for path in tmp_path.glob("*.cif")} == {
+        "1AAA.cif",
+        "1AAA-model.cif",
+        "structure.cif",
+        cached_name,
+    }
+
+
+@pytest.fixture
+def structure_server(monkeypatch):
+    """A local HTTP server standing in for the RCSB PDB.
+
+    It serves "{ID}.cif" for any ID, responds with 503 to the first `failures[ID]`
+    requests for an ID and waits `delay` seconds before responding.
+    """
+    monkeypatch.setattr(structure_cache, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(structure_cache, "_session", {"key": None, "session": None})
+    state = {"requests": [], "failures": {}, "delay": 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            pdb_id = os.path.basename(self.path)[: -len(".cif")]
+            state["requests"].append(pdb_id)
+            time.sleep(state["delay"])
+            if state["failures"].get(pdb_id, 0) > 0:
+                state["failures"][pdb_id] -= 1
+                self.send_response(503)
+                self.end_headers()
+                return
+            body = f"data_{pdb_id}\n".encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+    server.server_close()
+    configure_cache()
+
+
+def test_download_structure_retries(structure_server):
+    """Test that server errors are retried and that a slow server times out."""
+    url, state = structure_server
+    state["failures"]["1ABC"] = 2
+    assert download_structure("1ABC", url, retries=2) == "data_1ABC\n"
+    assert state["requests"] == ["1ABC"] * 3
+
+    state["failures"]["2ABC"] = 1
+    with pytest.raises(ValueError) as excinfo:
+        download_structure("2ABC", url, retries=0)
+    assert "Status code: 503" in str(excinfo.value)
+
+    state["delay"] = 1
+    with pytest.raises(ValueError) as excinfo:
+        download_structure("3ABC", url, timeout=0.1, retries=0)
+    assert "Failed to download 3ABC" in str(excinfo.value)
+
+
+def test_prefetch_structures(structure_server, tmp_path):
+    """Test that structures are downloaded into the cache at once."""
+    url, state = structure_server
+    pdb_ids = ["1ABC", "2ABC", "3ABC", "4ABC", "1abc"]
+    state["failures"]["4ABC"] = 10
+    configure_cache(cache_dir=str(tmp_path), source=url, retries=1)
+
+    # Every structure is requested at the same time
+    state["delay"] = 0.5
+    start = time.perf_counter()
+    errors = prefetch_structures(pdb_ids)
+    assert time.perf_counter() - start < 1.5
+
+    assert list(errors) == ["4ABC"]
+    assert sorted(state["requests"]) == ["1ABC", "2ABC", "3ABC", "4ABC", "4ABC"]
+    for pdb_id in ["1ABC", "2ABC", "3ABC"]:
+        assert read_cached_structure(pdb_id, str(tmp_path)) == f"data_{pdb_id}\n"
+
+    # Cached structures aren't downloaded again
+    state["requests"].clear()
+    assert prefetch_structures(["1ABC", "2ABC"]) == {}
+    assert state["requests"] == []
+
+
+def test_slim_pdb_text():
+    """Test that slimming a PDB file keeps every copy of a chain but drops hydrogens."""
+    with open("tests/SARS2-Mutation-Fitness/structures/E.pdb", "r") as f:
+        text = f.read()
+    atom_lines = [line for line in text.splitlines() if line.startswith("ATOM")]
+
+    heavy = slim_pdb_text(text, atoms="heavy").splitlines()
+    heavy_atoms = [line for line in heavy if line.startswith("ATOM")]
+    assert heavy_atoms == [line for line in atom_lines if line[76:78].strip() != "H"]
+    # The five copies of chain A are still separate
+    assert sum(line.startswith("TER") for line in heavy) == 5
+
+    backbone = slim_pdb_text(text, atoms="backbone")
+    names = {
+        line[12:16].strip() for line in backbone.splitlines() if line.startswith("ATOM")
+    }
+    assert names <= {"N", "CA", "C", "O"}
+    assert slim_pdb_text(text, excluded_chains="A") == "END\n"
+
+    with pytest.raises(ValueError):
+        slim_pdb_text(text, atoms="side chains")
+
+
+def test_slim_structure(dummy_data):
+    """Test that slimming a structure only keeps the chains that are shown."""
+    structure, _, _, _ = dummy_data
+    text = slim_structure(structure, "E", "A B", atoms="heavy")
+    slim = Bio.PDB.PDBParser(QUIET=True).get_structure("slim", StringIO(text))
+    assert sorted(chain.id for chain in slim[0]) == ["C", "D", "E"]
+    assert all(residue.id[0] == " " for residue in slim.get_residues())
+    assert all(atom.element != "H" for atom in slim.get_atoms())
+    assert text.startswith("ATOM")
+
+
+def test_slim_structure_of_pdb_id(structure_mirror):
+    """Test that a reduced copy of a PDB ID is embedded instead of the ID."""
+    experiment_dict = make_experiment_dictionary(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        structure="1DUM",
+        condition_col="condition",
+        included_chains="E",
+        excluded_chains="A",
+        check_pdb=False,
+        slim_atoms="backbone",
+    )
+    slim = Bio.PDB.PDBParser(QUIET=True).get_structure(
+        "slim", StringIO(experiment_dict["pdb"])
+    )
+    assert "A" not in [chain.id for chain in slim[0]]
+    assert {atom.get_id() for atom in slim.get_atoms()} <= {"N", "CA", "C", "O"}
+
+
+def test_get_polymer_chains():
+    """Test that polymer chains are found once and that other chains are ignored."""
+    text = (
+        "ATOM      1  CA  GLY A   1       0.000   0.000   0.000  1.00  0.00           C\n"
+        "HETATM    2  O   HOH W   1       1.000   0.000   0.000  1.00  0.00           O\n"
+        "ATOM      3  CA  ALA B   1       2.000   0.000   0.000  1.00  0.00           C\n"
+        "END\n"
+    )
+    structure = Bio.PDB.PDBParser(QUIET=True).get_structure("test", StringIO(text))
+    assert get_polymer_chains(structure) == ["A", "B"]
+    assert structure.xtra["polymer_chains"] == ["A", "B"]
+
+    # The polymer sentinel is always present but other chains are checked
+    check_chains(structure, ["polymer"])
+    with pytest.raises(ValueError):
+        check_chains(structure, ["polymer", "Z"])
+
+
+def test_make_experiment_dictionary_timings(tmp_path):
+    """Test that the stages of making an experiment are recorded in the timings."""
+    experiment_kwargs = dict(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        structure="tests/dummy-data/dummypdb.pdb",
+        condition_col="condition",
+        included_chains="E",
+    )
+    # Make sure the structure is parsed rather than reused from an earlier test
+    pdb_utils._load_structure.cache_clear()
+    timings = Timings()
+    experiment_dict = make_experiment_dictionary(**experiment_kwargs, timings=timings)
+    assert experiment_dict == make_experiment_dictionary(**experiment_kwargs)
+
+    stages = {record["stage"]: record for record in timings.stages}
+    assert list(stages) == [
+        "format mutation data",
+        "format sitemap data",
+        "load structure",
+        "read structure",
+        "parse structure",
+        "check chains",
+        "check wildtype residues",
+        "encode mutation data",
+    ]
+    assert stages["parse structure"]["depth"] == 1
+    assert stages["format mutation data"]["rows"] == len(
+        experiment_dict["mut_metric_df"]
+    )
+    assert all(record["seconds"] >= 0 for record in timings.stages)
+    # A stage's peak memory includes the stages inside of it
+    assert (
+        stages["load structure"]["peak_memory_mb"]
+        >= stages["parse structure"]["peak_memory_mb"]
+        > 0
+    )
+
+    timings.write(str(tmp_path / "profile.json"))
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert report["total_seconds"] >= stages["load structure"]["seconds"]
+    assert len(report["stages"]) == len(stages)
+    assert "parse structure" in timings.summary()
+
+
+def test_prepared_structure(structure_mirror, monkeypatch):
+    """Test that a prepared structure is parsed once and formats like its source."""
+    experiment_kwargs = dict(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        condition_col="condition",
+        included_chains="E",
+    )
+    path = "tests/dummy-data/dummypdb.pdb"
+    with open(path) as f:
+        text = f.read()
+    mirror_dir, _ = structure_mirror
+
+    prepared = {
+        "file": PreparedStructure.from_file(path),
+        "text": PreparedStructure.from_text(text),
+        "pdb_id": PreparedStructure.from_pdb_id("1DUM"),
+        "cif": PreparedStructure.from_text(
+            (mirror_dir / "1DUM.cif").read_text(), fmt="cif"
+        ),
+    }
+    expected = {
+        source: make_experiment_dictionary(
+            **experiment_kwargs, structure=path if source != "pdb_id" else "1DUM"
+        )
+        for source in ["file", "pdb_id"]
+    }
+
+    # Formatting against a prepared structure never parses it again
+    def parse_structure(*args):
+        raise AssertionError("The structure was parsed again.")
+
+    monkeypatch.setattr(pdb_utils, "_parse_structure", parse_structure)
+    for source, structure in prepared.items():
+        assert structure.polymer_chains == get_polymer_chains(structure)
+        assert list(structure.residue_index.columns) == [
+            "chain",
+            "protein_site",
+            "residue",
+        ]
+        experiment_dict = make_experiment_dictionary(
+            **experiment_kwargs, structure=structure
+        )
+        if source == "cif":
+            # mmCIF text is embedded as a PDB file
+            slim = Bio.PDB.PDBParser(QUIET=True).get_structure(
+                "cif", StringIO(experiment_dict.pop("pdb"))
+            )
+            assert [chain.id for chain in slim[0]] == [
+                chain.id for chain in structure.structure[0]
+            ]
+            experiment_dict["pdb"] = "1DUM"
+        same_as = "file" if source in {"file", "text"} else "pdb_id"
+        assert experiment_dict == expected[same_as]
+
+    # The checks accept prepared structures
+    check_chains(prepared["file"], ["E"])
+    with pytest.raises(ValueError):
+        check_chains(prepared["file"], ["Z"])
+    with pytest.raises(ValueError, match="valid PDB ID"):
+        PreparedStructure.from_pdb_id(path)
+
+
+def write_bcif(structure, path):
+    """Write the atoms of a structure to a minimal BinaryCIF file."""
+    import msgpack
+    import numpy as np
+
+    def column(name, values):
+        if isinstance(values[0], str):
+            unique = list(dict.fromkeys(values))
+            offsets = np.cumsum([0] + [len(value) for value in unique])
+            int_array = {"kind": "ByteArray", "type": 3}
+            encoding = {
+                "kind": "StringArray",
+                "dataEncoding": [int_array],
+                "stringData": "".join(unique),
+                "offsetEncoding": [int_array],
+                "offsets": offsets.astype("<i4").tobytes(),
+            }
+            data = np.array([unique.index(value) for value in values], "<i4")
+        else:
+            dtype, kind = ("<f8", 33) if isinstance(values[0], float) else ("<i4", 3)
+            encoding = {"kind": "ByteArray", "type": kind}
+            data = np.array(values, dtype)
+        return {
+            "name": name,
+            "data": {"data": data.tobytes(), "encoding": [encoding]},
+            "mask": None,
+        }
+
+    atoms = list(structure[0].get_atoms())
+    atom_site = {
+        "group_PDB": [
+            "ATOM" if atom.get_parent().id[0] == " " else "HETATM" for atom in atoms
+        ],
+        "id": list(range(1, len(atoms) + 1)),
+        "type_symbol": [atom.element for atom in atoms],
+        "label_atom_id": [atom.get_name() for atom in atoms],
+        "label_alt_id": ["" for atom in atoms],
+        "label_comp_id": [atom.get_parent().get_resname() for atom in atoms],
+        # The label chains differ from the author chains, and hetero residues have
+        # their own label chains, like in the structures from the RCSB PDB
+        "label_asym_id": [
+            f"L{atom.get_parent().get_parent().id}{atom.get_parent().id[0].strip()}"
+            for atom in atoms
+        ],
+        "auth_asym_id": [atom.get_parent().get_parent().id for atom in atoms],
+        "auth_seq_id": [atom.get_parent().id[1] for atom in atoms],
+        "pdbx_PDB_ins_code": [atom.get_parent().id[2].strip() for atom in atoms],
+        "Cartn_x": [float(atom.coord[0]) for atom in atoms],
+        "Cartn_y": [float(atom.coord[1]) for atom in atoms],
+        "Cartn_z": [float(atom.coord[2]) for atom in atoms],
+        "occupancy": [float(atom.get_occupancy()) for atom in atoms],
+        "B_iso_or_equiv": [float(atom.get_bfactor()) for atom in atoms],
+        "pdbx_PDB_model_num": [1 for atom in atoms],
+    }
+    categories = [
+        {"name": "_entry", "columns": [column("id", ["DUMMY"])], "rowCount": 1},
+        {
+            "name": "_atom_site",
+            "columns": [column(name, values) for name, values in atom_site.items()],
+            "rowCount": len(atoms),
+        },
+    ]
+    with open(path, "wb") as f:
+        data_block = {"header": "DUMMY", "categories": categories}
+        msgpack.pack({"version": "0.3.0", "dataBlocks": [data_block]}, f)
+
+
+def test_prepared_structure_without_text(dummy_data):
+    """Test that a prepared structure without its text is embedded as a PDB file."""
+    structure, sitemap_df, mut_metric_df, _ = dummy_data
+    prepared = PreparedStructure(structure, None)
+    experiment_kwargs = dict(
+        mut_metric_df=mut_metric_df,
+        metric_col="mut_escape",
+        sitemap_df=sitemap_df,
+        condition_col="condition",
+        included_chains="E",
+        structure=prepared,
+    )
+    for slim_atoms in [None, "backbone"]:
+        experiment_dict = make_experiment_dictionary(
+            **experiment_kwargs, slim_atoms=slim_atoms
+        )
+        assert experiment_dict["pdb"].startswith("ATOM")
+        embedded = Bio.PDB.PDBParser(QUIET=True).get_structure(
+            "embedded", StringIO(experiment_dict["pdb"])
+        )
+        assert "E" in [chain.id for chain in embedded[0]]
+
+
+def test_local_structure_formats(tmp_path):
+    """Test that gzipped, mmCIF, and BinaryCIF files are read and embedded as PDB text."""
+    path = "tests/dummy-data/dummypdb.pdb"
+    with open(path) as f:
+        text = f.read()
+    structure = Bio.PDB.PDBParser(QUIET=True).get_structure("dummy", path)
+
+    # Write the dummy structure in each of the formats
+    paths = {fmt: str(tmp_path / f"dummy.{fmt}") for fmt in ["pdb.gz", "cif", "cif.gz"]}
+    with gzip.open(paths["pdb.gz"], "wt") as f:
+        f.write(text)
+    io = Bio.PDB.MMCIFIO()
+    io.set_structure(structure)
+    io.save(paths["cif"])
+    with open(paths["cif"], "rb") as f_in, gzip.open(paths["cif.gz"], "wb") as f_out:
+        f_out.write(f_in.read())
+    if importlib.util.find_spec("msgpack") is not None:
+        paths["bcif"] = str(tmp_path / "dummy.bcif")
+        write_bcif(structure, paths["bcif"])
+
+    experiment_kwargs = dict(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        condition_col="condition",
+        included_chains="E",
+    )
+    expected = make_experiment_dictionary(**experiment_kwargs, structure=path)
+    for fmt, structure_path in paths.items():
+        assert get_structure_format(structure_path) == fmt.split(".")[0]
+        loaded = get_structure(structure_path)
+        assert get_residue_index(loaded).equals(get_residue_index(structure))
+
+        experiment_dict = make_experiment_dictionary(
+            **experiment_kwargs, structure=structure_path
+        )
+        if fmt == "pdb.gz":
+            # Gzipped PDB files are embedded as the decompressed text
+            assert experiment_dict == expected
+            continue
+        embedded = Bio.PDB.PDBParser(QUIET=True).get_structure(
+            "embedded", StringIO(experiment_dict.pop("pdb"))
+        )
+        assert get_residue_index(embedded).equals(get_residue_index(structure))
+        experiment_dict["pdb"] = expected["pdb"]
+        assert experiment_dict == expected
+
+    assert get_structure_format("structure.CIF.GZ") == "cif"
+    assert get_structure_format("structure.txt") is None
+    (tmp_path / "dummy.txt").write_text(text)
+    with pytest.raises(ValueError, match="Invalid input"):
+        get_structure(str(tmp_path / "dummy.txt"))
+
+
+def test_long_chain_ids_embedded_as_cif(tmp_path):
+    """Test that structures with chain IDs too long for PDB files are embedded as mmCIF."""
+    structure = Bio.PDB.PDBParser(QUIET=True).get_structure(
+        "dummy", "tests/dummy-data/dummypdb.pdb"
+    )
+    structure[0]["A"].id = "AA"
+    path = str(tmp_path / "dummy.cif")
+    io = Bio.PDB.MMCIFIO()
+    io.set_structure(structure)
+    io.save(path)
+
+    experiment_kwargs = dict(
+        mut_metric_df=pd.read_csv("tests/dummy-data/dummy.csv"),
+        metric_col="mut_escape",
+        sitemap_df=pd.read_csv("tests/dummy-data/dummymap.csv"),
+        condition_col="condition",
+        included_chains="E",
+        structure=path,
+    )
+    for slim_atoms in [None, "backbone"]:
+        experiment_dict = make_experiment_dictionary(
+            **experiment_kwargs, slim_atoms=slim_atoms
+        )
+        assert experiment_dict["pdb_format"] == "cif"
+        embedded = Bio.PDB.MMCIFParser(QUIET=True).get_structure(
+            "embedded", StringIO(experiment_dict["pdb"])
+        )
+        assert "AA" in [chain.id for chain in embedded[0]]
+        assert get_residue_index(embedded).equals(
+            get_residue_index(get_structure(path))
+        )
+
+    # Structures that fit the PDB format don't record it
+    structure[0]["AA"].id = "A"
+    io.save(path)
+    experiment_dict = make_experiment_dictionary(**experiment_kwargs)
+    assert "pdb_format" not in experiment_dict
+
+
+def test_slim_keeps_modified_residues():
+    """Test that modified residues in polymer chains are kept, but not waters or ligands."""
+    atoms = [
+        ("ATOM", "N", "GLY", "A", 1, "N"),
+        ("ATOM", "CA", "GLY", "A", 1, "C"),
+        ("ATOM", "C", "GLY", "A", 1, "C"),
+        ("ATOM", "O", "GLY", "A", 1, "O"),
+        ("HETATM", "N", "MSE", "A", 2, "N"),
+        ("HETATM", "CA", "MSE", "A", 2, "C"),
+        ("HETATM", "C", "MSE", "A", 2, "C"),
+        ("HETATM", "O", "MSE", "A", 2, "O"),
+        ("HETATM", "CB", "MSE", "A", 2, "C"),
+        ("HETATM", "SE", "MSE", "A", 2, "SE"),
+        ("ATOM", "N", "ALA", "A", 3, "N"),
+        ("ATOM", "CA", "ALA", "A", 3, "C"),
+        ("ATOM", "C", "ALA", "A", 3, "C"),
+        ("HETATM", "C1", "NAG", "A", 101, "C"),
+        ("HETATM", "N2", "NAG", "A", 101, "N"),
+        ("HETATM", "O", "HOH", "A", 201, "O"),
+    ]
+    text = (
+        "".join(
+            f"{record:<6}{serial:>5} {name if len(name) == 4 else ' ' + name:<4}"
+            f" {resname:>3} {chain}{resseq:>4}    {serial:>8.3f}{0:>8.3f}{0:>8.3f}"
+            f"{1:>6.2f}{0:>6.2f}          {element:>2}\n"
+            for serial, (record, name, resname, chain, resseq, element) in enumerate(
+                atoms, start=1
+            )
+        )
+        + "END\n"
+    )
+    structure = Bio.PDB.PDBParser(QUIET=True).get_structure("test", StringIO(text))
+
+    for slim_text in [slim_structure(structure, atoms="heavy"), slim_pdb_text(text)]:
+        slim = Bio.PDB.PDBParser(QUIET=True).get_structure("slim", StringIO(slim_text))
+        assert [residue.get_resname() for residue in slim.get_residues()] == [
+            "GLY",
+            "MSE",
+            "ALA",
+        ]
+        mse = [residue for residue in slim.get_residues() if residue.id[1] == 2][0]
+        assert "SE" in mse
+
+    backbone = slim_pdb_text(text, atoms="backbone")
+    assert {line[12:16].strip() for line in backbone.splitlines() if "MSE" in line} == {
+        "N",
+        "CA",
+        "C",
+        "O",
+    }